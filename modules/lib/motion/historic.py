@@ -4,6 +4,8 @@
 """ Manage the motion detection history file """
 import re
 import json
+import struct
+import random
 import uasyncio
 import tools.logger
 import tools.sdcard
@@ -11,16 +13,78 @@ import tools.tasking
 import tools.filesystem
 import tools.strings
 import tools.info
+import tools.date
+import motion.motionindex
+import motion.historicstore
+import motion.motionclip
+import motion.motionevent
+import motion.motionheatmap
+import motion.historicquery
+import motion.historicledger
+import motion.historictree
+import server.stream
 
 MAX_DAYS_DISPLAYED = 28
-MAX_DAYS_REMOVED   = 14
 MAX_MOTIONS        = 400
+MAX_MOTIONS_LARGE  = 4000
+THUMBNAIL_EXTENSION = ".thm"
+PAGE_ITEMS         = 32
+
+class HistoricItems:
+	""" Asynchronous iterator on the historic items, from the most recent to the older.
+	The items are read by pages under the lock, the lock is released while a page is sent,
+	the next page is searched after the key of the last item sent """
+	def __init__(self, since=None, day=None, limit=None):
+		""" Constructor (see Historic.get_items for parameters) """
+		self.since = since
+		self.day   = day
+		self.limit = limit
+		self.page  = []
+		self.key   = None
+		self.count = 0
+		self.end   = False
+
+	def __aiter__(self):
+		""" Return the iterator """
+		return self
+
+	async def __anext__(self):
+		""" Return the next item """
+		if len(self.page) == 0 and self.end is False:
+			await self.read_page()
+		if len(self.page) == 0:
+			raise StopAsyncIteration
+		return self.page.pop(0)
+
+	async def read_page(self):
+		""" Read the next page of items under the lock """
+		quantity = PAGE_ITEMS
+		if self.limit is not None:
+			quantity = min(quantity, self.limit - self.count)
+		try:
+			await Historic.acquire()
+			for position in Historic.store.positions(self.since, self.day, quantity, self.key):
+				self.page.append(Historic.store.get_item(position))
+				self.key = Historic.store.get_key(position)
+		finally:
+			await Historic.release()
+		self.count += len(self.page)
+		if len(self.page) < quantity or quantity <= 0:
+			self.end = True
 
 class Historic:
 	""" Manage the motion detection history file """
 	motion_in_progress  = [False]
-	historic = []
+	store = motion.historicstore.HistoricStore()
+	clip = [None]
+	heatmap = [None]
+	week = motion.motionheatmap.RollingHeatmap()
+	ledger = motion.historicledger.HistoricLedger()
+	max_size = [0]
+	max_days = [0]
 	first_extract = [False]
+	generation = [0]
+	instance = [random.getrandbits(24)]
 	lock = uasyncio.Lock()
 
 	@staticmethod
@@ -38,6 +102,12 @@ class Historic:
 		""" Indicates if historic is locked """
 		return Historic.lock.locked()
 
+	@staticmethod
+	def configure(max_size=0, max_days=0):
+		""" Configure the retention budget : maximal size in megabytes and maximal age in days of historic (0 = no limit) """
+		Historic.max_size[0] = max_size
+		Historic.max_days[0] = max_days
+
 	@staticmethod
 	def get_root():
 		""" Get the root path of sdcard and mount it """
@@ -46,24 +116,204 @@ class Historic:
 		return None
 
 	@staticmethod
-	async def add_motion(path, name, image, motion_info):
-		""" Add motion detection in the historic """
+	async def add_motion(path, name, image, motion_info, clip=False):
+		""" Add motion detection in the historic, if clip is True the image is added in the container of the motion event """
+		return (await Historic.add_motions([(path, name, image, motion_info, clip)]))[0]
+
+	@staticmethod
+	async def add_motions(motions):
+		""" Add several motion detections in the historic, the writes in the clip and in the day indexes are grouped.
+		motions : list of (path, name, image, motion_info, clip), return the list of results """
 		root = Historic.get_root()
-		result = False
+		results = [False]*len(motions)
 		if root:
 			try:
 				await Historic.acquire()
-				path = tools.strings.tostrings(path)
-				name = tools.strings.tostrings(name)
-				item = Historic.create_item(root + "/" + path + "/" + name +".json", motion_info)
-				res1 = tools.sdcard.SdCard.save(path, name + ".jpg" , image)
-				res2 = tools.sdcard.SdCard.save(path, name + ".json", json.dumps(item, separators=(',', ':')))
-				Historic.add_item(item)
-				result = res1 and res2
+				indexes = {}
+				for i in range(len(motions)):
+					path, name, image, motion_info, clip = motions[i]
+					try:
+						path = tools.strings.tostrings(path)
+						name = tools.strings.tostrings(name)
+						item = Historic.create_item(root + "/" + path + "/" + name +".json", motion_info)
+						motion_id = motion_info.get("motion_id",0)
+						buffer = motion.motionindex.MotionIndex.pack(path, name, item, motion_id, size=len(image))
+						directory = path
+						if clip and buffer is not None:
+							result = Historic.add_clip(root, path, name, image, buffer, motion_id)
+							size = len(image) + len(buffer)
+							if result:
+								# The clip is written in the directory of its first image
+								directory = Historic.clip[0].directory[len(root)+1:]
+						else:
+							content = json.dumps(item, separators=(',', ':'))
+							res1 = tools.sdcard.SdCard.save(path, name + ".jpg" , image)
+							res2 = tools.sdcard.SdCard.save(path, name + ".json", content)
+							result = res1 and res2
+							size = len(image) + len(content)
+						if result:
+							Historic.ledger.add(directory, size)
+							motion.historictree.HistoricTree.add(root, directory)
+						if buffer is not None:
+							if result:
+								(await Historic.get_day_heatmap(root, path[:10])).add(item[1], item[2], item[4], item[5], item[3])
+
+								# Group the records of each day index
+								index = indexes.get(path[:10], None)
+								if index is None:
+									indexes[path[:10]] = [path, bytearray(buffer)]
+								else:
+									index[1] += buffer
+							Historic.add_record(root, buffer)
+						results[i] = result
+					except Exception as err:
+						tools.logger.syslog(err)
+				Historic.commit_clip()
+				for path, records in indexes.values():
+					motion.motionindex.MotionIndex.append(root, path, records)
+				if Historic.heatmap[0] is not None:
+					Historic.heatmap[0].save(root)
 			except Exception as err:
 				tools.logger.syslog(err)
 			finally:
 				await Historic.release()
+		return results
+
+	@staticmethod
+	def add_clip(root, path, name, image, buffer, motion_id):
+		""" Add the image in the clip of the motion event, a new clip is created when the event changes """
+		result = False
+		clip = Historic.clip[0]
+		if clip is not None and clip.is_accepted(path, motion_id) is False:
+			Historic.close_clip(True)
+			clip = None
+		if tools.sdcard.SdCard.is_not_enough_space(low=True) is False:
+			if clip is None:
+				clip = motion.motionclip.MotionClip(root, path, name, motion_id)
+				Historic.clip[0] = clip
+			result = clip.add(image, buffer)
+		return result
+
+	@staticmethod
+	def commit_clip():
+		""" Write the trailing index of the clip after the images added """
+		if Historic.clip[0] is not None:
+			Historic.clip[0].commit()
+
+	@staticmethod
+	def close_clip(force=False):
+		""" Close the clip of the motion event if no image was added recently """
+		clip = Historic.clip[0]
+		if clip is not None and (force or clip.is_expired()):
+			clip.close()
+			Historic.clip[0] = None
+
+	@staticmethod
+	async def get_clip(filename):
+		""" Get the clip filename, offset and size of the image name, return None if the image is not in a clip.
+		The detections no longer in memory are searched in the day index """
+		result = None
+		info = motion.motionindex.MotionIndex.parse_name(tools.filesystem.split(filename)[1])
+		root = Historic.get_root()
+		if info is not None and root:
+			if not tools.filesystem.ismicropython():
+				root = root.lstrip("/")
+			timestamp = motion.motionindex.MotionIndex.get_timestamp(filename)
+			position = Historic.store.find(timestamp, info[6])
+			if position is not None:
+				motion_id, clip, offset, size = Historic.store.get_clip(position)
+			else:
+				motion_id, clip, offset, size = await Historic.find_clip(root, "%04d/%02d/%02d"%info[:3], timestamp, info[6])
+			if clip != 0:
+				result = motion.motionclip.MotionClip.get_filename(root, clip, motion_id), offset, size
+		return result
+
+	@staticmethod
+	async def find_clip(root, day, timestamp, index):
+		""" Search the detection in the day index, return the clip informations (motion_id, clip timestamp, jpeg offset, jpeg size),
+		the clip timestamp is 0 if the detection is not found or if it is a jpeg file """
+		result = [0, 0, 0, 0]
+		def search(buffer, offset):
+			""" Check the record of the day index """
+			fields = struct.unpack_from(motion.motionindex.INDEX_FIELDS, buffer, offset)
+			if fields[0] == timestamp and fields[9] == index:
+				result[0] = fields[10]
+				result[1:] = struct.unpack_from("<III", buffer, offset + motion.motionindex.INDEX_CLIP)
+				return False
+			return True
+		try:
+			await motion.motionindex.MotionIndex.read_backward(root, day, search)
+		except Exception as err:
+			tools.logger.syslog(err)
+		return result
+
+	@staticmethod
+	async def get_day_heatmap(root, day):
+		""" Get the heatmap of the day in memory, the heatmap of the previous day is saved """
+		heatmap = Historic.heatmap[0]
+		if heatmap is None or heatmap.day != day:
+			ended = heatmap
+			if ended is not None:
+				ended.save(root)
+			heatmap = await motion.motionheatmap.MotionHeatmap.get(root, day)
+			Historic.heatmap[0] = heatmap
+			if ended is not None:
+				await Historic.week.next_day(root, ended, day)
+		return heatmap
+
+	@staticmethod
+	async def get_heatmap(day, days=1):
+		""" Get the heatmap of the number of days ending at the day (YYYY-MM-DD or YYYY/MM/DD) """
+		result = None
+		root = Historic.get_root()
+		if root:
+			try:
+				await Historic.acquire()
+				day = tools.strings.tostrings(day).replace("-","/")
+				# The rolling week of the current day is taken from the running sum
+				if days == Historic.week.days and day == tools.strings.tostrings(tools.date.date_to_path())[:10]:
+					result = await Historic.week.get(root, await Historic.get_day_heatmap(root, day))
+				else:
+					result = await motion.motionheatmap.MotionHeatmap.accumulate(root, day, days, Historic.heatmap[0])
+			finally:
+				await Historic.release()
+		return result
+
+	@staticmethod
+	def get_thumbnail(filename, clip=None):
+		""" Get the thumbnail filename of the image, return None if the thumbnail not exists.
+		The thumbnail of an image in a clip is in the directory of the clip (see get_clip) """
+		thumbnail = tools.filesystem.splitext(filename)[0] + THUMBNAIL_EXTENSION
+		if clip is not None:
+			thumbnail = tools.filesystem.split(clip[0])[0] + "/" + tools.filesystem.split(thumbnail)[1]
+		if tools.filesystem.exists(thumbnail):
+			return thumbnail
+		return None
+
+	@staticmethod
+	async def add_event(event):
+		""" Save the motion event in the historic """
+		result = False
+		root = Historic.get_root()
+		if root:
+			try:
+				await Historic.acquire()
+				result = event.save(root)
+			finally:
+				await Historic.release()
+		return result
+
+	@staticmethod
+	async def get_events(day):
+		""" Get the motion events of the day (YYYY-MM-DD or YYYY/MM/DD) """
+		result = []
+		root = Historic.get_root()
+		if root:
+			try:
+				await Historic.acquire()
+				result = motion.motionevent.MotionEvent.read(root, tools.strings.tostrings(day).replace("-","/"))
+			finally:
+				await Historic.release()
 		return result
 
 	@staticmethod
@@ -77,60 +327,55 @@ class Historic:
 		return result
 
 	@staticmethod
-	def add_item(item):
-		""" Add item in the historic """
-		if item is not None:
-			if not tools.filesystem.ismicropython():
-				# Remove the "/" before filename
-				item [0] = item [0].lstrip("/")
-
-			# If the differences are in an old format
-			if type(item[3]) == type(""):
-				diffs = []
-				diff_val = 0
-				i = 0
-				for diff in item[3]:
-					if diff == "#":
-						diff_val |= 1
-
-					if (i %32 == 31):
-						diffs.append(diff_val)
-						diff_val = 0
-					else:
-						diff_val <<= 1
-					i += 1
-				diff_max = len(item[3])
-				diff_val <<= (31 - (diff_max%32))
-				diffs.append(diff_val)
-				item[3] = diffs
+	def add_record(root, buffer):
+		""" Add the record of motion index in the historic """
+		if not tools.filesystem.ismicropython():
+			# Remove the "/" before filename
+			root = root.lstrip("/")
+		Historic.store.set_root(root)
+		Historic.store.add_record(buffer)
+		Historic.changed()
 
-			# Add json file to the historic
-			Historic.historic.insert(0,item)
+	@staticmethod
+	def get_max_motions():
+		""" Return the maximal number of detections kept in memory """
+		if server.stream.Bufferedio.is_enough_memory():
+			return MAX_MOTIONS_LARGE
+		return MAX_MOTIONS
 
 	@staticmethod
-	async def build(motions):
-		""" Parse the all motions files to build historic """
+	def changed():
+		""" Indicates that the content of historic changed """
+		Historic.generation[0] += 1
+
+	@staticmethod
+	def get_etag():
+		""" Return the http entity tag of the current historic content """
+		return b'"%x-%x"'%(Historic.instance[0], Historic.generation[0])
+
+	@staticmethod
+	async def build(days):
+		""" Read the index of each day to build historic, the index is rebuilt from json files if it is missing or corrupted """
 		root = Historic.get_root()
 		if root:
 			try:
 				await Historic.acquire()
-				Historic.historic.clear()
-				last_day = ""
-				# For all motions
-				for motion in motions:
+				Historic.store.clear()
+				Historic.changed()
+
+				# Select the most recent days which can be kept in memory
+				selected = []
+				remaining = Historic.get_max_motions()
+				for day in days:
 					try:
-						# Parse json file
-						file = None
-						file = open(motion, "rb")
-						motion_item = json.load(file)
-						filename = motion_item[0]
-						if not tools.filesystem.ismicropython():
-							filename = filename.lstrip("/")
-						if tools.filesystem.exists(filename):
-							Historic.add_item(motion_item)
-						if last_day != motion_item[0][4:14]:
-							last_day = motion_item[0][4:14]
-							print("Build historic day %s"%last_day)
+						count = motion.motionindex.MotionIndex.count(root, day)
+						if count is None:
+							await motion.motionindex.MotionIndex.rebuild(root, day)
+							count = motion.motionindex.MotionIndex.count(root, day)
+						if count is not None:
+							# Skip the older detections of the day if too many
+							selected.insert(0, (day, count - remaining if count > remaining else 0))
+							remaining -= count
 					except OSError as err:
 						tools.logger.syslog(err)
 						# If sd card not responding properly
@@ -138,28 +383,69 @@ class Historic:
 							tools.info.increase_issues_counter()
 					except Exception as err:
 						tools.logger.syslog(err)
-					finally:
-						if file:
-							file.close()
-					if tools.filesystem.ismicropython():
-						await uasyncio.sleep_ms(2)
+					if remaining <= 0:
+						break
+
+				# Load the days from the older to the most recent
+				for day, skip in selected:
+					tools.logger.syslog("Build historic day %s"%day)
+					try:
+						await motion.motionindex.MotionIndex.read(root, day, lambda buffer: Historic.add_record(root, buffer), skip)
+					except Exception as err:
+						tools.logger.syslog(err)
 			except Exception as err:
 				tools.logger.syslog(err)
 			finally:
 				await Historic.release()
 
 	@staticmethod
-	async def get_json():
-		""" Read the historic from disk """
-		root = Historic.get_root()
+	async def get_json(since=None, day=None, limit=None):
+		""" Get the historic in json, from the most recent to the older (see get_items for parameters) """
 		result = b"[]"
+		try:
+			result = tools.strings.tobytes(json.dumps(await Historic.get_items(since, day, limit), separators=(',', ':')))
+		except Exception as err:
+			tools.logger.syslog(err)
+		return result
+
+	@staticmethod
+	async def get_items(since=None, day=None, limit=None):
+		""" Get the list of historic items [filename, width, height, diffs, squarex, squarey, timestamp], from the most recent to the older.
+		since : only the detections after this timestamp
+		day   : only the detections of this day (YYYY-MM-DD or YYYY/MM/DD)
+		limit : maximal number of detections returned """
+		root = Historic.get_root()
+		result = []
 		if root:
 			await Historic.reduce_history()
 			try:
 				await Historic.acquire()
-				Historic.historic.sort()
-				Historic.historic.reverse()
-				result = tools.strings.tobytes(json.dumps(Historic.historic, separators=(',', ':')))
+				result = list(Historic.store.select(since, day, limit))
+			except Exception as err:
+				tools.logger.syslog(err)
+			finally:
+				await Historic.release()
+		return result
+
+	@staticmethod
+	async def send_items(response, since=None, day=None, limit=None, headers=None):
+		""" Send the json list of historic items to the client web browser (see get_items for parameters).
+		The items are read by pages under the lock and sent with the lock released, the list is never built in memory """
+		if Historic.get_root():
+			await Historic.reduce_history()
+			await response.send_json(HistoricItems(since, day, limit), headers=headers)
+		else:
+			await response.send_json([], headers=headers)
+
+	@staticmethod
+	async def query(query):
+		""" Run the query (motion.historicquery.HistoricQuery) on the day indexes of sd card, see HistoricQuery.run for the result """
+		result = {"items":[], "next":None, "scanned":0}
+		root = Historic.get_root()
+		if root:
+			try:
+				await Historic.acquire()
+				result = await query.run(root)
 			except Exception as err:
 				tools.logger.syslog(err)
 			finally:
@@ -174,11 +460,11 @@ class Historic:
 			Historic.first_extract[0] = True
 			try:
 				tools.logger.syslog("Start historic creation")
-				# Scan sd card and get more recent motions
-				motions, lastdays = await Historic.scan_directories(MAX_DAYS_DISPLAYED, False)
+				# Scan sd card and get more recent days
+				lastdays = await Historic.scan_days(MAX_DAYS_DISPLAYED)
 
-				# Build historic file
-				files = await Historic.build(motions)
+				# Build historic with the index of days
+				await Historic.build(lastdays)
 				tools.logger.syslog("Historic contains :")
 				for day in lastdays:
 					tools.logger.syslog("   %s"%day)
@@ -209,6 +495,24 @@ class Historic:
 			result.reverse()
 		return result
 
+	@staticmethod
+	async def scan_days(max_days=10):
+		""" Get the list of most recent days (YYYY/MM/DD) in the sd card """
+		lastdays = []
+		root = Historic.get_root()
+		if root:
+			try:
+				await Historic.acquire()
+				for day in motion.historictree.HistoricTree.walk(root, 3):
+					if len(lastdays) >= max_days:
+						break
+					lastdays.append(day)
+			except Exception as err:
+				tools.logger.syslog(err)
+			finally:
+				await Historic.release()
+		return lastdays
+
 	@staticmethod
 	async def scan_directories(max_days=10, older=True):
 		""" Get the list of older or older directories in the sd card """
@@ -218,33 +522,22 @@ class Historic:
 		if root:
 			try:
 				await Historic.acquire()
-				years = await Historic.scan_dir(root, r"\d\d\d\d", older)
-				for year in years:
-					path_year = root + "/" + year
-					months = await Historic.scan_dir(path_year, r"\d\d", older)
-					for month in months:
-						path_month = path_year + "/" + month
-						days = await Historic.scan_dir(path_month, r"\d\d", older)
-						for day in days:
-							print("Scan  historic day %s/%s/%s"%(year, month, day))
-							path_day = path_month + "/" + day
-							hours = await Historic.scan_dir(path_day, r"\d\dh\d\d", older)
-							lastdays.append("%s/%s/%s"%(year, month, day))
-
-							for hour in hours:
-								path_hour = path_day + "/" + hour
-								if older:
-									extension = "jpg"
-								else:
-									extension = "json"
-								detections = await Historic.scan_dir(path_hour, r"\d\d.*\."+extension, older, directory=False)
-								for detection in detections:
-									if len(lastdays) > max_days or len(motions) > MAX_MOTIONS:
-										motions.sort()
-										if older is False:
-											motions.reverse()
-										return motions, lastdays
-									motions.append(path_hour + "/" + detection)
+				if older:
+					extension = "m?jpg"
+				else:
+					extension = "json"
+				for path_hour in motion.historictree.HistoricTree.walk(root, 4, older is False):
+					if len(lastdays) == 0 or lastdays[-1] != path_hour[:10]:
+						tools.logger.syslog("Scan  historic day %s"%path_hour[:10])
+						lastdays.append(path_hour[:10])
+					detections = await Historic.scan_dir(root + "/" + path_hour, r"\d\d.*\."+extension, older, directory=False)
+					for detection in detections:
+						if len(lastdays) > max_days or len(motions) > MAX_MOTIONS:
+							motions.sort()
+							if older is False:
+								motions.reverse()
+							return motions, lastdays
+						motions.append(root + "/" + path_hour + "/" + detection)
 				motions.sort()
 				if older is False:
 					motions.reverse()
@@ -261,11 +554,8 @@ class Historic:
 
 	@staticmethod
 	async def remove_files(directory, simulate=False, force=False):
-		""" Remove all files in the directory """
+		""" Remove the directory with all its files """
 		import shell.commands
-		dir_not_empty = False
-		enough_space = False
-		force = True
 		if tools.filesystem.exists(directory):
 			files_to_remove = []
 			dirs_to_remove  = []
@@ -279,21 +569,15 @@ class Historic:
 					files_to_remove.append(directory + "/" + filename)
 				else:
 					dirs_to_remove.append(directory + "/" + filename)
-				dir_not_empty = True
 
 			for file_to_remove in files_to_remove:
 				shell.commands.rmfile(file_to_remove, simulate=simulate, force=force)
-				if tools.sdcard.SdCard.is_not_enough_space(low=False) is False:
-					enough_space = True
-					break
-
-			if enough_space is False:
-				for dir_to_remove in dirs_to_remove:
-					await Historic.remove_files(dir_to_remove, simulate=simulate, force=force)
-				if dir_not_empty:
-					shell.commands.rm(directory, recursive=True, simulate=simulate, force=force)
-				else:
-					shell.commands.rmdir(directory, recursive=True, simulate=simulate, force=force)
+
+			for dir_to_remove in dirs_to_remove:
+				await Historic.remove_files(dir_to_remove, simulate=simulate, force=force)
+			shell.commands.rmdir(directory, simulate=simulate, force=force)
+			if tools.filesystem.ismicropython():
+				await uasyncio.sleep_ms(3)
 
 	@staticmethod
 	async def reduce_history():
@@ -301,9 +585,10 @@ class Historic:
 		try:
 			await Historic.acquire()
 
-			if len(Historic.historic) > MAX_MOTIONS:
-				while len(Historic.historic) > MAX_MOTIONS:
-					del Historic.historic[-1]
+			max_motions = Historic.get_max_motions()
+			if Historic.store.count() > max_motions:
+				Historic.store.remove_older(Historic.store.count() - max_motions)
+				Historic.changed()
 
 		finally:
 			await Historic.release()
@@ -314,42 +599,83 @@ class Historic:
 		last_days = set()
 		try:
 			await Historic.acquire()
-			for item in Historic.historic:
-				filename = item[0].lstrip("/").split("/")
-				path = b"%s/%s/%s"%(tools.strings.tobytes(filename[1]),tools.strings.tobytes(filename[2]),tools.strings.tobytes(filename[3]))
-				last_days.add(path)
+			for day in Historic.store.get_days():
+				last_days.add(tools.strings.tobytes(day))
 		finally:
 			await Historic.release()
 		return last_days
 
+	@staticmethod
+	async def get_ledger(root):
+		""" Get the retention ledger, it is created with the content of sd card the first time """
+		if Historic.ledger.loaded is False:
+			if Historic.ledger.load(root) is False:
+				await Historic.ledger.rebuild(root)
+		return Historic.ledger
+
+	@staticmethod
+	def save_ledger():
+		""" Save the retention ledger if modified """
+		root = Historic.get_root()
+		if root and Historic.ledger.loaded:
+			Historic.ledger.save(root)
+
 	@staticmethod
 	async def remove_older(force=False):
-		""" Remove older files to make space """
+		""" Remove the older directories to respect the retention budget or to make space """
+		import shell.commands
 		root = Historic.get_root()
 		if root:
 			await Historic.reduce_history()
-
-			# If not enough space available on sdcard
-			if tools.sdcard.SdCard.is_not_enough_space(low=True) or force:
-				tools.logger.syslog("Start cleanup historic")
-				Historic.first_extract[0] = False
-				olders, lastdays = await Historic.scan_directories(MAX_DAYS_REMOVED, True)
-				previous = ""
-
-				for motion in olders:
-					try:
-						await Historic.acquire()
-						directory = tools.filesystem.split(motion)[0]
-						if previous != directory:
-							await Historic.remove_files(directory, simulate=False, force=force)
-							previous = directory
-					except Exception as err:
-						tools.logger.syslog(err)
-					finally:
-						await Historic.release()
-					if tools.sdcard.SdCard.is_not_enough_space(low=False) is False:
-						break
-				tools.logger.syslog("End cleanup historic : %s"%(tools.strings.tostrings(tools.info.flashinfo(mountpoint=tools.sdcard.SdCard.get_mountpoint()))))
+			try:
+				await Historic.acquire()
+				ledger = await Historic.get_ledger(root)
+
+				# If not enough space available on sdcard, free up to the high threshold
+				needed = 0
+				if tools.sdcard.SdCard.is_not_enough_space(low=True) or force:
+					needed = max(1, tools.sdcard.SdCard.get_missing_space(low=False))
+				olders = ledger.plan(Historic.max_size[0]*1024*1024, Historic.max_days[0], needed)
+
+				if len(olders) > 0:
+					tools.logger.syslog("Start cleanup historic : %d directories"%len(olders))
+					Historic.first_extract[0] = False
+					days = []
+					for older in olders:
+						try:
+							await Historic.remove_files(root + "/" + older, simulate=False, force=True)
+						except Exception as err:
+							tools.logger.syslog(err)
+						ledger.remove(older)
+						motion.historictree.HistoricTree.remove(root, older)
+						if older[:10] not in days:
+							days.append(older[:10])
+
+					for day in days:
+						try:
+							if ledger.has_day(day):
+								# The day index references removed files, it will be rebuilt
+								motion.motionindex.MotionIndex.remove(root, day)
+							else:
+								# Remove the day with its index, heatmap and events
+								await Historic.remove_files(root + "/" + day, simulate=False, force=True)
+								motion.historictree.HistoricTree.remove(root, day)
+								# Remove the month and the year if empty
+								shell.commands.rmdir(root + "/" + day[:7], root=root, recursive=True, force=True, quiet=True, ignore_error=True)
+								for directory in [day[:7], day[:4]]:
+									if tools.filesystem.exists(root + "/" + directory) is False:
+										motion.historictree.HistoricTree.remove(root, directory)
+								if Historic.heatmap[0] is not None and Historic.heatmap[0].day == day:
+									Historic.heatmap[0] = None
+								Historic.week.invalidate()
+						except Exception as err:
+							tools.logger.syslog(err)
+					ledger.save(root)
+					tools.logger.syslog("End cleanup historic : %s"%(tools.strings.tostrings(tools.info.flashinfo(mountpoint=tools.sdcard.SdCard.get_mountpoint()))))
+			except Exception as err:
+				tools.logger.syslog(err)
+			finally:
+				await Historic.release()
 
 	@staticmethod
 	async def task():
@@ -360,11 +686,13 @@ class Historic:
 			await tools.tasking.Tasks.wait_resume(duration=1000, name="historic")
 
 		if Historic.motion_in_progress[0] is False:
+			Historic.close_clip()
 			if tools.sdcard.SdCard.is_mounted() is False:
 				Historic.get_root()
 			if tools.sdcard.SdCard.is_mounted():
 				await Historic.remove_older()
 				await Historic.extract()
+				Historic.save_ledger()
 		return True
 
 	@staticmethod
@@ -0,0 +1,206 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Retention ledger of the motion historic.
+The ledger keeps the number of bytes used by each hour directory of the sd card (YYYY/MM/DD/HHhMM),
+it is updated at each save and at each removal, and saved in a small binary file at the root of the sd card.
+The cleanup plans the removal of the oldest whole directories according to the size and age budgets,
+without walking the sd card. The sd card is walked only once, to create the ledger if it not exists. """
+import struct
+import array
+import uasyncio
+import tools.logger
+import tools.filesystem
+import tools.strings
+import tools.date
+
+LEDGER_FILENAME = "historic.ldg"
+LEDGER_MAGIC    = b"MLDG"
+LEDGER_VERSION  = 1
+# magic, version, directories count
+LEDGER_HEADER   = "<4sHI"
+
+class HistoricLedger:
+	""" Bytes used by each hour directory of the historic, sorted from the older to the most recent """
+	header_size = struct.calcsize(LEDGER_HEADER)
+	def __init__(self):
+		""" Constructor """
+		self.clear()
+
+	def clear(self):
+		""" Remove all directories """
+		self.keys     = array.array("I")
+		self.sizes    = array.array("I")
+		self.used     = 0
+		self.loaded   = False
+		self.modified = False
+
+	def __len__(self):
+		""" Return the number of directories """
+		return len(self.keys)
+
+	@staticmethod
+	def get_key(path):
+		""" Get the sortable key of hour directory (YYYY/MM/DD/HHhMM), return None if the path is not an hour directory """
+		path = tools.strings.tostrings(path)
+		try:
+			if len(path) == 16 and path[4] == "/" and path[7] == "/" and path[10] == "/" and path[13] == "h":
+				year, month, day, hour, minute = int(path[0:4]), int(path[5:7]), int(path[8:10]), int(path[11:13]), int(path[14:16])
+				return (((year - 2000)*12 + month - 1)*31 + day - 1)*1440 + hour*60 + minute
+		except ValueError:
+			pass
+		return None
+
+	@staticmethod
+	def get_path(key):
+		""" Get the hour directory of the key """
+		minutes = key % 1440
+		days    = key // 1440
+		return "%04d/%02d/%02d/%02dh%02d"%(days // 372 + 2000, (days // 31) % 12 + 1, days % 31 + 1, minutes // 60, minutes % 60)
+
+	def find(self, key):
+		""" Return the position of the key, or the position where it must be inserted """
+		low = 0
+		high = len(self.keys)
+		while low < high:
+			middle = (low + high) // 2
+			if self.keys[middle] < key:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def add(self, path, size):
+		""" Add the bytes written in the hour directory """
+		key = HistoricLedger.get_key(path[:16])
+		if key is not None and size > 0:
+			position = self.find(key)
+			if position < len(self.keys) and self.keys[position] == key:
+				self.sizes[position] += size
+			elif position == len(self.keys):
+				# Most of time the directory is the most recent
+				self.keys .append(key)
+				self.sizes.append(size)
+			else:
+				self.keys  = self.keys [:position] + array.array("I", [key])  + self.keys [position:]
+				self.sizes = self.sizes[:position] + array.array("I", [size]) + self.sizes[position:]
+			self.used += size
+			self.modified = True
+
+	def remove(self, path):
+		""" Remove the hour directory of the ledger """
+		key = HistoricLedger.get_key(path)
+		if key is not None:
+			position = self.find(key)
+			if position < len(self.keys) and self.keys[position] == key:
+				self.used -= self.sizes[position]
+				self.keys  = self.keys [:position] + self.keys [position+1:]
+				self.sizes = self.sizes[:position] + self.sizes[position+1:]
+				self.modified = True
+
+	def get_used(self):
+		""" Return the total of bytes used by the historic """
+		return self.used
+
+	def has_day(self, day):
+		""" Indicates if the ledger contains hour directories of the day (YYYY/MM/DD) """
+		position = self.find(HistoricLedger.get_key(day + "/00h00"))
+		return position < len(self.keys) and HistoricLedger.get_path(self.keys[position])[:10] == day
+
+	def plan(self, max_size=0, max_days=0, needed=0, now=None):
+		""" Plan the removal of the oldest hour directories, return their paths from the older to the most recent.
+		max_size : maximal bytes used by the historic (0 = no limit)
+		max_days : maximal age in days of directories (0 = no limit)
+		needed   : bytes to free to get enough space on sd card
+		The most recent directory is never removed, it could be in use """
+		result = []
+		oldest = -1
+		if max_days > 0:
+			oldest = HistoricLedger.get_key(tools.strings.tostrings(tools.date.date_to_path(now))[:10] + "/00h00")
+			oldest -= (max_days - 1) * 1440
+		freed = 0
+		for position in range(len(self.keys) - 1):
+			if self.keys[position] < oldest or freed < needed or (max_size > 0 and self.used - freed > max_size):
+				result.append(HistoricLedger.get_path(self.keys[position]))
+				freed += self.sizes[position]
+			else:
+				break
+		return result
+
+	@staticmethod
+	def get_filename(root):
+		""" Get the ledger filename """
+		return root + "/" + LEDGER_FILENAME
+
+	def save(self, root):
+		""" Save the ledger if modified """
+		result = True
+		if self.modified:
+			result = False
+			filename = HistoricLedger.get_filename(root)
+			try:
+				with open(filename, "wb") as file:
+					file.write(struct.pack(LEDGER_HEADER, LEDGER_MAGIC, LEDGER_VERSION, len(self.keys)))
+					file.write(self.keys)
+					file.write(self.sizes)
+				self.modified = False
+				result = True
+			except Exception as err:
+				tools.logger.syslog(err, "Cannot save ledger %s"%filename)
+		return result
+
+	def load(self, root):
+		""" Load the ledger, return False if it not exists or not usable """
+		self.clear()
+		filename = HistoricLedger.get_filename(root)
+		try:
+			if tools.filesystem.exists(filename):
+				with open(filename, "rb") as file:
+					magic, version, count = struct.unpack(LEDGER_HEADER, file.read(HistoricLedger.header_size))
+					if magic == LEDGER_MAGIC and version == LEDGER_VERSION:
+						self.keys  = array.array("I", [0]*count)
+						self.sizes = array.array("I", [0]*count)
+						if file.readinto(self.keys) == count*4 and file.readinto(self.sizes) == count*4:
+							self.used = sum(self.sizes)
+							self.loaded = True
+				if self.loaded is False:
+					tools.logger.syslog("Bad ledger %s"%filename)
+					self.clear()
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot load ledger %s"%filename)
+			self.clear()
+		return self.loaded
+
+	@staticmethod
+	def list_directory(path, length, directory=True):
+		""" List the directories with name of the length, or the files with their sizes """
+		result = []
+		try:
+			for fileinfo in tools.filesystem.list_directory(path):
+				if directory:
+					if fileinfo[1] & 0xF000 == 0x4000 and len(fileinfo[0]) == length:
+						result.append(fileinfo[0])
+				elif fileinfo[1] & 0xF000 != 0x4000:
+					result.append(fileinfo[3] if len(fileinfo) > 3 else 0)
+		except OSError:
+			pass
+		result.sort()
+		return result
+
+	async def rebuild(self, root):
+		""" Create the ledger with the size of files in each hour directory of the sd card """
+		tools.logger.syslog("Start historic ledger creation")
+		self.clear()
+		for year in HistoricLedger.list_directory(root, 4):
+			for month in HistoricLedger.list_directory(root + "/" + year, 2):
+				for day in HistoricLedger.list_directory(root + "/" + year + "/" + month, 2):
+					path_day = year + "/" + month + "/" + day
+					for hour in HistoricLedger.list_directory(root + "/" + path_day, 5):
+						size = sum(HistoricLedger.list_directory(root + "/" + path_day + "/" + hour, 0, False))
+						self.add(path_day + "/" + hour, size if size > 0 else 1)
+					if tools.filesystem.ismicropython():
+						await uasyncio.sleep_ms(3)
+		self.loaded = True
+		self.modified = True
+		self.save(root)
+		tools.logger.syslog("End   historic ledger creation : %d directories, %d bytes"%(len(self.keys), self.used))
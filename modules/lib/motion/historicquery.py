@@ -0,0 +1,140 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Query of the motion detections saved on the sd card.
+The detections are searched in the day indexes, from the most recent to the older, without reading the json or jpeg files.
+They can be filtered by time range, minimal number of differences, zone of squares and motion identifier.
+The results are returned by pages, the cursor of the next page is the timestamp and the index of the last detection returned. """
+import struct
+import tools.filesystem
+import tools.strings
+import tools.date
+import motion.motionindex
+import motion.historictree
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT     = 200
+
+class HistoricQuery:
+	""" Query of motion detections """
+	def __init__(self, start=None, end=None, min_diffs=0, zone=None, zone_min=1, motion_id=None, before=None, limit=DEFAULT_LIMIT):
+		""" Constructor
+		start     : only the detections at or after this timestamp
+		end       : only the detections at or before this timestamp
+		min_diffs : minimal number of squares changed
+		zone      : list of 32 bits words with the squares of zone (same format as the differences), the first square in the most significant bit
+		zone_min  : minimal number of squares changed in the zone
+		motion_id : only the detections of this motion event
+		before    : cursor of page "timestamp-index", only the detections older than this cursor
+		limit     : maximal number of detections returned """
+		self.start     = start
+		self.end       = end
+		self.min_diffs = min_diffs
+		self.zone      = zone
+		self.zone_min  = zone_min
+		self.motion_id = motion_id
+		self.before    = None
+		if before:
+			timestamp, index = tools.strings.tostrings(before).split("-")
+			self.before = (int(timestamp), int(index))
+		if limit is None or limit <= 0 or limit > MAX_LIMIT:
+			limit = MAX_LIMIT if limit else DEFAULT_LIMIT
+		self.limit     = limit
+		self.root      = ""
+		self.items     = []
+		self.last      = None
+		self.scanned   = 0
+		self.completed = False
+
+	@staticmethod
+	def count_bits(value):
+		""" Return the number of bits set """
+		result = 0
+		while value:
+			value &= value - 1
+			result += 1
+		return result
+
+	def in_zone(self, buffer, offset, words):
+		""" Indicates if enough squares changed in the zone """
+		count = 0
+		diffs = struct.unpack_from("<%dI"%words, buffer, offset + motion.motionindex.INDEX_DIFFS)
+		for i in range(min(words, len(self.zone))):
+			count += HistoricQuery.count_bits(diffs[i] & self.zone[i])
+		return count >= self.zone_min
+
+	def select(self, buffer, offset):
+		""" Select the detection if it matches, return False to stop the reading of day """
+		timestamp, _, month, day, hour, minute, second, dir_hour, dir_minute, index, motion_id, count, width, height, squarex, squarey, words = \
+			struct.unpack_from(motion.motionindex.INDEX_FIELDS, buffer, offset)
+		self.scanned += 1
+		if self.start is not None and timestamp < self.start:
+			# All the next detections of day are older
+			self.completed = True
+			return False
+		if self.end is not None and timestamp > self.end:
+			return True
+		if self.before is not None and (timestamp, index) >= self.before:
+			return True
+		if count < self.min_diffs:
+			return True
+		if self.motion_id is not None and motion_id != self.motion_id:
+			return True
+		if self.zone is not None and self.in_zone(buffer, offset, words) is False:
+			return True
+		year = buffer[offset + 4] + 2000
+		name = "%s/%04d/%02d/%02d/%02dh%02d/%04d-%02d-%02d_%02d-%02d-%02d Id=%d D=%d.jpg"%(self.root, year, month, day, dir_hour, dir_minute, year, month, day, hour, minute, second, index, count)
+		diffs = list(struct.unpack_from("<%dI"%words, buffer, offset + motion.motionindex.INDEX_DIFFS))
+		self.items.append([name, width, height, diffs, squarex, squarey, timestamp, motion_id, count])
+		self.last = (timestamp, index)
+		if len(self.items) >= self.limit:
+			return False
+		return True
+
+	def get_days(self, root):
+		""" Return the days (YYYY/MM/DD) of sd card in the time range, from the most recent to the older """
+		first = ""
+		last  = "9999/99/99"
+		if self.start is not None:
+			first = tools.strings.tostrings(tools.date.date_to_path(self.start))[:10]
+		end = self.end
+		if self.before is not None and (end is None or self.before[0] < end):
+			end = self.before[0]
+		if end is not None:
+			last = tools.strings.tostrings(tools.date.date_to_path(end))[:10]
+		result = []
+		for day in motion.historictree.HistoricTree.walk(root, 3):
+			if day < first:
+				break
+			if day <= last:
+				result.append(day)
+		return result
+
+	async def run(self, root):
+		""" Run the query on the day indexes of sd card.
+		Return {"items":[[filename, width, height, diffs, squarex, squarey, timestamp, motion_id, count],...], "next":cursor, "scanned":count} """
+		self.root = root
+		if not tools.filesystem.ismicropython():
+			# Remove the "/" before filename
+			self.root = root.lstrip("/")
+		self.items = []
+		self.scanned = 0
+		self.completed = False
+		for day in self.get_days(root):
+			if motion.motionindex.MotionIndex.count(root, day) is None:
+				await motion.motionindex.MotionIndex.rebuild(root, day)
+			await motion.motionindex.MotionIndex.read_backward(root, day, self.select)
+			if self.completed or len(self.items) >= self.limit:
+				break
+		next_page = None
+		if len(self.items) >= self.limit:
+			next_page = "%d-%d"%self.last
+		return {"items":self.items, "next":next_page, "scanned":self.scanned}
+
+	@staticmethod
+	def parse_zone(zone):
+		""" Parse the zone given as hexadecimal 32 bits words separated by commas """
+		result = None
+		if zone:
+			result = [int(word, 16) for word in tools.strings.tostrings(zone).split(",")]
+		return result
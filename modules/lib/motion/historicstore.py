@@ -0,0 +1,182 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Compact in memory store of the motion historic.
+Each detection is a fixed size record in a bytearray, the days are interned and the difference bitmaps
+of all detections are stored in a shared array. This allows several thousand detections in the memory
+previously used by a few hundred lists of strings. The records are kept sorted from the older to the most recent. """
+import struct
+import array
+import tools.strings
+import motion.motionindex
+
+# timestamp, day id, directory hour, directory minute, hour, minute, second, index, motion_id,
+# diff count, width, height, squarex, squarey, diffs offset, diffs words, clip timestamp, jpeg offset and size in clip
+STORE_RECORD   = "<IHBBBBBIIHHHBBIBIII"
+STORE_INDEX    = 11
+STORE_DIFFS    = 27
+STORE_DAY      = 4
+
+class HistoricStore:
+	""" Compact in memory store of motion detections """
+	def __init__(self):
+		""" Constructor """
+		self.record_size = struct.calcsize(STORE_RECORD)
+		self.root = ""
+		self.clear()
+
+	def clear(self):
+		""" Remove all detections """
+		self.records    = bytearray()
+		self.diffs      = array.array("I")
+		self.diff_base  = 0
+		self.days       = []
+		self.day_ids    = {}
+		self.day_counts = []
+		self.length     = 0
+
+	def count(self):
+		""" Return the number of detections """
+		return self.length
+
+	def set_root(self, root):
+		""" Set the root path of all detections """
+		self.root = root
+
+	def get_day_id(self, day):
+		""" Get the interned identifier of the day (YYYY/MM/DD) """
+		day_id = self.day_ids.get(day, None)
+		if day_id is None:
+			day_id = len(self.days)
+			self.day_ids[day] = day_id
+			self.days.append(day)
+			self.day_counts.append(0)
+		return day_id
+
+	def get_key(self, position):
+		""" Get the sort key of the record (timestamp, index) """
+		offset = position * self.record_size
+		return struct.unpack_from("<I", self.records, offset)[0], struct.unpack_from("<I", self.records, offset + STORE_INDEX)[0]
+
+	def search(self, key):
+		""" Search the position after the last record lower or equal to the key (timestamp, index) """
+		low, high = 0, self.length
+		while low < high:
+			middle = (low + high) // 2
+			if self.get_key(middle) > key:
+				high = middle
+			else:
+				low = middle + 1
+		return low
+
+	def find(self, timestamp, index):
+		""" Find the position of detection, return None if not found """
+		position = self.search((timestamp, index)) - 1
+		if position >= 0 and self.get_key(position) == (timestamp, index):
+			return position
+		return None
+
+	def add_record(self, buffer):
+		""" Add a detection with the record of motion index """
+		timestamp, year, month, day, hour, minute, second, dir_hour, dir_minute, index, motion_id, count, width, height, squarex, squarey, words = \
+			struct.unpack_from(motion.motionindex.INDEX_FIELDS, buffer, 0)
+		clip, clip_offset, clip_size = struct.unpack_from("<III", buffer, motion.motionindex.INDEX_CLIP)
+		day_id = self.get_day_id("%04d/%02d/%02d"%(year + 2000, month, day))
+		diffs_offset = self.diff_base + len(self.diffs)
+		self.diffs.extend(struct.unpack_from("<%dI"%words, buffer, motion.motionindex.INDEX_DIFFS))
+		record = struct.pack(STORE_RECORD, timestamp, day_id, dir_hour, dir_minute, hour, minute, second, index, motion_id,
+			count, width, height, squarex, squarey, diffs_offset, words, clip, clip_offset, clip_size)
+
+		# Search the position of the record, usually the most recent
+		key = (timestamp, index)
+		position = self.length
+		if self.length > 0 and self.get_key(self.length - 1) > key:
+			position = self.search(key)
+
+		if position == self.length:
+			self.records += record
+		else:
+			offset = position * self.record_size
+			self.records = self.records[:offset] + record + self.records[offset:]
+		self.day_counts[day_id] += 1
+		self.length += 1
+
+	def remove_older(self, quantity):
+		""" Remove the older detections """
+		if quantity > self.length:
+			quantity = self.length
+		if quantity > 0:
+			for position in range(quantity):
+				self.day_counts[struct.unpack_from("<H", self.records, position * self.record_size + STORE_DAY)[0]] -= 1
+			self.records = self.records[quantity * self.record_size:]
+			self.length -= quantity
+
+			# Release the differences no longer used
+			if self.length == 0:
+				self.diff_base += len(self.diffs)
+				self.diffs = array.array("I")
+			else:
+				first = self.diff_base + len(self.diffs)
+				for position in range(self.length):
+					offset = struct.unpack_from("<I", self.records, position * self.record_size + STORE_DIFFS)[0]
+					if offset < first:
+						first = offset
+				self.diffs = self.diffs[first - self.diff_base:]
+				self.diff_base = first
+
+	def get_timestamp(self, position):
+		""" Get the timestamp of the detection """
+		return struct.unpack_from("<I", self.records, position * self.record_size)[0]
+
+	def get_item(self, position):
+		""" Get the historic item [filename, width, height, diffs, squarex, squarey, timestamp] of the detection """
+		timestamp, day_id, dir_hour, dir_minute, hour, minute, second, index, motion_id, count, width, height, squarex, squarey, diffs_offset, words, _, _, _ = \
+			struct.unpack_from(STORE_RECORD, self.records, position * self.record_size)
+		day = self.days[day_id]
+		name = "%s/%s/%02dh%02d/%s_%02d-%02d-%02d Id=%d D=%d.jpg"%(self.root, day, dir_hour, dir_minute, day.replace("/","-"), hour, minute, second, index, count)
+		diffs_offset -= self.diff_base
+		return [name, width, height, list(self.diffs[diffs_offset:diffs_offset+words]), squarex, squarey, timestamp]
+
+	def get_clip(self, position):
+		""" Get the clip informations of the detection (motion_id, clip timestamp, jpeg offset, jpeg size), the clip timestamp is 0 for a jpeg file """
+		record = struct.unpack_from(STORE_RECORD, self.records, position * self.record_size)
+		return record[8], record[16], record[17], record[18]
+
+	def select(self, since=None, day=None, limit=None):
+		""" Generator of the detections from the most recent to the older, the items are built one by one.
+		since : only the detections after this timestamp
+		day   : only the detections of this day (YYYY-MM-DD or YYYY/MM/DD)
+		limit : maximal number of detections returned """
+		for position in self.positions(since, day, limit):
+			yield self.get_item(position)
+
+	def positions(self, since=None, day=None, limit=None, before=None):
+		""" Generator of the positions of detections from the most recent to the older (see select for parameters).
+		before : only the detections before this key (timestamp, index) """
+		count = 0
+		day_id = None
+		if day is not None:
+			day_id = self.day_ids.get(tools.strings.tostrings(day).replace("-","/"), -1)
+		position = self.length - 1
+		if before is not None:
+			position = self.search(before) - 1
+			if position >= 0 and self.get_key(position) == before:
+				position -= 1
+		while position >= 0:
+			if limit is not None and count >= limit:
+				break
+			if since is not None and self.get_timestamp(position) <= since:
+				# The next detections are older
+				break
+			if day_id is None or struct.unpack_from("<H", self.records, position * self.record_size + STORE_DAY)[0] == day_id:
+				count += 1
+				yield position
+			position -= 1
+
+	def get_days(self):
+		""" Return the list of days (YYYY/MM/DD) containing detections """
+		result = []
+		for day_id in range(len(self.days)):
+			if self.day_counts[day_id] > 0:
+				result.append(self.days[day_id])
+		return result
@@ -0,0 +1,145 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Cache of the directory tree of the motion historic (YYYY/MM/DD/HHhMM).
+Each directory listed is kept with its modification time and the names of its sub directories,
+the names have a fixed length for each level, they are stored sorted in a single bytes object.
+The cache is updated when the historic creates a directory and invalidated when it removes one,
+so the sd card is listed only once per directory. The walker yields the paths without building lists. """
+import tools.filesystem
+import tools.strings
+
+# Length of directory names of each level : year, month, day, hour
+LEVELS = (4, 2, 2, 5)
+
+class HistoricTree:
+	""" Cache of the historic directories """
+	entries = {}
+
+	@staticmethod
+	def clear():
+		""" Remove all directories of cache """
+		HistoricTree.entries.clear()
+
+	@staticmethod
+	def is_valid(name, length):
+		""" Indicates if the directory name is a year, a month, a day (only digits) or an hour (HHhMM) """
+		if len(name) != length:
+			return False
+		if length == 5:
+			return name[:2].isdigit() and name[2] == "h" and name[3:].isdigit()
+		return name.isdigit()
+
+	@staticmethod
+	def get_time(path):
+		""" Get the modification time of directory, 0 if not available """
+		try:
+			return tools.filesystem.filetime(path)
+		except Exception:
+			return 0
+
+	@staticmethod
+	def load(path, length):
+		""" List the sub directories of the path on sd card and add them in the cache """
+		names = []
+		try:
+			for fileinfo in tools.filesystem.list_directory(path):
+				if fileinfo[1] & 0xF000 == 0x4000 and HistoricTree.is_valid(fileinfo[0], length):
+					names.append(fileinfo[0])
+		except OSError:
+			pass
+		names.sort()
+		entry = [HistoricTree.get_time(path), tools.strings.tobytes("".join(names))]
+		HistoricTree.entries[path] = entry
+		return entry
+
+	@staticmethod
+	def get(path, length, check=False):
+		""" Get the names of sub directories of the path, concatenated in a bytes.
+		With check, the directory is listed again if its modification time changed """
+		entry = HistoricTree.entries.get(path, None)
+		if entry is None or (check and entry[0] != HistoricTree.get_time(path)):
+			entry = HistoricTree.load(path, length)
+		return entry[1]
+
+	@staticmethod
+	def find(names, length, name):
+		""" Return the position of the name in the names, or the position where it must be inserted """
+		low = 0
+		high = len(names) // length
+		while low < high:
+			middle = (low + high) // 2
+			if names[middle*length:(middle+1)*length] < name:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	@staticmethod
+	def list(path, length, newest=True, check=False):
+		""" Generator of the names of sub directories, from the most recent to the older or the reverse """
+		names = HistoricTree.get(path, length, check)
+		count = len(names) // length
+		for i in range(count):
+			if newest:
+				i = count - 1 - i
+			yield tools.strings.tostrings(names[i*length:(i+1)*length])
+
+	@staticmethod
+	def walk(root, depth=4, newest=True, check=False):
+		""" Generator of the paths relative to the root at the depth (1 = YYYY, 3 = YYYY/MM/DD, 4 = YYYY/MM/DD/HHhMM),
+		from the most recent to the older or the reverse """
+		for year in HistoricTree.list(root, LEVELS[0], newest, check):
+			if depth <= 1:
+				yield year
+				continue
+			for month in HistoricTree.list(root + "/" + year, LEVELS[1], newest, check):
+				path_month = year + "/" + month
+				if depth <= 2:
+					yield path_month
+					continue
+				for day in HistoricTree.list(root + "/" + path_month, LEVELS[2], newest, check):
+					path_day = path_month + "/" + day
+					if depth <= 3:
+						yield path_day
+						continue
+					for hour in HistoricTree.list(root + "/" + path_day, LEVELS[3], newest, check):
+						yield path_day + "/" + hour
+
+	@staticmethod
+	def add(root, path):
+		""" Indicates that the directory (YYYY/MM/DD/HHhMM) was created, each level not yet in cache is added """
+		path = tools.strings.tostrings(path)
+		names = path.split("/")[:len(LEVELS)]
+		parent = root
+		for level in range(len(names)):
+			entry = HistoricTree.entries.get(parent, None)
+			if entry is not None:
+				name = tools.strings.tobytes(names[level])
+				length = len(name)
+				position = HistoricTree.find(entry[1], length, name)
+				if entry[1][position*length:(position+1)*length] != name:
+					entry[1] = entry[1][:position*length] + name + entry[1][position*length:]
+					# The directory was just created, it contains only the next levels
+					child = parent
+					for sublevel in range(level, len(names) - 1):
+						child = child + "/" + names[sublevel]
+						HistoricTree.entries[child] = [0, tools.strings.tobytes(names[sublevel + 1])]
+					break
+			parent = parent + "/" + names[level]
+
+	@staticmethod
+	def remove(root, path):
+		""" Indicates that the directory was removed, it is removed from its parent and all its sub directories are forgotten """
+		path = tools.strings.tostrings(path)
+		directory = root + "/" + path
+		for key in [key for key in HistoricTree.entries if key == directory or key.startswith(directory + "/")]:
+			del HistoricTree.entries[key]
+		parent, name = tools.filesystem.split(directory)
+		entry = HistoricTree.entries.get(parent, None)
+		if entry is not None:
+			name_ = tools.strings.tobytes(name)
+			length = len(name_)
+			position = HistoricTree.find(entry[1], length, name_)
+			if entry[1][position*length:(position+1)*length] == name_:
+				entry[1] = entry[1][:position*length] + entry[1][(position+1)*length:]
@@ -0,0 +1,132 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Asynchronous writer of motion images on the sd card.
+The motion detection only adds the images in a bounded queue, a background task writes them in the historic
+by groups, then the latency of the sd card does not slow down the capture.
+When the queue is full or the memory is low, the older images are dropped, but the first image of each motion event is kept. """
+import uasyncio
+import tools.logger
+import tools.lang
+import tools.strings
+import tools.timing
+import tools.tasking
+import tools.topic
+import server.notifier
+import server.stream
+import motion.historic
+
+MAX_PENDING       = 3
+MAX_PENDING_LARGE = 12
+MAX_GROUPED       = 8
+MIN_MEMORY        = 48*1024
+
+class HistoricWriter:
+	""" Queue of motion images waiting to be written on sd card """
+	pending       = []
+	wake_up_event = [None]
+	queued        = [0]
+	written       = [0]
+	dropped       = [0]
+	failed        = [0]
+	groups        = [0]
+	max_pending   = [0]
+	max_latency   = [0]
+	total_latency = [0]
+
+	@staticmethod
+	def init():
+		""" Initialize """
+		if HistoricWriter.wake_up_event[0] is None:
+			HistoricWriter.wake_up_event[0] = uasyncio.Event()
+
+	@staticmethod
+	def get_max_pending():
+		""" Return the maximal number of images in queue """
+		if server.stream.Bufferedio.is_enough_memory():
+			return MAX_PENDING_LARGE
+		return MAX_PENDING
+
+	@staticmethod
+	def is_low_memory():
+		""" Indicates if the memory is too low to keep more images """
+		import gc
+		try:
+			# pylint: disable=no-member
+			return gc.mem_free() < MIN_MEMORY
+		except:
+			return False
+
+	@staticmethod
+	def add(path, name, image, motion_info, clip=False, notify=True):
+		""" Add a motion image in the queue of the sd card writer """
+		HistoricWriter.init()
+		HistoricWriter.pending.append((path, name, image, motion_info, clip, notify, tools.strings.ticks()))
+		HistoricWriter.queued[0] += 1
+		while len(HistoricWriter.pending) > HistoricWriter.get_max_pending() or (len(HistoricWriter.pending) > 1 and HistoricWriter.is_low_memory()):
+			HistoricWriter.drop()
+		if len(HistoricWriter.pending) > HistoricWriter.max_pending[0]:
+			HistoricWriter.max_pending[0] = len(HistoricWriter.pending)
+		HistoricWriter.wake_up_event[0].set()
+		return True
+
+	@staticmethod
+	def drop():
+		""" Drop the older image which is not the first of its motion event """
+		position = 0
+		for i in range(1, len(HistoricWriter.pending)):
+			if HistoricWriter.pending[i][3].get("motion_id",0) == HistoricWriter.pending[i-1][3].get("motion_id",0):
+				position = i
+				break
+		tools.logger.syslog("Sd card too slow, image %s dropped"%tools.strings.tostrings(HistoricWriter.pending[position][1]))
+		del HistoricWriter.pending[position]
+		HistoricWriter.dropped[0] += 1
+
+	@staticmethod
+	def get_statistics():
+		""" Return the statistics of writer """
+		return b"%d/%d pending, %d written, %d dropped, %d failed, %d groups, max pending %d, latency avg %d ms max %d ms"%(
+			len(HistoricWriter.pending), HistoricWriter.get_max_pending(),
+			HistoricWriter.written[0], HistoricWriter.dropped[0], HistoricWriter.failed[0], HistoricWriter.groups[0], HistoricWriter.max_pending[0],
+			HistoricWriter.total_latency[0]//HistoricWriter.written[0] if HistoricWriter.written[0] > 0 else 0, HistoricWriter.max_latency[0])
+
+	@staticmethod
+	async def task():
+		""" Write the pending images on sd card """
+		HistoricWriter.init()
+		if len(HistoricWriter.pending) == 0:
+			try:
+				# Wait images
+				await uasyncio.wait_for(HistoricWriter.wake_up_event[0].wait(), 11)
+			except:
+				pass
+			HistoricWriter.wake_up_event[0].clear()
+
+		if len(HistoricWriter.pending) > 0:
+			# Write a group of images
+			group = HistoricWriter.pending[:MAX_GROUPED]
+			del HistoricWriter.pending[:len(group)]
+			start = tools.timing.ticks_us()
+			results = await motion.historic.Historic.add_motions([motion_[:5] for motion_ in group])
+			tools.timing.Timing.stop("save", start)
+			now = tools.strings.ticks()
+			for i in range(len(group)):
+				if results[i]:
+					latency = now - group[i][6]
+					HistoricWriter.written[0] += 1
+					HistoricWriter.total_latency[0] += latency
+					if latency > HistoricWriter.max_latency[0]:
+						HistoricWriter.max_latency[0] = latency
+				else:
+					HistoricWriter.failed[0] += 1
+					server.notifier.Notifier.notify(topic=tools.topic.information, message=tools.lang.failed_to_save, enabled=group[i][5])
+			HistoricWriter.groups[0] += 1
+
+			# Let the motion detection run between each group
+			await uasyncio.sleep_ms(1)
+		return True
+
+	@staticmethod
+	def start():
+		""" Start the sd card writer task """
+		tools.tasking.Tasks.create_monitor(HistoricWriter.task)
@@ -13,5 +13,7 @@ class Motion:
 		""" Start motion detection """
 		if tools.info.iscamera() and video.video.Camera.is_activated():
 			from motion.motioncore import Detection
+			from motion.historicwriter import HistoricWriter
 			detection = Detection(kwargs.get("pir_detection", False))
 			tools.tasking.Tasks.create_monitor(detection.detect)
+			HistoricWriter.start()
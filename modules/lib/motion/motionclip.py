@@ -0,0 +1,133 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Container of all images of one motion event.
+The jpeg images sharing the same motion_id are appended one after the other in a single file (raw mjpeg),
+followed by a trailing index with one motion index record per image (timestamp, offset, size, differences) and a footer.
+The trailing index is rewritten after each group of images, the file stays readable even if the event is interrupted.
+It avoids to create two files (jpeg and json) per image, which is slow on FAT and fragments the sd card. """
+import struct
+import time
+import tools.logger
+import tools.strings
+import tools.filesystem
+import tools.sdcard
+import tools.date
+import motion.motionindex
+
+CLIP_EXTENSION  = ".mjpg"
+CLIP_MAGIC      = b"MCLP"
+CLIP_VERSION    = 1
+# magic, version, record size, records count, index offset
+CLIP_FOOTER     = "<4sHHII"
+MAX_CLIP_IMAGES = 64
+CLIP_TIMEOUT    = 30
+
+class MotionClip:
+	""" Motion event container opened during the event """
+	footer_size = struct.calcsize(CLIP_FOOTER)
+	def __init__(self, root, path, name, motion_id):
+		""" Constructor, path : YYYY/MM/DD/HHhMM, name : name of the first image """
+		self.timestamp = motion.motionindex.MotionIndex.get_timestamp(name)
+		self.motion_id = motion_id
+		self.day       = path[:10]
+		self.directory = root + "/" + path
+		self.name      = MotionClip.get_name(name, motion_id)
+		self.file      = None
+		self.records   = bytearray()
+		self.count     = 0
+		self.offset    = 0
+		self.modified  = False
+		self.last      = time.time()
+
+	@staticmethod
+	def get_name(name, motion_id):
+		""" Get the clip name with the name of the first image (YYYY-MM-DD_HH-MM-SS M=motion_id.mjpg) """
+		return "%s M=%d%s"%(name.split(" ")[0], motion_id, CLIP_EXTENSION)
+
+	@staticmethod
+	def get_filename(root, timestamp, motion_id):
+		""" Get the clip filename with the timestamp of its first image """
+		path = tools.strings.tostrings(tools.date.date_to_path(timestamp))
+		if path[-1] in "01234":
+			path = path[:-1] + "0"
+		else:
+			path = path[:-1] + "5"
+		return root + "/" + path + "/" + MotionClip.get_name(tools.date.date_to_filename(timestamp), motion_id)
+
+	def is_accepted(self, path, motion_id):
+		""" Indicates if the image can be added in this clip """
+		return motion_id == self.motion_id and path[:10] == self.day and self.count < MAX_CLIP_IMAGES
+
+	def is_expired(self):
+		""" Indicates if no image was added recently """
+		return self.last + CLIP_TIMEOUT < time.time()
+
+	def add(self, image, buffer):
+		""" Add the jpeg image with its motion index record, the record is updated with its position in the clip.
+		The trailing index is written by the commit """
+		result = False
+		try:
+			if self.file is None:
+				self.file = tools.sdcard.SdCard.create_file(self.directory, self.name, "wb")
+			if self.file is not None:
+				struct.pack_into("<III", buffer, motion.motionindex.INDEX_CLIP, self.timestamp, self.offset, len(image))
+				self.file.seek(self.offset)
+				self.file.write(image)
+				self.offset += len(image)
+				self.records += buffer
+				self.count += 1
+				self.modified = True
+				self.last = time.time()
+				result = True
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot add image in %s/%s"%(self.directory, self.name))
+		return result
+
+	def commit(self):
+		""" Write the trailing index after the last image """
+		if self.file is not None and self.modified:
+			try:
+				self.file.seek(self.offset)
+				self.file.write(self.records)
+				self.file.write(struct.pack(CLIP_FOOTER, CLIP_MAGIC, CLIP_VERSION, motion.motionindex.MotionIndex.record_size, self.count, self.offset))
+				self.file.flush()
+				self.modified = False
+			except Exception as err:
+				tools.logger.syslog(err, "Cannot write index of %s/%s"%(self.directory, self.name))
+
+	def close(self):
+		""" Close the clip """
+		self.commit()
+		if self.file is not None:
+			try:
+				self.file.close()
+			except Exception as err:
+				tools.logger.syslog(err)
+			self.file = None
+
+	@staticmethod
+	def read_index(filename, callback):
+		""" Read the trailing index of clip and call the callback with the motion index record of each image.
+		Return False if the clip is not usable """
+		result = False
+		try:
+			with open(filename, "rb") as file:
+				file.seek(0, 2)
+				size = file.tell()
+				if size >= MotionClip.footer_size:
+					file.seek(size - MotionClip.footer_size)
+					magic, version, record_size, count, offset = struct.unpack(CLIP_FOOTER, file.read(MotionClip.footer_size))
+					if magic == CLIP_MAGIC and version == CLIP_VERSION and record_size == motion.motionindex.MotionIndex.record_size and \
+						offset + count * record_size + MotionClip.footer_size == size:
+						file.seek(offset)
+						buffer = bytearray(record_size)
+						for _ in range(count):
+							file.readinto(buffer)
+							callback(buffer)
+						result = True
+			if result is False:
+				tools.logger.syslog("Bad clip %s"%filename)
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot read clip %s"%filename)
+		return result
@@ -5,12 +5,18 @@
 from gc import collect
 import sys
 import time
+import json
 import uasyncio
 import video.video
+import video.quality
+import video.framebroker
 import server.notifier
 import server.presence
 import server.webhook
 import motion.historic
+import motion.historicwriter
+import motion.motionevent
+import motion.motionscheduler
 import tools.logger
 import tools.jsonconfig
 import tools.lang
@@ -20,8 +26,25 @@ import tools.strings
 import tools.filesystem
 import tools.date
 import tools.topic
+import tools.timing
 
 STATE_DURATION = 30
+# Size budget of motion images, the maximal size of image is 64K
+MOTION_IMAGE_BUDGET  = 56*1024
+MOTION_IMAGE_MAXIMUM = 62*1024
+TIMING_PUBLISH_PERIOD = 300
+
+# Stages of motion detection measured, created at import to keep the report order
+TIMING_DETECTION = tools.timing.Timing.get("detection")
+TIMING_CAPTURE   = tools.timing.Timing.get("capture")
+TIMING_QUALITY   = tools.timing.Timing.get("quality")
+TIMING_COMPARE   = tools.timing.Timing.get("compare")
+TIMING_DETECT    = tools.timing.Timing.get("detect")
+TIMING_JSON      = tools.timing.Timing.get("json")
+# The writes on sd card are measured by the writer
+TIMING_SAVE      = tools.timing.Timing.get("save")
+TIMING_NOTIFY    = tools.timing.Timing.get("notify")
+
 class MotionConfig(tools.jsonconfig.JsonConfig):
 	""" Configuration class of motion detection """
 	def __init__(self):
@@ -63,30 +86,56 @@ class MotionConfig(tools.jsonconfig.JsonConfig):
 		# To keep all motion detection in the presence of occupants
 		self.permanent_detection = False
 
+		# Save all images of a motion event into a single clip file
+		self.clip_mode = False
+
+		# Number of images saved before a motion event
+		self.pre_roll_images = 0
+
+		# Duration in seconds of images saved after the last motion detection
+		self.post_roll_duration = 0
+
+		# Minimal and maximal interval in milliseconds between two captures
+		self.polling_min = 10
+		self.polling_max = 50
+
+		# Percent of processor time allowed to the motion detection (100% = no limit, reduce it on battery)
+		self.cpu_budget = 100
+
+		# Retention budget of historic : maximal size in megabytes and maximal age in days (0 = no limit, only the free space)
+		self.history_max_size = 0
+		self.history_max_days = 0
+
 		# Empty mask is equal disable masking
 		self.mask = b""
 
 class ImageMotion:
-	""" Class managing a motion detection image """
+	""" Class managing a motion detection image, it is a reusable slot of the image pool """
+	__slots__ = ("motion", "index", "motion_id", "time", "motion_detected", "config", "comparison", "references")
 	baseIndex = [0]
 	motionBaseId = [0]
 	created = [0]
-	def __init__(self, motion_, config):
+	def __init__(self, motion_=None, config=None):
 		""" Constructor """
+		self.motion = None
+		self.index = 0
+		self.motion_id = None
+		self.time = 0
+		self.motion_detected = False
+		self.config = config
+		self.comparison = None
+		self.references = 0
+		if motion_ is not None:
+			self.reset(motion_, config)
+
+	def reset(self, motion_, config):
+		""" Reuse the slot for a new image captured, the date strings are only built when the image is saved """
 		self.motion = motion_
 		self.baseIndex[0] += 1
 		self.created[0] += 1
 		self.index    = self.baseIndex[0]
-		self.filename = None
 		self.motion_id = None
-		self.date     = tools.date.date_to_string()
-		self.filename = tools.date.date_to_filename()
-		path = tools.date.date_to_path()
-		if path[-1] in [0x30,0x31,0x32,0x33,0x34]:
-			path = path[:-1] + b"0"
-		else:
-			path = path[:-1] + b"5"
-		self.path     = path
+		self.time     = int(time.time())
 		self.motion_detected = False
 		self.config = config
 		self.comparison = None
@@ -96,8 +145,27 @@ class ImageMotion:
 		self.created[0] -= 1
 		if self.created[0] >= 32:
 			print("Destroy %d"%self.created[0])
+		self.comparison = None
 		if self.motion:
 			self.motion.deinit()
+			self.motion = None
+
+	def get_time(self):
+		""" Get the timestamp of capture """
+		return self.time
+
+	def get_date(self):
+		""" Get the date of capture """
+		return tools.date.date_to_string(self.time)
+
+	def get_path(self):
+		""" Get the directory of image, with a directory every five minutes """
+		path = tools.date.date_to_path(self.time)
+		if path[-1] in [0x30,0x31,0x32,0x33,0x34]:
+			path = path[:-1] + b"0"
+		else:
+			path = path[:-1] + b"5"
+		return path
 
 	def set_motion_id(self, motion_id = None):
 		""" Set the unique image identifier """
@@ -116,32 +184,37 @@ class ImageMotion:
 
 	def get_filename(self):
 		""" Get the storage filename """
-		return "%s Id=%d D=%d"%(self.filename, self.index, self.get_diff_count())
+		return "%s Id=%d D=%d"%(tools.date.date_to_filename(self.time), self.index, self.get_diff_count())
 
 	def get_message(self):
 		""" Get the message of motion """
-		return "%s %s D=%d"%(tools.strings.tostrings(tools.lang.motion_detected), self.date[-8:], self.get_diff_count())
+		return "%s %s D=%d"%(tools.strings.tostrings(tools.lang.motion_detected), self.get_date()[-8:], self.get_diff_count())
 
 	def get_informations(self):
-		""" Return the informations of motion """
+		""" Return the informations of motion, it is a copy because the writer queue keeps it after the reuse of the slot """
 		if self.comparison is not None:
 			result    = self.comparison.copy()
 		else:
 			result = {}
 		result["image"]    = self.get_filename() + ".jpg"
-		result["path"]     = self.path
+		result["path"]     = self.get_path()
 		result["index"]    = self.index
-		result["date"]     = self.date
+		result["date"]     = self.get_date()
 		result["motion_id"] = self.motion_id
 		return result
 
 	async def save(self):
-		""" Save the image on sd card """
-		return await motion.historic.Historic.add_motion(tools.strings.tostrings(self.path), self.get_filename(), self.motion.get_image(), self.get_informations())
+		""" Add the image in the queue of images to save on sd card """
+		start = tools.timing.ticks_us()
+		informations = self.get_informations()
+		TIMING_JSON.stop(start)
+		return motion.historicwriter.HistoricWriter.add(tools.strings.tostrings(self.get_path()), self.get_filename(), self.motion.get_image(), informations, self.config.clip_mode, self.config.notify)
 
 	def compare(self, previous):
 		""" Compare two motion images to get differences """
+		start = tools.timing.ticks_us()
 		res = self.motion.compare(previous.motion)
+		TIMING_COMPARE.stop(start)
 		self.comparison = res
 		return res
 
@@ -201,6 +274,97 @@ class ImageMotion:
 					"errorHistos":[[0,0],[32,32],[128,128],[256,256]]
 				})
 
+class FrameRing:
+	""" Ring of the last images without motion, saved before the next motion event (pre-roll).
+	The slots are allocated once, the image overwritten is released """
+	def __init__(self, release, size=0):
+		""" Constructor, release is the callback called with the image overwritten """
+		self.release  = release
+		self.slots    = []
+		self.position = 0
+		self.resize(size)
+
+	def resize(self, size):
+		""" Change the number of slots """
+		if size != len(self.slots):
+			images = self.pop_all()
+			self.slots = [None]*size
+			self.position = 0
+			for image in images:
+				self.release(image)
+
+	def push(self, image):
+		""" Add the image in the ring, the older image is released if the ring is full """
+		if len(self.slots) == 0:
+			self.release(image)
+		else:
+			older = self.slots[self.position]
+			self.slots[self.position] = image
+			self.position = (self.position + 1) % len(self.slots)
+			if older is not None:
+				self.release(older)
+
+	def pop_all(self):
+		""" Remove all images from the ring and return them from the older to the most recent """
+		result = []
+		for i in range(len(self.slots)):
+			position = (self.position + i) % len(self.slots)
+			if self.slots[position] is not None:
+				result.append(self.slots[position])
+				self.slots[position] = None
+		return result
+
+class ImagePool:
+	""" Fixed pool of reusable image slots.
+	Each slot counts its holders (images captured, background, pre-roll, notification),
+	the camera buffer is released and the slot can be reused when the last holder releases it """
+	def __init__(self, size=0):
+		""" Constructor """
+		self.slots = []
+		self.overflows = 0
+		self.resize(size)
+
+	def resize(self, size):
+		""" Create the slots missing, the slots are never destroyed """
+		while len(self.slots) < size:
+			self.slots.append(ImageMotion())
+
+	def acquire(self, motion_, config):
+		""" Get a free slot for the image captured, the slot has one holder """
+		for image in self.slots:
+			if image.references == 0:
+				break
+		else:
+			# All slots in use, the pool grows
+			image = ImageMotion()
+			self.slots.append(image)
+			self.overflows += 1
+		image.reset(motion_, config)
+		image.references = 1
+		return image
+
+	@staticmethod
+	def retain(image):
+		""" Add a holder to the image """
+		image.references += 1
+		return image
+
+	@staticmethod
+	def release(image):
+		""" Remove a holder of the image, the image is released with the last holder """
+		if image is not None and image.references > 0:
+			image.references -= 1
+			if image.references == 0:
+				image.deinit()
+
+	def get_used(self):
+		""" Return the number of slots used """
+		result = 0
+		for image in self.slots:
+			if image.references > 0:
+				result += 1
+		return result
+
 class SnapConfig:
 	""" Store last motion information """
 	info = None
@@ -240,9 +404,13 @@ class MotionCore:
 		self.pir_detection = pir_detection
 		self.image_background = None
 		self.must_refresh_config = True
-		self.quality = 15
-		self.previous_quality = 0
+		self.quality = video.quality.Quality.get("motion", 15)
+		self.quality.configure(frame_budget=MOTION_IMAGE_BUDGET, maximum_size=MOTION_IMAGE_MAXIMUM)
 		self.flash_level = 0
+		self.pre_roll = FrameRing(self.deinit_image)
+		self.pool = ImagePool()
+		self.post_roll_end = 0
+		self.post_roll_id = None
 
 	def __del__(self):
 		""" Destructor """
@@ -251,11 +419,11 @@ class MotionCore:
 	def cleanup(self):
 		""" Clean up all images """
 		for image in self.images:
-			if id(image) != id(self.image_background):
-				image.deinit()
+			self.pool.release(image)
 		self.images = []
-		if self.image_background:
-			self.image_background.deinit()
+		for image in self.pre_roll.pop_all():
+			self.pool.release(image)
+		self.pool.release(self.image_background)
 		self.image_background = None
 
 	def open(self):
@@ -269,7 +437,8 @@ class MotionCore:
 		""" Resume the camera, restore the camera configuration after an interruption """
 		video.video.Camera.framesize(b"%dx%d"%(SnapConfig.get().width, SnapConfig.get().height))
 		video.video.Camera.pixformat(b"JPEG")
-		video.video.Camera.quality(self.quality)
+		video.quality.Quality.invalidate()
+		video.quality.Quality.apply(self.quality)
 		video.video.Camera.brightness(0)
 		video.video.Camera.contrast(0)
 		video.video.Camera.saturation(0)
@@ -320,23 +489,47 @@ class MotionCore:
 				# Notification of motion
 				result = (image.get_message(), image)
 
+				# Save the images preceding the motion event
+				for previous in self.pre_roll.pop_all():
+					await self.save_roll(previous, image.get_motion_id())
+
 				# Save image to sdcard
 				if await image.save() is False:
 					server.notifier.Notifier.notify(topic=tools.topic.information, message=tools.lang.failed_to_save, enabled=self.config.notify)
+
+				self.post_roll_end = time.time() + self.config.post_roll_duration
+				self.post_roll_id  = image.get_motion_id()
+
+			# If the image follows recently the motion event
+			elif time.time() < self.post_roll_end:
+				await self.save_roll(image, self.post_roll_id)
 			else:
-				# Destroy image
-				self.deinit_image(image)
+				# Keep image for the next motion event, the older is destroyed
+				self.pre_roll.push(image)
 
-		motion_ = video.video.Camera.motion()
+		video.quality.Quality.apply(self.quality)
+		start = tools.timing.ticks_us()
+		motion_ = video.framebroker.FrameBroker.motion()
+		TIMING_CAPTURE.stop(start)
 		self.manage_flash(motion_)
-		image = ImageMotion(motion_, self.config)
+		if self.must_refresh_config:
+			# Images captured, pre-roll, background, notification and the image captured before the oldest is removed
+			self.pool.resize(self.config.max_motion_images + self.config.pre_roll_images + 3)
+		image = self.pool.acquire(motion_, self.config)
 		if self.must_refresh_config:
 			image.refresh_config()
+			self.pre_roll.resize(self.config.pre_roll_images)
 			self.must_refresh_config = False
 		self.images.insert(0, image)
 		self.index += 1
 		return result
 
+	async def save_roll(self, image, motion_id):
+		""" Save the image before or after the motion event with the identifier of event, and destroy it """
+		image.motion_id = motion_id
+		await image.save()
+		self.deinit_image(image)
+
 	def stop_light(self):
 		""" Stop the light """
 		# If flash led working and compensation disabled
@@ -349,6 +542,12 @@ class MotionCore:
 		""" Force the refresh of motion configuration """
 		self.must_refresh_config = True
 
+	def get_light(self):
+		""" Return the light of the last image captured, -1 if no image """
+		if len(self.images) > 0 and self.images[0].motion:
+			return self.images[0].motion.get_light()
+		return -1
+
 	def is_stabilized(self):
 		""" Indicates if the camera is stabilized """
 		# If the PIR detection force the stabilization
@@ -372,33 +571,21 @@ class MotionCore:
 	def adjust_quality(self, current):
 		""" Adjust the image quality according to the size of image (the max possible is 64K) """
 		if len(self.images) >= self.config.max_motion_images:
-			changed = False
-			size = current.get_size()
-			if size > 62*1024:
-				if self.quality < 63:
-					self.quality += 1
-					changed = True
-					video.video.Camera.quality(self.quality, False)
-			else:
-				if self.quality >= 1:
-					if size < 50*1024:
-						self.quality -= 1
-						changed = True
-						video.video.Camera.quality(self.quality, False)
-			if changed is False:
-				if self.previous_quality != self.quality:
-					self.previous_quality = self.quality
+			if self.quality.update(current.get_size()):
+				video.quality.Quality.apply(self.quality)
 
 	def compare(self, display=True):
-		""" Compare all images captured and search differences """
-		differences = {}
+		""" Compare the image captured with the previous images to compute its motion identifier """
 		if len(self.images) >= 2:
 			current = self.images[0]
 
+			start = tools.timing.ticks_us()
 			self.adjust_quality(current)
+			TIMING_QUALITY.stop(start)
 
 			# Compute the motion identifier
-			for previous in self.images[1:]:
+			for position in range(1, len(self.images)):
+				previous = self.images[position]
 				# # If image not already compared
 				comparison = current.compare(previous)
 
@@ -427,65 +614,86 @@ class MotionCore:
 				if self.image_background is not None:
 					comparison = current.compare(self.image_background)
 
-			# Compute the list of differences
-			diffs = b""
-			index = 0
-			mean_light = -1
-			for image in self.images:
-				if mean_light == -1:
-					mean_light = image.motion.get_light()
-				differences.setdefault(image.get_motion_id(), []).append(image.get_motion_id())
-				if image.get_motion_id() is not None:
-					if image.index % 10 == 0:
-						trace = b"_"
-					else:
-						trace = b" "
-					if image.index > index:
-						index = image.index
-					diffs += b"%d:%d%s%s"%(image.get_motion_id(), image.get_diff_count(), (0x41 + ((256-image.get_diff_histo())//10)).to_bytes(1, 'big'), trace)
 			if display:
-				line = b"\r%s %s L%d (%d) "%(tools.date.time_to_html(seconds=True), bytes(diffs), mean_light, index)
-				if tools.filesystem.ismicropython():
-					sys.stdout.write(line)
+				self.display()
+
+	def display(self):
+		""" Display the motion identifiers and the differences of images captured """
+		diffs = b""
+		index = 0
+		mean_light = -1
+		for image in self.images:
+			if mean_light == -1:
+				mean_light = image.motion.get_light()
+			if image.get_motion_id() is not None:
+				if image.index % 10 == 0:
+					trace = b"_"
 				else:
-					sys.stdout.write(line.decode("utf8"))
-		return differences
+					trace = b" "
+				if image.index > index:
+					index = image.index
+				diffs += b"%d:%d%s%s"%(image.get_motion_id(), image.get_diff_count(), (0x41 + ((256-image.get_diff_histo())//10)).to_bytes(1, 'big'), trace)
+		line = b"\r%s %s L%d (%d) "%(tools.date.time_to_html(seconds=True), bytes(diffs), mean_light, index)
+		if tools.filesystem.ismicropython():
+			sys.stdout.write(line)
+		else:
+			sys.stdout.write(line.decode("utf8"))
+
+	def count_events(self):
+		""" Return the number of different motion identifiers in the images captured """
+		result = 0
+		images = self.images
+		for position in range(len(images)):
+			motion_id = images[position].motion_id
+			for other in range(position):
+				if images[other].motion_id == motion_id:
+					break
+			else:
+				result += 1
+		return result
+
+	def has_isolated_event(self):
+		""" Indicates if a motion identifier is found in only one image (glitch) """
+		images = self.images
+		for position in range(len(images)):
+			motion_id = images[position].motion_id
+			count = 0
+			for other in range(len(images)):
+				if images[other].motion_id == motion_id:
+					count += 1
+			if count <= 1:
+				return True
+		return False
 
 	def deinit_image(self, image):
-		""" Release image allocated """
-		if image:
-			if not image in self.images:
-				if image != self.image_background:
-					image.deinit()
+		""" Release the image held by the caller, it is destroyed when no longer held by the images, the background or the pre-roll """
+		self.pool.release(image)
 
 	def detect(self, display=True):
 		""" Detect motion """
+		start = tools.timing.ticks_us()
 		detected = False
 		change_polling = False
 
-		# Compute the list of differences
-		differences = self.compare(display)
+		# Compute the motion identifiers
+		self.compare(display)
+		events = self.count_events()
 
 		# Too many differences found
-		if len(list(differences.keys())) >= self.config.threshold_motion:
+		if events >= self.config.threshold_motion:
 			detected = True
 			change_polling = True
 		# If no differences
-		elif len(list(differences.keys())) == 1:
+		elif events == 1:
 			image = self.image_background
-			self.image_background = self.images[0]
+			self.image_background = self.pool.retain(self.images[0])
 			self.deinit_image(image)
 			detected = False
 		# If not enough differences
-		elif len(list(differences.keys())) <= self.config.threshold_glitch:
-			detected = True
+		elif events <= self.config.threshold_glitch:
 			change_polling = True
-			# Check if it is a glitch
-			for diff in differences.values():
-				if len(diff) <= 1:
-					# Glitch ignored
-					detected = False
-					break
+			# Check if it is a glitch : a motion identifier found in only one image is ignored
+			detected = not self.has_isolated_event()
 		# Not detected
 		else:
 			detected = False
@@ -496,6 +704,7 @@ class MotionCore:
 				# If image seem not equal to previous
 				if self.is_detected(image.get_comparison()):
 					image.set_motion_detected()
+		TIMING_DETECT.stop(start)
 		return detected, change_polling
 
 class Detection:
@@ -506,16 +715,15 @@ class Detection:
 		self.load_config()
 		self.motion = None
 
-		if self.pir_detection is True:
-			self.polling_frequency = 3
-		else:
-			self.polling_frequency = 100
+		motion.motionscheduler.MotionScheduler.configure(self.motion_config, self.pir_detection)
+		motion.historic.Historic.configure(self.motion_config.history_max_size, self.motion_config.history_max_days)
 		self.detection = None
 		self.activated = None
 		self.refresh_config_counter = 0
-		self.last_detection = 0
+		self.event = None
 		self.cadencer = NotificationCadencer()
 		self.last_notification_suspended = 0
+		self.last_timing_published = int(time.time())
 
 	def load_config(self):
 		""" Load motion configuration """
@@ -531,6 +739,8 @@ class Detection:
 			# If configuration changed
 			if self.motion_config.refresh():
 				tools.logger.syslog("Change motion config %s"%self.motion_config.to_string(), display=False)
+				motion.motionscheduler.MotionScheduler.configure(self.motion_config, self.pir_detection)
+				motion.historic.Historic.configure(self.motion_config.history_max_size, self.motion_config.history_max_days)
 				if self.motion:
 					self.motion.refresh_config()
 			# If configuration changed
@@ -556,6 +766,11 @@ class Detection:
 
 		# If the motion detection activated
 		activated = await self.is_activated()
+
+		# The motion event in progress ends when the detection is deactivated
+		if activated is False and self.event is not None:
+			await self.end_event()
+
 		if activated or self.is_permanent():
 			try:
 				# Capture motion
@@ -642,6 +857,26 @@ class Detection:
 			self.motion.resume()
 			video.video.Camera.clear_modified()
 
+	def notify_event(self):
+		""" Notify the best image of motion event """
+		start = tools.timing.ticks_us()
+		self.event.notified = True
+		# If the notifications are not too frequent
+		if self.cadencer.can_notify():
+			server.notifier.Notifier.notify(topic=tools.topic.motion_image, message=self.event.best_message, data=self.event.best_image, enabled=self.motion_config.notify)
+		else:
+			tools.logger.syslog("Notification '%s' too frequent ignored"%self.event.best_message)
+		self.event.best_image = None
+		TIMING_NOTIFY.stop(start)
+
+	async def end_event(self):
+		""" End of motion event, send the summary and save the event """
+		server.notifier.Notifier.notify(topic=tools.topic.motion_event, message=self.event.get_summary(), enabled=self.motion_config.notify)
+		# Send webhook no motion detected
+		server.notifier.Notifier.notify(topic=tools.topic.motion_detected, value=tools.topic.value_off, url=self.webhook_config.no_motion_detected)
+		await motion.historic.Historic.add_event(self.event)
+		self.event = None
+
 	def release_image(self):
 		""" Release motion image allocated """
 		# If detection
@@ -649,6 +884,15 @@ class Detection:
 			message, image = self.detection
 			# Release image buffer
 			self.motion.deinit_image(image)
+			self.detection = None
+
+	async def publish_timing(self):
+		""" Publish periodically the durations of stages on the mqtt topic """
+		if self.last_timing_published + TIMING_PUBLISH_PERIOD < int(time.time()):
+			self.last_timing_published = int(time.time())
+			import server.mqttclient
+			if server.mqttclient.MqttClient.init():
+				await server.mqttclient.MqttClient.publish(topic="%(client_id)s/" + tools.topic.motion_timing, value=json.dumps(tools.timing.Timing.to_dict()))
 
 	async def capture(self, activated):
 		""" Capture motion """
@@ -656,7 +900,7 @@ class Detection:
 
 		# If camera not stabilized speed start
 		if self.motion and self.motion.is_stabilized() is True:
-			await tools.tasking.Tasks.wait_resume(duration=tools.tasking.Tasks.get_slow_ratio() * self.polling_frequency, name="motion")
+			await tools.tasking.Tasks.wait_resume(duration=motion.motionscheduler.MotionScheduler.get_interval(), name="motion")
 
 		try:
 			# Waits for the camera's availability
@@ -666,50 +910,47 @@ class Detection:
 			if reserved:
 				# Initialize motion detection
 				await self.init_motion()
+				motion.motionscheduler.MotionScheduler.begin()
+				start = tools.timing.ticks_us()
 
 				# Capture motion image
 				self.detection = await self.motion.capture()
 
 				# If motion detected and detection activated
 				if self.detection is not None and activated is True:
+					image = self.detection[1]
 
-					# Notify motion with push over
-					message, image = self.detection
-
-					# If no previous detection
-					if self.last_detection == 0:
+					# If no motion event in progress
+					if self.event is None:
 						# Send motion detected
 						server.notifier.Notifier.notify(topic=tools.topic.motion_detected, value=tools.topic.value_on, url=self.webhook_config.motion_detected)
+						self.event = motion.motionevent.MotionEvent(image)
+					else:
+						self.event.add(image)
 
-					self.last_detection = int(time.time())
+				# If motion event in progress
+				if self.event is not None:
+					# Notify the best image of event
+					if self.event.is_notifiable():
+						self.notify_event()
+
+					# If no more motion detection
+					if self.detection is None and self.event.end + STATE_DURATION < int(time.time()):
+						await self.end_event()
 
-					# If the notifications are not too frequent
-					if self.cadencer.can_notify():
-						server.notifier.Notifier.notify(topic=tools.topic.motion_image, message=message, data=image.get(), enabled=self.motion_config.notify)
-					else:
-						tools.logger.syslog("Notification '%s' too frequent ignored" %message)
-				else:
-					# If motion detected recently
-					if self.last_detection > 0:
-						# If no more motion detection
-						if self.last_detection + STATE_DURATION < int(time.time()):
-							# Send webhook no motion detected
-							server.notifier.Notifier.notify(topic=tools.topic.motion_detected, value=tools.topic.value_off, url=self.webhook_config.no_motion_detected)
-							self.last_detection = 0
 				# Detect motion
 				detected, change_polling = self.motion.detect()
 
-				# If motion found
-				if change_polling is True:
-					# Speed up the polling frequency
-					self.polling_frequency = 10
-					motion.historic.Historic.set_motion_state(True)
-				else:
-					# Slow down the polling frequency
-					self.polling_frequency = 50
-					motion.historic.Historic.set_motion_state(False)
+				# Choose the interval before the next capture
+				motion.motionscheduler.MotionScheduler.end(change_polling, self.motion.get_light())
+				motion.historic.Historic.set_motion_state(change_polling)
+				TIMING_DETECTION.stop(start)
+				await self.publish_timing()
 				result = True
 			else:
+				# The motion event in progress ends even if the detection is suspended
+				if self.event is not None and self.event.end + STATE_DURATION < int(time.time()):
+					await self.end_event()
 				if self.last_notification_suspended + 120 < int(time.time()):
 					self.last_notification_suspended = int(time.time())
 					server.notifier.Notifier.notify(topic=tools.topic.motion_detection, value=tools.topic.value_suspended, message=tools.lang.motion_detection_suspended, enabled=self.motion_config.notify_state)
@@ -0,0 +1,120 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Motion event, group of consecutive motion detections.
+An event starts with the first detection and ends when no detection occurs for a while.
+Only one notification with the best image is sent per event, followed by a summary at the end.
+The events of each day are saved in a binary file of the day directory. """
+import time
+import struct
+import tools.logger
+import tools.filesystem
+import tools.strings
+import tools.date
+import tools.lang
+import motion.motionindex
+
+EVENT_FILENAME = "events.idx"
+EVENT_MAGIC    = b"MEVT"
+EVENT_VERSION  = 1
+EVENT_HEADER   = "<4sHH"
+# motion_id, start, end, images count, peak of differences, timestamp and index of best image
+EVENT_RECORD   = "<IIIHHII"
+EVENT_NOTIFICATION_IMAGES = 3
+EVENT_NOTIFICATION_DELAY  = 2
+
+class MotionEvent:
+	""" Group of consecutive motion detections """
+	header_size = struct.calcsize(EVENT_HEADER)
+	record_size = struct.calcsize(EVENT_RECORD)
+	def __init__(self, image):
+		""" Constructor with the first image of event, the event is dated with the capture of images """
+		self.motion_id  = image.get_motion_id()
+		self.start      = image.get_time()
+		self.end        = self.start
+		self.images     = 0
+		self.peak       = -1
+		self.best_message = None
+		self.best_image   = None
+		self.best_name    = ""
+		self.notified   = False
+		self.add(image)
+
+	def add(self, image):
+		""" Add a motion image in the event, the image with the most differences is kept """
+		if image.get_time() > self.end:
+			self.end = image.get_time()
+		self.images += 1
+		if image.get_diff_count() > self.peak:
+			self.peak = image.get_diff_count()
+			self.best_message = image.get_message()
+			self.best_name    = image.get_filename()
+			# The image is kept only until the notification
+			if self.notified is False:
+				self.best_image = image.get()
+
+	def get_duration(self):
+		""" Return the duration of event in seconds """
+		return self.end - self.start
+
+	def is_notifiable(self):
+		""" Indicates if the best image can be notified, when enough images are in the event or after a short delay """
+		return self.notified is False and (self.images >= EVENT_NOTIFICATION_IMAGES or self.start + EVENT_NOTIFICATION_DELAY <= time.time())
+
+	def get_summary(self):
+		""" Return the summary message of event """
+		return tools.lang.motion_event_summary%(tools.date.date_to_bytes(self.start)[-8:], self.get_duration(), self.images, self.peak)
+
+	def pack(self):
+		""" Pack the event into record """
+		timestamp = 0
+		index = 0
+		info = motion.motionindex.MotionIndex.parse_name(self.best_name)
+		if info is not None:
+			timestamp = motion.motionindex.MotionIndex.get_timestamp(self.best_name)
+			index = info[6]
+		return struct.pack(EVENT_RECORD, self.motion_id if self.motion_id else 0, self.start, self.end, self.images, self.peak if self.peak > 0 else 0, timestamp, index)
+
+	@staticmethod
+	def get_filename(root, day):
+		""" Get the events filename of the day (day = YYYY/MM/DD) """
+		return root + "/" + day + "/" + EVENT_FILENAME
+
+	def save(self, root):
+		""" Append the event in the events file of its start day """
+		result = False
+		filename = MotionEvent.get_filename(root, tools.strings.tostrings(tools.date.date_to_path(self.start))[:10])
+		file = None
+		try:
+			if tools.filesystem.exists(filename):
+				file = open(filename, "ab")
+			elif tools.filesystem.exists(tools.filesystem.split(filename)[0]):
+				file = open(filename, "wb")
+				file.write(struct.pack(EVENT_HEADER, EVENT_MAGIC, EVENT_VERSION, MotionEvent.record_size))
+			if file:
+				file.write(self.pack())
+				result = True
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot save event %s"%filename)
+		finally:
+			if file:
+				file.close()
+		return result
+
+	@staticmethod
+	def read(root, day):
+		""" Read the events of the day (day = YYYY/MM/DD),
+		return the list of [motion_id, start, end, images, peak, best image timestamp, best image index] """
+		result = []
+		try:
+			with open(MotionEvent.get_filename(root, day), "rb") as file:
+				magic, version, record_size = struct.unpack(EVENT_HEADER, file.read(MotionEvent.header_size))
+				if magic == EVENT_MAGIC and version == EVENT_VERSION and record_size == MotionEvent.record_size:
+					buffer = bytearray(record_size)
+					while file.readinto(buffer) == record_size:
+						result.append(list(struct.unpack(EVENT_RECORD, buffer)))
+		except OSError:
+			pass
+		except Exception as err:
+			tools.logger.syslog(err)
+		return result
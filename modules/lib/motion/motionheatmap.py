@@ -0,0 +1,243 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Heatmap of motion detections, it counts for each square of detection the number of images where it changed.
+Each day directory of the sd card contains a small binary file with the counters of the day,
+updated after each group of images saved. The heatmap of several days is the sum of the heatmaps of each day.
+The rolling week keeps the sum of the days before the current day, when the day changes the heatmap of the day ended
+is added and the day going out of the week is subtracted, so the daily heatmaps are not read again at each request.
+It helps to adjust the mask and to find the zones of recurring false detections. """
+import struct
+import array
+import tools.logger
+import tools.filesystem
+import tools.strings
+import tools.date
+import motion.motionindex
+
+HEATMAP_FILENAME = "heatmap.bin"
+HEATMAP_MAGIC    = b"MHMP"
+HEATMAP_VERSION  = 1
+# magic, version, squares width, squares height, square x, square y, images count
+HEATMAP_HEADER   = "<4sHHHHHI"
+HEATMAP_DAYS     = 7
+MAX_COUNTER      = 0xFFFF
+# Position of width, height, square x, square y and diff words in motion index record
+HEATMAP_GEOMETRY = struct.calcsize("<I8BIIH")
+
+class MotionHeatmap:
+	""" Counters of motion detections of each square """
+	header_size = struct.calcsize(HEATMAP_HEADER)
+	def __init__(self, day, typecode="H"):
+		""" Constructor, day : YYYY/MM/DD """
+		self.day      = day
+		self.typecode = typecode
+		self.width    = 0
+		self.height   = 0
+		self.squarex  = 0
+		self.squarey  = 0
+		self.count    = 0
+		self.counters = array.array(typecode)
+		self.modified = False
+
+	def reset(self, width, height, squarex, squarey):
+		""" Reset the counters with a new geometry (in squares) """
+		self.width    = width
+		self.height   = height
+		self.squarex  = squarex
+		self.squarey  = squarey
+		self.count    = 0
+		self.counters = array.array(self.typecode, [0]*(width*height))
+		self.modified = True
+
+	def add(self, width, height, squarex, squarey, diffs):
+		""" Add the differences bitmap of one image, width and height are in pixels.
+		The counters are cleared if the geometry of detection changed """
+		if squarex > 0 and squarey > 0:
+			if width//squarex != self.width or height//squarey != self.height or squarex != self.squarex or squarey != self.squarey:
+				self.reset(width//squarex, height//squarey, squarex, squarey)
+			counters = self.counters
+			length = len(counters)
+			base = 0
+			for word in diffs:
+				if word:
+					for bit in range(32):
+						if word & (0x80000000 >> bit):
+							cell = base + bit
+							if cell < length and counters[cell] < MAX_COUNTER:
+								counters[cell] += 1
+				base += 32
+			self.count += 1
+			self.modified = True
+
+	def add_record(self, buffer):
+		""" Add the differences of a motion index record """
+		width, height, squarex, squarey, words = struct.unpack_from("<HHBBB", buffer, HEATMAP_GEOMETRY)
+		self.add(width, height, squarex, squarey, struct.unpack_from("<%dI"%words, buffer, motion.motionindex.INDEX_DIFFS))
+
+	def merge(self, other):
+		""" Add the counters of another heatmap with the same geometry, return False if the geometry differs """
+		if self.width == 0 and self.height == 0:
+			self.reset(other.width, other.height, other.squarex, other.squarey)
+		if (other.width, other.height, other.squarex, other.squarey) == (self.width, self.height, self.squarex, self.squarey):
+			for cell in range(len(self.counters)):
+				self.counters[cell] += other.counters[cell]
+			self.count += other.count
+			return True
+		return False
+
+	def subtract(self, other):
+		""" Remove the counters of another heatmap with the same geometry, return False if the geometry differs """
+		if (other.width, other.height, other.squarex, other.squarey) == (self.width, self.height, self.squarex, self.squarey):
+			for cell in range(len(self.counters)):
+				if self.counters[cell] > other.counters[cell]:
+					self.counters[cell] -= other.counters[cell]
+				else:
+					self.counters[cell] = 0
+			self.count -= other.count
+			# An empty heatmap takes the geometry of the next heatmap merged
+			if self.count <= 0:
+				self.reset(0, 0, 0, 0)
+			return True
+		return False
+
+	@staticmethod
+	def get_filename(root, day):
+		""" Get the heatmap filename of the day (day = YYYY/MM/DD) """
+		return root + "/" + day + "/" + HEATMAP_FILENAME
+
+	def pack_header(self):
+		""" Return the header of heatmap """
+		return struct.pack(HEATMAP_HEADER, HEATMAP_MAGIC, HEATMAP_VERSION, self.width, self.height, self.squarex, self.squarey, self.count)
+
+	def save(self, root):
+		""" Save the heatmap of day if modified """
+		result = True
+		if self.modified:
+			result = False
+			filename = MotionHeatmap.get_filename(root, self.day)
+			try:
+				if tools.filesystem.exists(tools.filesystem.split(filename)[0]):
+					with open(filename, "wb") as file:
+						file.write(self.pack_header())
+						file.write(self.counters)
+					self.modified = False
+					result = True
+			except Exception as err:
+				tools.logger.syslog(err, "Cannot save heatmap %s"%filename)
+		return result
+
+	@staticmethod
+	def load(root, day):
+		""" Load the heatmap of day (day = YYYY/MM/DD), return None if not existing or not usable """
+		result = None
+		filename = MotionHeatmap.get_filename(root, day)
+		try:
+			if tools.filesystem.exists(filename):
+				with open(filename, "rb") as file:
+					magic, version, width, height, squarex, squarey, count = struct.unpack(HEATMAP_HEADER, file.read(MotionHeatmap.header_size))
+					if magic == HEATMAP_MAGIC and version == HEATMAP_VERSION:
+						heatmap = MotionHeatmap(day)
+						heatmap.reset(width, height, squarex, squarey)
+						if file.readinto(heatmap.counters) == len(heatmap.counters) * heatmap.counters.itemsize:
+							heatmap.count = count
+							heatmap.modified = False
+							result = heatmap
+				if result is None:
+					tools.logger.syslog("Bad heatmap %s"%filename)
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot load heatmap %s"%filename)
+		return result
+
+	@staticmethod
+	async def get(root, day):
+		""" Get the heatmap of day, it is built with the day index if the file not exists """
+		result = MotionHeatmap.load(root, day)
+		if result is None:
+			result = MotionHeatmap(day)
+			await motion.motionindex.MotionIndex.read(root, day, result.add_record)
+		return result
+
+	@staticmethod
+	def get_previous_day(day, days):
+		""" Return the day (YYYY/MM/DD) a number of days before """
+		timestamp = tools.date.mktime((int(day[0:4]), int(day[5:7]), int(day[8:10]), 12, 0, 0, 0, 0)) - days*86400
+		return tools.strings.tostrings(tools.date.date_to_path(timestamp))[:10]
+
+	@staticmethod
+	async def accumulate(root, day, days=HEATMAP_DAYS, current=None):
+		""" Return the sum of heatmaps of the days ending at the day, the days with another geometry than the last day are ignored.
+		current is the heatmap in memory of the current day """
+		result = MotionHeatmap(day, "I")
+		for i in range(days):
+			previous = MotionHeatmap.get_previous_day(day, i)
+			if current is not None and current.day == previous:
+				heatmap = current
+			else:
+				heatmap = await MotionHeatmap.get(root, previous)
+			if heatmap.count > 0:
+				result.merge(heatmap)
+		return result
+
+	def to_dict(self, days=1):
+		""" Return the heatmap as dictionnary for the json export """
+		return {
+			"day"     : self.day,
+			"days"    : days,
+			"width"   : self.width,
+			"height"  : self.height,
+			"squarex" : self.squarex,
+			"squarey" : self.squarey,
+			"count"   : self.count,
+			"max"     : max(self.counters) if len(self.counters) > 0 else 0,
+			"cells"   : list(self.counters)}
+
+	def to_bytes(self):
+		""" Return the heatmap as binary : header followed by the 32 bits counters """
+		counters = self.counters
+		if counters.typecode != "I":
+			counters = array.array("I", counters)
+		return self.pack_header() + bytes(counters)
+
+class RollingHeatmap:
+	""" Running sum of the heatmaps of the days before the current day """
+	def __init__(self, days=HEATMAP_DAYS):
+		""" Constructor """
+		self.days     = days
+		self.day      = None
+		self.previous = None
+
+	async def build(self, root, day):
+		""" Build the sum of the heatmaps of the days before the day (day = YYYY/MM/DD) """
+		self.previous = await MotionHeatmap.accumulate(root, MotionHeatmap.get_previous_day(day, 1), self.days - 1)
+		self.day = day
+
+	async def next_day(self, root, ended, day):
+		""" Add the heatmap of the day ended and subtract the day going out of the period, day is the new current day.
+		The sum is rebuilt at the next request if the day does not follow the day ended or if the geometry changed """
+		if self.previous is not None and self.day == ended.day and MotionHeatmap.get_previous_day(day, 1) == ended.day:
+			if ended.count > 0 and self.previous.merge(ended) is False:
+				self.previous = None
+			else:
+				outgoing = await MotionHeatmap.get(root, MotionHeatmap.get_previous_day(day, self.days))
+				if outgoing.count > 0:
+					self.previous.subtract(outgoing)
+				self.day = day
+		else:
+			self.previous = None
+
+	def invalidate(self):
+		""" The days of the period changed, the sum will be rebuilt at the next request """
+		self.previous = None
+
+	async def get(self, root, current):
+		""" Return the sum of the heatmaps of the days ending at the current day (current : heatmap in memory of the current day) """
+		if self.previous is None or self.day != current.day:
+			await self.build(root, current.day)
+		result = MotionHeatmap(current.day, "I")
+		if current.count > 0:
+			result.merge(current)
+		if self.previous.count > 0 and result.merge(self.previous) is False:
+			# The geometry of detection changed during the period, only the days with the geometry of the last day are added
+			result = await MotionHeatmap.accumulate(root, current.day, self.days, current)
+		return result
@@ -0,0 +1,287 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Per day binary index of motion detections.
+Each day directory of the sd card contains an append only file with one fixed size record per detection.
+Reading this file at startup is much faster than parsing each json file of the day one by one.
+The index is rebuilt when it is missing or corrupted, from the json files of the jpeg images
+and from the trailing index of each clip file. """
+import re
+import json
+import struct
+import uos
+import uasyncio
+import tools.logger
+import tools.filesystem
+import tools.date
+import tools.info
+
+INDEX_FILENAME = "motions.idx"
+INDEX_MAGIC    = b"MIDX"
+INDEX_VERSION  = 2
+INDEX_HEADER   = "<4sHH"
+# timestamp, year-2000, month, day, hour, minute, second, directory hour, directory minute,
+# index, motion_id, diff count, width, height, squarex, squarey, diff words
+INDEX_FIELDS   = "<I8BIIHHHBBB"
+# followed by clip timestamp (0 if the image is a jpeg file), jpeg offset and size in the clip, diffs bitmap
+INDEX_RECORD   = INDEX_FIELDS + "III16I"
+INDEX_CLIP     = struct.calcsize(INDEX_FIELDS)
+INDEX_DIFFS    = struct.calcsize(INDEX_FIELDS + "III")
+MAX_DIFF_WORDS = 16
+
+class MotionIndex:
+	""" Manage the binary index of motion detections of one day """
+	header_size = struct.calcsize(INDEX_HEADER)
+	record_size = struct.calcsize(INDEX_RECORD)
+	buffer      = bytearray(struct.calcsize(INDEX_RECORD))
+
+	@staticmethod
+	def get_filename(root, day):
+		""" Get the index filename of the day (day = YYYY/MM/DD) """
+		return root + "/" + day + "/" + INDEX_FILENAME
+
+	@staticmethod
+	def parse_name(name):
+		""" Extract the date and the image informations from the image name (YYYY-MM-DD_HH-MM-SS Id=X D=Y) """
+		result = None
+		try:
+			spl = tools.filesystem.splitext(name)[0].split(" ")
+			date = spl[0]
+			year, month, day = int(date[0:4]), int(date[5:7]), int(date[8:10])
+			hour, minute, second = int(date[11:13]), int(date[14:16]), int(date[17:19])
+			index = int(spl[1].split("=")[1])
+			count = int(spl[-1].split("=")[-1])
+			result = year, month, day, hour, minute, second, index, count
+		except Exception as err:
+			tools.logger.syslog(err, "Bad motion name %s"%name)
+		return result
+
+	@staticmethod
+	def get_timestamp(name):
+		""" Get the timestamp of the image name (the path before the name is ignored) """
+		result = 0
+		info = MotionIndex.parse_name(tools.filesystem.split(name)[1])
+		if info is not None:
+			result = int(tools.date.mktime(info[:6] + (0, 0)))
+		return result
+
+	@staticmethod
+	def pack(path, name, item, motion_id=0, clip=0, offset=0, size=0):
+		""" Pack a historic item into the shared record buffer.
+		path : YYYY/MM/DD/HHhMM, name : image name without extension, item : historic item """
+		result = None
+		info = MotionIndex.parse_name(name)
+		if info is not None and item is not None:
+			year, month, day, hour, minute, second, index, count = info
+			timestamp = tools.date.mktime((year, month, day, hour, minute, second, 0, 0))
+			diffs = item[3]
+			words = len(diffs)
+			if words > MAX_DIFF_WORDS:
+				words = MAX_DIFF_WORDS
+			diffs = list(diffs[:words]) + [0]*(MAX_DIFF_WORDS - words)
+			struct.pack_into(INDEX_RECORD, MotionIndex.buffer, 0,
+				int(timestamp) & 0xFFFFFFFF, year - 2000, month, day, hour, minute, second, int(path[11:13]), int(path[14:16]),
+				index, motion_id if motion_id else 0, count, item[1], item[2], item[4], item[5], words, clip, offset, size, *diffs)
+			result = MotionIndex.buffer
+		return result
+
+	@staticmethod
+	def write_header(file):
+		""" Write the header of index file """
+		file.write(struct.pack(INDEX_HEADER, INDEX_MAGIC, INDEX_VERSION, MotionIndex.record_size))
+
+	@staticmethod
+	def append(root, path, buffer):
+		""" Append the record of a detection at the end of the day index (path : YYYY/MM/DD/HHhMM).
+		The index is created only if the day is new, otherwise it will be rebuilt from json files at next startup """
+		result = False
+		filename = MotionIndex.get_filename(root, path[:10])
+		file = None
+		try:
+			if tools.filesystem.exists(filename):
+				file = open(filename, "ab")
+			elif MotionIndex.is_new_day(root, path):
+				file = open(filename, "wb")
+				MotionIndex.write_header(file)
+			if file:
+				file.write(buffer)
+				result = True
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot append %s"%filename)
+		finally:
+			if file:
+				file.close()
+		return result
+
+	@staticmethod
+	def is_new_day(root, path):
+		""" Indicates if the day directory contains only the hour directory of path """
+		result = True
+		for fileinfo in tools.filesystem.list_directory(root + "/" + path[:10]):
+			if fileinfo[0] != path[11:] and fileinfo[0] != INDEX_FILENAME:
+				result = False
+				break
+		return result
+
+	@staticmethod
+	def count(root, day):
+		""" Return the number of detections in the day index (day = YYYY/MM/DD), or None if the index is not usable """
+		result = None
+		filename = MotionIndex.get_filename(root, day)
+		try:
+			size = uos.stat(filename)[6]
+			if size >= MotionIndex.header_size and (size - MotionIndex.header_size) % MotionIndex.record_size == 0:
+				with open(filename, "rb") as file:
+					magic, version, record_size = struct.unpack(INDEX_HEADER, file.read(MotionIndex.header_size))
+					if magic == INDEX_MAGIC and version == INDEX_VERSION and record_size == MotionIndex.record_size:
+						result = (size - MotionIndex.header_size) // MotionIndex.record_size
+		except Exception as err:
+			pass
+		return result
+
+	@staticmethod
+	async def read(root, day, callback, skip=0):
+		""" Read the detections of the day (day = YYYY/MM/DD) and call the callback with the buffer of each record.
+		The first records can be skipped. Return False if the index is not usable """
+		result = False
+		if MotionIndex.count(root, day) is not None:
+			with open(MotionIndex.get_filename(root, day), "rb") as file:
+				file.seek(MotionIndex.header_size + skip * MotionIndex.record_size)
+				buffer = bytearray(MotionIndex.record_size)
+				while file.readinto(buffer) == MotionIndex.record_size:
+					callback(buffer)
+			if tools.filesystem.ismicropython():
+				await uasyncio.sleep_ms(2)
+			result = True
+		return result
+
+	@staticmethod
+	async def read_backward(root, day, callback, block=16):
+		""" Read the detections of the day from the most recent to the older, by blocks of records.
+		The callback is called with the buffer and the offset of each record, it returns False to stop the reading.
+		Return False if the index is not usable """
+		result = False
+		count = MotionIndex.count(root, day)
+		if count is not None:
+			with open(MotionIndex.get_filename(root, day), "rb") as file:
+				buffer = bytearray(MotionIndex.record_size * block)
+				position = count
+				while position > 0:
+					first = position - block
+					if first < 0:
+						first = 0
+					file.seek(MotionIndex.header_size + first * MotionIndex.record_size)
+					file.readinto(buffer)
+					for i in range(position - first - 1, -1, -1):
+						if callback(buffer, i * MotionIndex.record_size) is False:
+							first = 0
+							break
+					position = first
+					if tools.filesystem.ismicropython():
+						await uasyncio.sleep_ms(2)
+			result = True
+		return result
+
+	@staticmethod
+	def remove(root, day):
+		""" Remove the day index, it will be rebuilt at next read """
+		try:
+			filename = MotionIndex.get_filename(root, day)
+			if tools.filesystem.exists(filename):
+				tools.filesystem.remove(filename)
+		except Exception as err:
+			tools.logger.syslog(err)
+
+	@staticmethod
+	async def rebuild(root, day):
+		""" Rebuild the day index from the json files of each detection and from the trailing index of each clip """
+		import motion.motionclip
+		tools.logger.syslog("Rebuild historic index %s"%day)
+		filename = MotionIndex.get_filename(root, day)
+		path_day = root + "/" + day
+		hours = []
+		for fileinfo in tools.filesystem.list_directory(path_day):
+			if fileinfo[1] & 0xF000 == 0x4000 and re.match(r"\d\dh\d\d", fileinfo[0]):
+				hours.append(fileinfo[0])
+		hours.sort()
+		file = None
+		try:
+			file = open(filename, "wb")
+			MotionIndex.write_header(file)
+			for hour in hours:
+				names = []
+				clips = []
+				for fileinfo in tools.filesystem.list_directory(path_day + "/" + hour):
+					if fileinfo[1] & 0xF000 != 0x4000:
+						if re.match(r"\d\d.*\.json", fileinfo[0]):
+							names.append(fileinfo[0])
+						elif re.match(r"\d\d.*\.mjpg", fileinfo[0]):
+							clips.append(fileinfo[0])
+				records = []
+				for name in names:
+					item = MotionIndex.load_json(path_day + "/" + hour + "/" + name)
+					if item is not None:
+						buffer = MotionIndex.pack(day + "/" + hour, tools.filesystem.splitext(name)[0], item)
+						if buffer is not None:
+							records.append(bytes(buffer))
+				for clip in clips:
+					motion.motionclip.MotionClip.read_index(path_day + "/" + hour + "/" + clip, lambda buffer: records.append(bytes(buffer)))
+
+				# Images of json files and clips sorted by date
+				records.sort(key=lambda record: struct.unpack_from("<I", record, 0)[0])
+				for record in records:
+					file.write(record)
+				if tools.filesystem.ismicropython():
+					await uasyncio.sleep_ms(2)
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot rebuild %s"%filename)
+		finally:
+			if file:
+				file.close()
+
+	@staticmethod
+	def load_json(filename):
+		""" Load the json file of detection, return None if the image not existing """
+		result = None
+		file = None
+		try:
+			file = open(filename, "rb")
+			item = json.load(file)
+			image = tools.filesystem.splitext(filename)[0] + ".jpg"
+			if tools.filesystem.exists(image):
+				# Convert the differences in old format
+				if type(item[3]) == type(""):
+					item[3] = MotionIndex.convert_diffs(item[3])
+				result = item
+		except OSError as err:
+			tools.logger.syslog(err)
+			# If sd card not responding properly
+			if err.errno == 2:
+				tools.info.increase_issues_counter()
+		except Exception as err:
+			tools.logger.syslog(err)
+		finally:
+			if file:
+				file.close()
+		return result
+
+	@staticmethod
+	def convert_diffs(diffs_string):
+		""" Convert the differences in old string format into list of 32 bits words """
+		diffs = []
+		diff_val = 0
+		i = 0
+		for diff in diffs_string:
+			if diff == "#":
+				diff_val |= 1
+
+			if (i %32 == 31):
+				diffs.append(diff_val)
+				diff_val = 0
+			else:
+				diff_val <<= 1
+			i += 1
+		diff_max = len(diffs_string)
+		diff_val <<= (31 - (diff_max%32))
+		diffs.append(diff_val)
+		return diffs
@@ -0,0 +1,125 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Scheduler of the motion detection captures.
+The interval between two captures is chosen according to the measured duration of capture and comparison,
+the recent motion activity, the light level and the server load, within the configured bounds.
+A processor budget limits the part of time used by the motion detection, for the boards on battery.
+The interval and the reason of its choice are kept as telemetry. """
+import tools.strings
+import tools.tasking
+
+DARK_LIGHT     = 20
+RATE_SMOOTHING = 4
+COST_SMOOTHING = 8
+
+class MotionScheduler:
+	""" Choose the interval between two captures of motion detection """
+	min_interval = [10]
+	max_interval = [50]
+	budget       = [100]
+	interval     = [50]
+	cost         = [0]
+	rate         = [0]
+	light        = [-1]
+	load         = [1]
+	reason       = [b"start"]
+	started      = [0]
+	captures     = [0]
+
+	@staticmethod
+	def configure(config, pir_detection=False):
+		""" Configure the bounds and the processor budget with the motion configuration """
+		MotionScheduler.min_interval[0] = max(1, config.polling_min)
+		MotionScheduler.max_interval[0] = max(MotionScheduler.min_interval[0], config.polling_max)
+		MotionScheduler.budget[0]       = min(100, max(1, config.cpu_budget))
+		if MotionScheduler.captures[0] == 0:
+			# With the PIR detection, the first images must be captured as soon as possible
+			if pir_detection:
+				MotionScheduler.interval[0] = 3
+			else:
+				MotionScheduler.interval[0] = MotionScheduler.max_interval[0]
+
+	@staticmethod
+	def begin():
+		""" Start of the capture and comparison """
+		MotionScheduler.started[0] = tools.strings.ticks()
+
+	@staticmethod
+	def end(motion_detected, light=-1):
+		""" End of the capture and comparison, compute the interval before the next capture """
+		cost = tools.strings.ticks() - MotionScheduler.started[0]
+		if MotionScheduler.captures[0] == 0:
+			MotionScheduler.cost[0] = cost
+		else:
+			MotionScheduler.cost[0] += (cost - MotionScheduler.cost[0]) // COST_SMOOTHING
+		MotionScheduler.captures[0] += 1
+		MotionScheduler.rate[0] += ((100 if motion_detected else 0) - MotionScheduler.rate[0]) // RATE_SMOOTHING
+		MotionScheduler.light[0] = light
+
+		min_interval = MotionScheduler.min_interval[0]
+		max_interval = MotionScheduler.max_interval[0]
+
+		# Motion in progress : capture as fast as possible
+		if motion_detected:
+			interval = min_interval
+			reason = b"motion"
+		# Too dark to detect something : capture slowly
+		elif 0 <= light <= DARK_LIGHT:
+			interval = max_interval
+			reason = b"dark"
+		# Slow down progressively after the last motion
+		elif MotionScheduler.rate[0] > 0:
+			interval = max_interval - ((max_interval - min_interval) * MotionScheduler.rate[0]) // 100
+			reason = b"activity"
+		else:
+			interval = max_interval
+			reason = b"idle"
+
+		# Keep the part of processor time used by motion detection under the budget
+		if MotionScheduler.budget[0] < 100:
+			minimum = (MotionScheduler.cost[0] * (100 - MotionScheduler.budget[0])) // MotionScheduler.budget[0]
+			if minimum > interval:
+				interval = minimum
+				reason = b"budget"
+
+		if interval > max_interval:
+			interval = max_interval
+		if interval < min_interval:
+			interval = min_interval
+		MotionScheduler.interval[0] = interval
+		MotionScheduler.reason[0]   = reason
+
+	@staticmethod
+	def get_interval():
+		""" Return the interval in milliseconds before the next capture, slowed down when the server is busy """
+		MotionScheduler.load[0] = tools.tasking.Tasks.get_slow_ratio()
+		return MotionScheduler.interval[0] * MotionScheduler.load[0]
+
+	@staticmethod
+	def get_telemetry():
+		""" Return the interval chosen and its inputs """
+		return {
+			"interval" : MotionScheduler.interval[0] * MotionScheduler.load[0],
+			"reason"   : tools.strings.tostrings(MotionScheduler.get_reason()),
+			"cost"     : MotionScheduler.cost[0],
+			"rate"     : MotionScheduler.rate[0],
+			"light"    : MotionScheduler.light[0],
+			"load"     : MotionScheduler.load[0],
+			"budget"   : MotionScheduler.budget[0],
+			"min"      : MotionScheduler.min_interval[0],
+			"max"      : MotionScheduler.max_interval[0]}
+
+	@staticmethod
+	def get_reason():
+		""" Return the reason of the last interval chosen, the server load is taken into account """
+		if MotionScheduler.load[0] > 1:
+			return b"load"
+		return MotionScheduler.reason[0]
+
+	@staticmethod
+	def get_statistics():
+		""" Return the statistics of scheduler """
+		return b"%d ms (%s), cost %d ms, motion rate %d%%, light %d, load x%d, budget %d%%"%(
+			MotionScheduler.interval[0] * MotionScheduler.load[0], MotionScheduler.get_reason(),
+			MotionScheduler.cost[0], MotionScheduler.rate[0], MotionScheduler.light[0], MotionScheduler.load[0], MotionScheduler.budget[0])
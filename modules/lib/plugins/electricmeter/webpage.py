@@ -105,7 +105,7 @@ async def hourly_page_datas(request, response, args):
 		result["rates"].append(cost.to_dict())
 	try:
 		result["pulses"] = electricmeter.meter.HourlyCounter.get_datas(day)
-		await response.send_buffer(b"pulses", buffer=tools.strings.tobytes(json.dumps(result)), mime_type=b"application/json")
+		await response.send_json(result, depth=2)
 	except Exception as err:
 		await response.send_not_found(err)
 
@@ -204,7 +204,7 @@ async def daily_datas(request, response, args):
 		result["rates"].append(cost.to_dict())
 	try:
 		result["time_slots"] = electricmeter.meter.DailyCounter.get_datas(month)
-		await response.send_buffer(b"pulses", buffer=tools.strings.tobytes(json.dumps(result)), mime_type=b"application/json")
+		await response.send_json(result, depth=2)
 	except Exception as err:
 		await response.send_not_found(err)
 
@@ -264,7 +264,7 @@ async def monthly_datas(request, response, args):
 		result["rates"].append(cost.to_dict())
 	try:
 		result["time_slots"] = electricmeter.meter.MonthlyCounter.get_datas(year)
-		await response.send_buffer(b"pulses", buffer=tools.strings.tobytes(json.dumps(result)), mime_type=b"application/json")
+		await response.send_json(result, depth=2)
 	except Exception as err:
 		await response.send_not_found(err)
 
@@ -46,6 +46,7 @@ MIMES = {\
 	b".png"   : b"image/png",
 	b".gif"   : b"image/gif",
 	b".jpeg"  : b"image/jpeg",
+	b".mjpg"  : b"video/x-motion-jpeg",
 	b".svg"   : b"image/svg+xml",
 	b".ico"   : b"image/x-icon",
 	b".bin"   : b"application/octet-stream"
@@ -357,14 +358,16 @@ class ContentText:
 
 class ContentFile:
 	""" Class that contains a file """
-	def __init__(self, filename, content_type=None, base64=False):
-		""" Constructor """
+	def __init__(self, filename, content_type=None, base64=False, offset=0, size=None):
+		""" Constructor, offset and size select a part of file """
 		# pylint:disable=global-variable-not-assigned
 		if type(filename) == type([]):
 			self.filenames = filename
 		else:
 			self.filenames = [filename]
 		self.base64 = base64
+		self.offset = offset
+		self.size   = size
 		if content_type is None:
 			global MIMES
 			ext = tools.filesystem.splitext(tools.strings.tostrings(self.filenames[0]))[1]
@@ -390,8 +393,10 @@ class ContentFile:
 					step = 512
 				buf = bytearray(step)
 				f.seek(0,2)
-				size = f.tell()
-				f.seek(0)
+				size = f.tell() - self.offset
+				if self.size is not None and self.size < size:
+					size = self.size
+				f.seek(self.offset)
 
 				if self.base64 and step % 3 != 0:
 					step = (step//3)*3
@@ -459,6 +464,30 @@ class ContentBuffer:
 			result += await streamio.write(b"Nothing")
 		return result
 
+class ContentJson:
+	""" Class that contains json datas, serialized item by item with chunked transfer encoding """
+	def __init__(self, datas, depth=1, content_type=None):
+		""" Constructor, depth indicates the level of lists and dictionaries serialized item by item """
+		self.datas = datas
+		self.depth = depth
+		if content_type is None:
+			self.content_type = b"application/json"
+		else:
+			self.content_type = content_type
+
+	async def serialize(self, streamio):
+		""" Serialize json datas """
+		import server.jsonstream
+		result = await streamio.write(b'Content-Type: %s\r\nTransfer-Encoding: chunked\r\n\r\n'%(self.content_type))
+		writer = server.jsonstream.JsonWriter(streamio)
+		try:
+			await writer.write(self.datas, self.depth)
+		except Exception as err:
+			# The headers are already sent, the error cannot be reported in the response
+			tools.logger.syslog(err)
+		result += await writer.close()
+		return result
+
 class PartText:
 	""" Class that contains a text, used in multipart request or response """
 	def __init__(self, name, value):
@@ -564,14 +593,18 @@ class HttpResponse(Http):
 		""" Send ok to the client web browser """
 		return await self.send_error(status=b"200", content=content)
 
-	async def send_file(self, filename, mime_type=None, headers=None, base64=False):
-		""" Send a file to the client web browser """
-		return await self.send(content=ContentFile(filename, mime_type, base64), status=b"200", headers=headers)
+	async def send_file(self, filename, mime_type=None, headers=None, base64=False, offset=0, size=None):
+		""" Send a file or a part of file to the client web browser """
+		return await self.send(content=ContentFile(filename, mime_type, base64, offset, size), status=b"200", headers=headers)
 
 	async def send_buffer(self, filename, buffer, mime_type=None, headers=None):
 		""" Send a file to the client web browser """
 		return await self.send(content=ContentBuffer(filename, buffer, mime_type), status=b"200", headers=headers)
 
+	async def send_json(self, datas, depth=1, headers=None):
+		""" Send json datas to the client web browser without building the complete json document in memory """
+		return await self.send(content=ContentJson(datas, depth), status=b"200", headers=headers)
+
 	async def send_page(self, page):
 		""" Send a template page to the client web browser """
 		self.set_content(None)
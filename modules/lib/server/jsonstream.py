@@ -0,0 +1,84 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+""" Incremental json writer.
+The lists and dictionaries are serialized item by item into the stream with the chunked transfer encoding,
+the complete json document is never built in memory. """
+import json
+import tools.strings
+
+GENERATOR = type((item for item in ()))
+
+class JsonWriter:
+	""" Serialize json item by item into a stream with chunked transfer encoding """
+	def __init__(self, streamio, chunk_size=1440):
+		""" Constructor """
+		self.streamio = streamio
+		self.chunk_size = chunk_size
+		self.buffer = bytearray()
+		self.length = 0
+		self.failed = False
+
+	async def write(self, datas, depth=1):
+		""" Write datas, the lists and dictionaries are written item by item up to the depth """
+		try:
+			await self.write_item(datas, depth)
+		except Exception:
+			self.failed = True
+			raise
+
+	async def write_item(self, datas, depth):
+		""" Write an item, the generators and the asynchronous iterators are written as lists """
+		if depth > 0 and (type(datas) == type([]) or type(datas) == type((0,)) or type(datas) == GENERATOR):
+			await self.add(b"[")
+			first = True
+			for item in datas:
+				if first is False:
+					await self.add(b",")
+				first = False
+				await self.write_item(item, depth-1)
+			await self.add(b"]")
+		elif depth > 0 and hasattr(datas, "__anext__"):
+			await self.add(b"[")
+			first = True
+			async for item in datas:
+				if first is False:
+					await self.add(b",")
+				first = False
+				await self.write_item(item, depth-1)
+			await self.add(b"]")
+		elif depth > 0 and type(datas) == type({}):
+			await self.add(b"{")
+			first = True
+			for key, value in datas.items():
+				if first is False:
+					await self.add(b",")
+				first = False
+				await self.add(b"%s:"%tools.strings.tobytes(json.dumps(tools.strings.tostrings(key))))
+				await self.write_item(value, depth-1)
+			await self.add(b"}")
+		elif type(datas) == type(0):
+			await self.add(b"%d"%datas)
+		else:
+			await self.add(tools.strings.tobytes(json.dumps(datas, separators=(',', ':'))))
+
+	async def add(self, data):
+		""" Add data in the chunk, the chunk is sent when it is full """
+		self.buffer += data
+		if len(self.buffer) >= self.chunk_size:
+			await self.flush()
+
+	async def flush(self):
+		""" Send the current chunk """
+		if len(self.buffer) > 0:
+			self.length += await self.streamio.write(b"%x\r\n"%len(self.buffer))
+			self.length += await self.streamio.write(self.buffer)
+			self.length += await self.streamio.write(b"\r\n")
+			self.buffer = bytearray()
+
+	async def close(self):
+		""" Send the last chunk and the end of chunked transfer, return the length written.
+		If the write failed, the end is not sent, the client detects the incomplete response """
+		if self.failed is False:
+			await self.flush()
+			self.length += await self.streamio.write(b"0\r\n\r\n")
+		return self.length
@@ -16,10 +16,15 @@ class Stream:
 			self.close      = self.close_mcp
 			self.awrite     = self.awrite_mcp
 			self.is_closing = self.is_closing_mcp
+			if hasattr(writer, "drain"):
+				self.write_pair = self.write_pair_drain
+			else:
+				self.write_pair = self.write_pair_mcp
 		else:
 			self.close      = self.close_pc
 			self.awrite     = self.awrite_pc
 			self.is_closing = self.is_closing_pc
+			self.write_pair = self.write_pair_drain
 
 	async def readline(self):
 		""" The firt time, this method completely reads the stream.
@@ -65,6 +70,30 @@ class Stream:
 			result = -1
 		return result
 
+	async def write_pair_drain(self, header, data):
+		""" Write the header and the data in the stream with a single drain """
+		self.writer.write(header)
+		self.writer.write(data)
+		await self.writer.drain()
+		return self.written_pair(header, data)
+
+	async def write_pair_mcp(self, header, data):
+		""" Write the header and the data in the stream, when the stream cannot be drained """
+		await self.writer.awrite(header)
+		await self.writer.awrite(data)
+		return self.written_pair(header, data)
+
+	def written_pair(self, header, data):
+		""" Check the stream after the writing of header and data """
+		if self.is_closing():
+			raise OSError(104,"Closed connection")
+		if Stream.trace:
+			Stream.trace.write(b"\n# write\n")
+			Stream.trace.write(header)
+			Stream.trace.write(data)
+			Stream.trace.flush()
+		return len(header) + len(data)
+
 	async def awrite_mcp(self, data):
 		""" Awrite micropython """
 		return await self.writer.awrite(data)
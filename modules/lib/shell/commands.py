@@ -48,6 +48,7 @@ The commands are :
 - eval        : evaluation python string
 - exec        : execute python string
 - dump        : display hexadecimal dump of the content of file
+- timing      : durations of the stages of motion detection (p50/p95/max)
 """
 # pylint:disable=wrong-import-position
 import sys
@@ -797,6 +798,13 @@ def sysinfo():
 	""" Get system informations """
 	tools.console.Console.print(tools.strings.tostrings(tools.info.sysinfo()))
 
+def timing(reset=False):
+	""" Display the durations of the stages measured """
+	import tools.timing
+	tools.console.Console.print(tools.strings.tostrings(tools.timing.Timing.get_statistics(b"\n")))
+	if reset:
+		tools.timing.Timing.reset()
+
 def execute(python_string):
 	""" Execute python string """
 	exec(python_string)
@@ -1037,6 +1045,7 @@ def create_shell_commands():
 		"meminfo"    :[meminfo                                 ],
 		"flashinfo"  :[flashinfo                               ],
 		"sysinfo"    :[sysinfo                                 ],
+		"timing"     :[timing                                  ,("-r","reset",True)],
 		"deepsleep"  :[deepsleep       ,"seconds"              ],
 		"lightsleep" :[ligthsleep      ,"seconds"              ],
 		"ping"       :[ping            ,"host"                 ],
@@ -102,6 +102,13 @@ def date_to_filename(current_date = None):
 	filename = filename.replace(":","-")
 	return filename
 
+def date_to_http(current_date=None):
+	""" Get a http date (Sun, 06 Nov 1994 08:49:37 GMT), the clock of device is used as is """
+	year,month,day,hour,minute,second,weekday = local_time(current_date)[:7]
+	return b"%s, %02d %s %04d %02d:%02d:%02d GMT"%(
+		(b"Mon",b"Tue",b"Wed",b"Thu",b"Fri",b"Sat",b"Sun")[weekday], day,
+		(b"Jan",b"Feb",b"Mar",b"Apr",b"May",b"Jun",b"Jul",b"Aug",b"Sep",b"Oct",b"Nov",b"Dec")[month-1], year, hour, minute, second)
+
 def date_to_path(current_date=None):
 	""" Get a path with year/month/day/hour """
 	year,month,day,hour,minute = local_time(current_date)[:5]
@@ -27,6 +27,7 @@ class FeaturesConfig(tools.jsonconfig.JsonConfig):
 		self.presence     = kwargs.get("presence",    False) # Home occupant presence detection task
 		self.camera       = kwargs.get("camera",      False) # Camera configuration
 		self.motion       = kwargs.get("motion",      False) # Motion detection task
+		self.timelapse    = kwargs.get("timelapse",   False) # Timelapse recorder task
 		self.log_size     = kwargs.get("log_size",32*1024)   # Log files size
 		self.log_quantity = kwargs.get("log_quantity",4)     # Quantity of log file
 		self.device       = kwargs.get("device","ESP32CAM")  # Default device name
@@ -34,6 +34,7 @@ item_motion_onoff                       =b"On/Off"
 menu_camera                             =b" Camera"
 item_camera                             =b"  Video stream"
 item_full_screen                        =b" Full screen"
+item_timelapse                          =b" Timelapse"
 item_onoff                              =b"On/Off"
 
 reboot_after_many                       =b"Reboot after many crash : \n%s"
@@ -44,8 +45,13 @@ empty_house                             =b"Empty house"
 presence_detection_on                   =b"Presence detection on"
 presence_detection_off                  =b"Presence detection off"
 failed_to_save                          =b"Failed to save"
+sd_writer_label                         =b"Sd card writer"
+motion_polling_label                    =b"Motion polling"
+motion_timing_label                     =b"Motion timing p50/p95/max"
+streaming_viewers_label                 =b"Streaming viewers"
 failed_to_load                          =b"Failed to load"
 motion_detected                         =b"Motion detected at"
+motion_event_summary                    =b"Motion event at %s : duration %d s, %d images, peak D=%d"
 motion_detection_on                     =b"Motion detection on"
 motion_detection_off                    =b"Motion detection off"
 motion_detection_suspended              =b"Motion detection suspended"
@@ -65,6 +71,14 @@ notification_state                      =b"Notify state change"
 suspends_motion_detection               =b"Suspends motion detection on the presence of an occupant"
 permanent_detection                     =b"Permanently archive all motion detections including in the presence of an occupant"
 turn_on_flash                           =b"Turn on the led flash when the light goes down"
+motion_clip_mode                        =b"Save all images of a motion event into a single clip file"
+pre_roll_images                         =b"Number of images saved before a motion event"
+post_roll_duration                      =b"Duration in seconds of images saved after a motion event"
+motion_polling_min                      =b"Minimal interval in milliseconds between two captures"
+motion_polling_max                      =b"Maximal interval in milliseconds between two captures"
+motion_cpu_budget                       =b"Percent of processor time allowed to motion detection (reduce on battery)"
+history_max_size                        =b"Maximal size in megabytes of motion historic (0 = until the sd card is full)"
+history_max_days                        =b"Maximal number of days kept in motion historic (0 = no limit)"
 pushover_on                             =b"Pushover notification on"
 pushover_off                            =b"Pushover notification off"
 notification_configuration              =b"Notification configuration"
@@ -75,6 +89,9 @@ pushover_token                          =b"API token"
 enter_pushover_token                    =b"Enter pushover API token/key"
 see_pushover_website                    =b"See pushover website"
 historic_not_available                  =b"Not yet available, try again later"
+heatmap_day                             =b"Heatmap of day"
+heatmap_week                            =b"Heatmap of week"
+download_clip                           =b"Download the clip"
 last_motion_detections                  =b"Last motion detections"
 convert_ip_address                      =b"Convert ip address into DNS name"
 smartphone_d                            =b"Smartphone %d"
@@ -178,6 +195,14 @@ login                                   =b"Login"
 camera                                  =b"Camera"
 resolution                              =b"Resolution"
 quality                                 =b"Quality"
+streaming_bandwidth                     =b"Streaming bandwidth in kilobytes per second (0 = fixed quality)"
+snapshot_age                            =b"Maximal age in milliseconds of the snapshot image reused"
+timelapse                               =b"Timelapse"
+timelapse_period                        =b"Period in seconds between two images"
+timelapse_start                         =b"Start of recording"
+timelapse_end                           =b"End of recording"
+timelapse_max_days                      =b"Number of days kept (0 = no limit)"
+timelapse_days                          =b"Days recorded"
 brightness                              =b"Brightness"
 contrast                                =b"Contrast"
 saturation                              =b"Saturation"
@@ -39,6 +39,7 @@ item_motion_onoff                       =b"Marche/Arr\xC3\xAAt"
 menu_camera                             =b" Cam\xC3\xA9ra"
 item_camera                             =b"  Flux vid\xC3\xA9o"
 item_full_screen                        =b" Pleine \xC3\xA9cran"
+item_timelapse                          =b" Timelapse"
 item_onoff                              =b"Marche/Arr\xC3\xAAt"
 
 reboot_after_many                       =b"Reboot apr\xC3\xA9s plusieurs plantages : \n%s"
@@ -49,8 +50,13 @@ empty_house                             =b"Maison vide"
 presence_detection_on                   =b"D\xC3\xA9tection pr\xC3\xA9sence activ\xC3\xA9e"
 presence_detection_off                  =b"D\xC3\xA9tection pr\xC3\xA9sence d\xC3\xA9sactiv\xC3\xA9e"
 failed_to_save                          =b"\xC3\x89chec de l'enregistrement"
+sd_writer_label                         =b"\xC3\x89criture carte sd"
+motion_polling_label                    =b"Cadence d\xC3\xA9tection"
+motion_timing_label                     =b"Dur\xC3\xA9es d\xC3\xA9tection p50/p95/max"
+streaming_viewers_label                 =b"Spectateurs du streaming"
 failed_to_load                          =b"\xC3\x89chec de lecture"
 motion_detected                         =b"Mouvement d\xC3\xA9tect\xC3\xA9 \xC3\xA0"
+motion_event_summary                    =b"Mouvement \xC3\xA0 %s : dur\xC3\xA9e %d s, %d images, pic D=%d"
 motion_detection_on                     =b"D\xC3\xA9tection de mouvement activ\xC3\xA9e"
 motion_detection_off                    =b"D\xC3\xA9tection de mouvement d\xC3\xA9sactiv\xC3\xA9e"
 motion_detection_suspended              =b"D\xC3\xA9tection de mouvement suspendue"
@@ -70,6 +76,14 @@ notification_state                      =b"Notifier changement \xC3\xA9tat"
 suspends_motion_detection               =b"Suspendre la d\xC3\xA9tection de mouvement en pr\xC3\xA9sence d'occupants"
 permanent_detection                     =b"Archiver en permanence toutes les d\xC3\xA9tection de mouvements y compris en pr\xC3\xA9sence d'occupants"
 turn_on_flash                           =b"Allumer le flash LED lorsque la lumi\xC3\xA8re baisse"
+motion_clip_mode                        =b"Enregistrer toutes les images d'un mouvement dans un seul fichier clip"
+pre_roll_images                         =b"Nombre d'images enregistr\xC3\xA9es avant un mouvement"
+post_roll_duration                      =b"Dur\xC3\xA9e en secondes des images enregistr\xC3\xA9es apr\xC3\xA8s un mouvement"
+motion_polling_min                      =b"Intervalle minimal en millisecondes entre deux captures"
+motion_polling_max                      =b"Intervalle maximal en millisecondes entre deux captures"
+motion_cpu_budget                       =b"Pourcentage du temps processeur allou\xC3\xA9 \xC3\xA0 la d\xC3\xA9tection (\xC3\xA0 r\xC3\xA9duire sur batterie)"
+history_max_size                        =b"Taille maximale en m\xC3\xA9gaoctets de l'historique (0 = jusqu'\xC3\xA0 remplir la carte sd)"
+history_max_days                        =b"Nombre maximal de jours conserv\xC3\xA9s dans l'historique (0 = sans limite)"
 pushover_on                             =b"Notification pushover activ\xC3\xA9e"
 pushover_off                            =b"Notification pushover d\xC3\xA9sactiv\xC3\xA9e"
 notification_configuration              =b"Configuration notification"
@@ -80,6 +94,9 @@ pushover_token                          =b"API Jeton"
 enter_pushover_token                    =b"Entrer le jeton API de pushover"
 see_pushover_website                    =b"Voir le site web pushover"
 historic_not_available                  =b"Pas encore disponible, ressayez plus tard"
+heatmap_day                             =b"Carte des mouvements du jour"
+heatmap_week                            =b"Carte des mouvements de la semaine"
+download_clip                           =b"T\xC3\xA9l\xC3\xA9charger le clip"
 last_motion_detections                  =b"Derni\xC3\xA8res d\xC3\xA9tections de mouvement"
 convert_ip_address                      =b"Convertir les adresses ip en noms DNS"
 smartphone_d                            =b"Smartphone %d"
@@ -183,6 +200,14 @@ login                                   =b"Connecter"
 camera                                  =b"Cam\xC3\xA9ra"
 resolution                              =b"R\xC3\xA9solution"
 quality                                 =b"Qualit\xC3\xA9"
+streaming_bandwidth                     =b"Bande passante du streaming en kilo-octets par seconde (0 = qualit\xC3\xA9 fixe)"
+snapshot_age                            =b"\xC3\x82ge maximal en millisecondes de l'image instantan\xC3\xA9e r\xC3\xA9utilis\xC3\xA9e"
+timelapse                               =b"Timelapse"
+timelapse_period                        =b"P\xC3\xA9riode en secondes entre deux images"
+timelapse_start                         =b"D\xC3\xA9but de l'enregistrement"
+timelapse_end                           =b"Fin de l'enregistrement"
+timelapse_max_days                      =b"Nombre de jours conserv\xC3\xA9s (0 = sans limite)"
+timelapse_days                          =b"Jours enregistr\xC3\xA9s"
 brightness                              =b"Luminosit\xC3\xA9"
 contrast                                =b"Contraste"
 saturation                              =b"Saturation"
@@ -217,10 +217,8 @@ class SdCard:
 		return result
 
 	@staticmethod
-	def is_not_enough_space(low):
-		""" Indicates if remaining space is not sufficient """
-		free = SdCard.get_free_size()
-		total = SdCard.get_max_size()
+	def get_threshold(low):
+		""" Return the minimal percent of free space """
 		if low:
 			if SdCard.is_available():
 				threshold = 5
@@ -231,6 +229,14 @@ class SdCard:
 				threshold = 8
 			else:
 				threshold = 25
+		return threshold
+
+	@staticmethod
+	def is_not_enough_space(low):
+		""" Indicates if remaining space is not sufficient """
+		free = SdCard.get_free_size()
+		total = SdCard.get_max_size()
+		threshold = SdCard.get_threshold(low)
 
 		if free < 0 or total < 0:
 			return True
@@ -240,6 +246,18 @@ class SdCard:
 		else:
 			return ((free * 100 // total) <= threshold)
 
+	@staticmethod
+	def get_missing_space(low):
+		""" Return the number of bytes to free to have sufficient remaining space """
+		free = SdCard.get_free_size()
+		total = SdCard.get_max_size()
+		if free < 0 or total < 0:
+			return 0
+		missing = max(32*1024*4, (total * SdCard.get_threshold(low)) // 100 + 1) - free
+		if missing < 0:
+			missing = 0
+		return missing
+
 	@staticmethod
 	def save(directory, filename, data):
 		""" Save file on sd card """
@@ -248,7 +266,7 @@ class SdCard:
 			file = None
 			if SdCard.is_not_enough_space(low=True) is False:
 				try:
-					file = SdCard.create_file(SdCard.get_mountpoint() + "/" + directory, filename, "w")
+					file = SdCard.create_file(SdCard.get_mountpoint() + "/" + directory, filename, "w" if type(data) == type("") else "wb")
 					file.write(data)
 					file.close()
 					result = True
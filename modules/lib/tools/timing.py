@@ -0,0 +1,111 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Lightweight measurement of the durations of the stages of a processing.
+Each stage keeps its last durations in microseconds in a ring allocated once,
+recording a duration allocates nothing, so the measurement can stay enabled in production.
+The percentiles are computed only when the statistics are requested. """
+import array
+import tools.strings
+try:
+	# pylint: disable=no-name-in-module
+	from time import ticks_us, ticks_diff
+except:
+	import time
+	_ticks_init = time.perf_counter()
+	def ticks_us():
+		""" Count microseconds elapsed from start, wraps like in micropython """
+		return int((time.perf_counter() - _ticks_init)*1000000) & 0x3FFFFFFF
+
+	def ticks_diff(end, start):
+		""" Difference of ticks taking into account the wrap around """
+		return ((end - start + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+RING_SIZE = 64
+
+class Stage:
+	""" Durations of one stage """
+	def __init__(self, name, size=RING_SIZE):
+		""" Constructor """
+		self.name      = name
+		self.durations = array.array("I", [0]*size)
+		self.reset()
+
+	def reset(self):
+		""" Clear the durations """
+		self.position = 0
+		self.count    = 0
+		self.maximum  = 0
+
+	def add(self, duration):
+		""" Add a duration in microseconds """
+		if duration < 0:
+			duration = 0
+		self.durations[self.position] = duration
+		self.position += 1
+		if self.position >= len(self.durations):
+			self.position = 0
+		self.count += 1
+		if duration > self.maximum:
+			self.maximum = duration
+
+	def stop(self, start):
+		""" Add the duration elapsed since the start (ticks_us) """
+		self.add(ticks_diff(ticks_us(), start))
+
+	def get_percentiles(self):
+		""" Return the median and the 95th percentile of the last durations, and the maximal duration since the reset """
+		length = min(self.count, len(self.durations))
+		if length == 0:
+			return 0, 0, 0
+		durations = sorted(self.durations[:length])
+		return durations[length//2], durations[min(length-1, (length*95)//100)], self.maximum
+
+class Timing:
+	""" Registry of the stages measured """
+	stages = []
+	names  = {}
+
+	@staticmethod
+	def get(name):
+		""" Get the stage, it is created at the first call """
+		stage = Timing.names.get(name, None)
+		if stage is None:
+			stage = Stage(name)
+			Timing.names[name] = stage
+			Timing.stages.append(stage)
+		return stage
+
+	@staticmethod
+	def start():
+		""" Return the ticks at the start of a stage """
+		return ticks_us()
+
+	@staticmethod
+	def stop(name, start):
+		""" Add the duration of the stage since the start """
+		Timing.get(name).stop(start)
+
+	@staticmethod
+	def reset():
+		""" Clear the durations of all stages """
+		for stage in Timing.stages:
+			stage.reset()
+
+	@staticmethod
+	def to_dict():
+		""" Return the statistics {stage:[p50, p95, max, count],...} in microseconds """
+		result = {}
+		for stage in Timing.stages:
+			p50, p95, maximum = stage.get_percentiles()
+			result[stage.name] = [p50, p95, maximum, stage.count]
+		return result
+
+	@staticmethod
+	def get_statistics(separator=b", "):
+		""" Return the statistics of all stages : p50/p95/max in milliseconds """
+		result = []
+		for stage in Timing.stages:
+			p50, p95, maximum = stage.get_percentiles()
+			result.append(b"%s %d.%d/%d.%d/%d.%d ms"%(tools.strings.tobytes(stage.name), p50//1000, (p50%1000)//100, p95//1000, (p95%1000)//100, maximum//1000, (maximum%1000)//100))
+		return separator.join(result)
@@ -23,6 +23,8 @@ value_suspended = "suspended"
 motion_detection      = "motion/detection"
 motion_detected       = "motion/detected"
 motion_image          = "motion/image"
+motion_event          = "motion/event"
+motion_timing         = "motion/timing"
 login                 = "login"
 presence_detection    = "presence/detection"
 presence_detected     = "presence/detected"
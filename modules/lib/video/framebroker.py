@@ -0,0 +1,143 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Broker of the images captured by the camera.
+The motion detection and the streaming share the camera : the broker does the captures,
+keeps the last image with its sequence number, and each consumer takes the images at its own rate.
+While the motion detection captures, the streaming reuses its images instead of reserving the camera,
+so watching the live view no longer stops the motion detection.
+A single image (snapshot) is taken from the last image when it is recent enough,
+several clients polling the snapshot cost one capture per period, not one per client.
+The last image is released when it is older than the maximal age of snapshot and no consumer is left. """
+import time
+import uasyncio
+import video.video
+import video.quality
+import tools.strings
+import tools.tasking
+
+# Duration in seconds after which the motion detection is considered stopped
+MOTION_DURATION = 3
+
+class FrameBroker:
+	""" Last image captured, shared between the consumers of the camera """
+	image       = [None]
+	sequence    = [0]
+	timestamp   = [0]
+	ticks       = [0]
+	wanted_time = [0]
+	consumers   = [0]
+	motion_time = [0]
+	event       = [None]
+	expiring    = [False]
+
+	@staticmethod
+	def get_event():
+		""" Get the event set at each new image """
+		if FrameBroker.event[0] is None:
+			FrameBroker.event[0] = uasyncio.Event()
+		return FrameBroker.event[0]
+
+	@staticmethod
+	def publish(image):
+		""" Set the last image captured """
+		FrameBroker.image[0] = image
+		FrameBroker.sequence[0] += 1
+		FrameBroker.timestamp[0] = int(time.time())
+		FrameBroker.ticks[0] = tools.strings.ticks()
+		FrameBroker.get_event().set()
+
+	@staticmethod
+	def capture():
+		""" Capture a jpeg image, it becomes the last image """
+		image = video.video.Camera.capture()
+		if image is not None:
+			FrameBroker.publish(image)
+		return image
+
+	@staticmethod
+	def motion():
+		""" Capture the motion informations for the motion detection, its image becomes the last image if it is consumed """
+		motion_ = video.video.Camera.motion()
+		FrameBroker.motion_time[0] = time.time()
+		if motion_ is not None and (FrameBroker.consumers[0] > 0 or FrameBroker.wanted_time[0] + MOTION_DURATION >= FrameBroker.motion_time[0]):
+			FrameBroker.publish(motion_.get_image())
+		return motion_
+
+	@staticmethod
+	def is_motion_capturing():
+		""" Indicates if the motion detection captures the images """
+		return FrameBroker.motion_time[0] + MOTION_DURATION >= time.time()
+
+	@staticmethod
+	def subscribe():
+		""" Add a consumer of the images captured by the motion detection """
+		FrameBroker.consumers[0] += 1
+
+	@staticmethod
+	def unsubscribe():
+		""" Remove a consumer, the last image is released with the last consumer """
+		if FrameBroker.consumers[0] > 0:
+			FrameBroker.consumers[0] -= 1
+		if FrameBroker.consumers[0] == 0:
+			FrameBroker.image[0] = None
+
+	@staticmethod
+	def get_last():
+		""" Return the last image and its sequence number """
+		return FrameBroker.image[0], FrameBroker.sequence[0]
+
+	@staticmethod
+	def get_age():
+		""" Return the age in milliseconds of the last image, None if no image """
+		if FrameBroker.image[0] is None:
+			return None
+		return tools.strings.ticks() - FrameBroker.ticks[0]
+
+	@staticmethod
+	async def get_recent(max_age, quality=None):
+		""" Return the last image, its sequence number and its time if it is younger than the max age in milliseconds.
+		Otherwise the next image of the motion detection is waited, or an image is captured if the motion detection is stopped """
+		FrameBroker.wanted_time[0] = time.time()
+		age = FrameBroker.get_age()
+		if age is None or age < 0 or age > max_age:
+			if FrameBroker.is_motion_capturing():
+				await FrameBroker.wait(FrameBroker.sequence[0])
+			# The camera is reserved without suspension of motion detection
+			elif await video.video.Camera.reserve(FrameBroker, timeout=1):
+				try:
+					if video.video.Camera.open():
+						video.quality.Quality.apply(quality)
+						FrameBroker.capture()
+				finally:
+					await video.video.Camera.unreserve(FrameBroker)
+		result = FrameBroker.image[0], FrameBroker.sequence[0], FrameBroker.timestamp[0]
+		if FrameBroker.expiring[0] is False and FrameBroker.image[0] is not None:
+			FrameBroker.expiring[0] = True
+			tools.tasking.Tasks.create_task(FrameBroker.expire(max_age))
+		return result
+
+	@staticmethod
+	async def expire(max_age):
+		""" Release the last image when it is older than the max age in milliseconds and no consumer is left """
+		try:
+			while FrameBroker.image[0] is not None and FrameBroker.consumers[0] == 0:
+				age = FrameBroker.get_age()
+				if age < 0 or age >= max_age:
+					FrameBroker.image[0] = None
+				else:
+					await uasyncio.sleep_ms(max_age - age + 1)
+		finally:
+			FrameBroker.expiring[0] = False
+
+	@staticmethod
+	async def wait(sequence, timeout=1):
+		""" Wait an image more recent than the sequence number, return the last image and its sequence number """
+		if FrameBroker.sequence[0] == sequence:
+			event = FrameBroker.get_event()
+			event.clear()
+			try:
+				await uasyncio.wait_for(event.wait(), timeout)
+			except:
+				pass
+		return FrameBroker.image[0], FrameBroker.sequence[0]
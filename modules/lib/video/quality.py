@@ -0,0 +1,169 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Adaptive JPEG quality of the camera.
+Each consumer of the camera (motion detection, streaming, snapshot) has its own controller,
+which targets a size budget per image, given in bytes per image or in bytes per second.
+The sizes of images are smoothed, and the quality changes only when the smoothed size leaves a band around the budget,
+so the quality does not oscillate. The consumers share the camera : the quality applied is the most compressed
+of the qualities required by the consumers in activity, so each consumer stays within its budget. """
+import time
+import video.video
+
+# Weight of the last size in the smoothed size (1/SMOOTHING)
+SMOOTHING  = 4
+# Band around the budget without change of quality (1/HYSTERESIS of budget)
+HYSTERESIS = 8
+# Number of images ignored after a change of quality, the time that the smoothed size follows the change
+HOLD       = 2
+# Duration in seconds after which a consumer no longer using the camera is ignored
+ACTIVE_DURATION = 5
+# Range of camera quality, 0 is the best quality (the biggest images)
+QUALITY_BEST  = 0
+QUALITY_WORST = 63
+
+class QualityController:
+	""" Quality of one consumer of the camera """
+	def __init__(self, name, quality=25):
+		""" Constructor """
+		self.name     = name
+		self.quality  = quality
+		self.last_use = 0
+		self.configure()
+
+	def configure(self, frame_budget=0, rate_budget=0, fps=10, maximum_size=0, best=QUALITY_BEST, worst=QUALITY_WORST):
+		""" Configure the budget of consumer
+		frame_budget : maximal bytes per image (0 = no limit)
+		rate_budget  : maximal bytes per second (0 = no limit)
+		fps          : images per second expected, used to convert the rate budget into bytes per image
+		maximum_size : size never exceeded, the quality is degraded at once if an image is bigger (0 = no limit)
+		best, worst  : range of quality allowed """
+		self.frame_budget = frame_budget
+		self.rate_budget  = rate_budget
+		self.fps          = fps
+		self.maximum_size = maximum_size
+		self.best         = best
+		self.worst        = worst
+		self.average      = 0
+		self.hold         = 0
+		self.set_quality(self.quality)
+
+	def get_budget(self):
+		""" Return the budget in bytes per image (0 = no limit) """
+		budget = self.frame_budget
+		if self.rate_budget > 0:
+			rate = self.rate_budget // max(1, self.fps)
+			if budget == 0 or rate < budget:
+				budget = rate
+		return budget
+
+	def set_quality(self, quality):
+		""" Change the quality of consumer, return True if it changed """
+		if quality < self.best:
+			quality = self.best
+		if quality > self.worst:
+			quality = self.worst
+		if quality != self.quality:
+			self.quality = quality
+			# The smoothed size restarts with the next image
+			self.average = 0
+			self.hold    = HOLD
+			return True
+		return False
+
+	def is_active(self, now=None):
+		""" Indicates if the consumer used the camera recently """
+		if now is None:
+			now = time.time()
+		return self.last_use + ACTIVE_DURATION >= now
+
+	def release(self):
+		""" The consumer no longer uses the camera, its quality is ignored """
+		self.last_use = 0
+
+	def update(self, size):
+		""" Add the size of the image captured, return True if the quality of consumer changed """
+		self.last_use = time.time()
+		if self.average == 0:
+			self.average = size
+		else:
+			self.average += (size - self.average) // SMOOTHING
+
+		quality = self.quality
+		budget  = self.get_budget()
+		if self.maximum_size > 0 and size > self.maximum_size:
+			# The image is too big, no smoothing
+			quality += 2
+		elif budget > 0:
+			if self.hold > 0:
+				self.hold -= 1
+			else:
+				margin = budget // HYSTERESIS
+				if self.average > budget + margin:
+					# The further above the budget, the bigger the step
+					quality += min(4, 1 + ((self.average - budget) * 2) // budget)
+				elif self.average < budget - margin:
+					# The images are smaller only because an other consumer requires a more compressed quality
+					if Quality.current[0] is None or Quality.current[0] <= self.quality:
+						quality -= 1
+		return self.set_quality(quality)
+
+	def to_dict(self):
+		""" Return the state of consumer """
+		return {"quality":self.quality, "size":self.average, "budget":self.get_budget(), "active":self.is_active()}
+
+class Quality:
+	""" Coordination of the consumers sharing the camera """
+	controllers = {}
+	current = [None]
+
+	@staticmethod
+	def get(name, quality=25):
+		""" Get the controller of consumer, it is created at the first call """
+		controller = Quality.controllers.get(name, None)
+		if controller is None:
+			controller = QualityController(name, quality)
+			Quality.controllers[name] = controller
+		return controller
+
+	@staticmethod
+	def get_quality():
+		""" Return the quality required by the consumers in activity, None if no consumer """
+		result = None
+		now = time.time()
+		for controller in Quality.controllers.values():
+			if controller.is_active(now):
+				if result is None or controller.quality > result:
+					result = controller.quality
+		return result
+
+	@staticmethod
+	def apply(controller=None):
+		""" Set on the camera the quality required by the consumers, the controller given uses the camera now """
+		if controller is not None:
+			controller.last_use = time.time()
+		quality = Quality.get_quality()
+		if quality is not None and quality != Quality.current[0]:
+			# The change of quality keeps the indicator of configuration modification, the motion detection must still restore its configuration
+			video.video.Camera.quality(quality, video.video.Camera.is_modified())
+			Quality.current[0] = quality
+		return quality
+
+	@staticmethod
+	def force(quality):
+		""" Change temporarily the quality of camera, the quality of consumers is restored at the next apply """
+		video.video.Camera.quality(quality, video.video.Camera.is_modified())
+		Quality.current[0] = quality
+
+	@staticmethod
+	def invalidate():
+		""" Indicates that the quality of camera was changed outside, it will be set at the next apply """
+		Quality.current[0] = None
+
+	@staticmethod
+	def to_dict():
+		""" Return the state of all consumers """
+		result = {}
+		for name, controller in Quality.controllers.items():
+			result[name] = controller.to_dict()
+		return result
@@ -0,0 +1,408 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Timelapse recorder.
+An image is taken every period from the frame broker and appended to the container of the day.
+Each image is preceded by a small header (magic, timestamp, size), so a single append is written per image,
+the offset and the timestamp of each image are also appended to the index file of the day,
+so opening a day reads the index and only the headers of images not yet indexed.
+A day can be downloaded as an avi file (mjpeg with its index, so it can be seeked by the players),
+or image by image. The image of the motion detection is reused when it captures, otherwise an image
+is captured with the current configuration of camera, so the motion detection is never reconfigured. """
+import time
+import struct
+import array
+import uos
+import tools.jsonconfig
+import tools.logger
+import tools.tasking
+import tools.sdcard
+import tools.filesystem
+import tools.strings
+import tools.date
+import video.framebroker
+
+TIMELAPSE_DIRECTORY = "timelapse"
+TIMELAPSE_EXTENSION = ".tlp"
+TIMELAPSE_INDEX     = ".tli"
+TIMELAPSE_MAGIC     = b"TLPS"
+# magic, timestamp, size of image
+FRAME_HEADER        = "<4sII"
+# offset, timestamp of image
+INDEX_RECORD        = "<II"
+# Minimal period in seconds between two images
+MIN_PERIOD          = 10
+# Maximal age in milliseconds of the image taken
+MAX_AGE             = 2000
+# Number of images per second of the avi downloaded
+AVI_FPS             = 10
+# Number of records of avi index written at once
+AVI_INDEX_STEP      = 64
+# Size of the parts of images sent
+AVI_STEP            = 1440*10
+
+class TimelapseConfig(tools.jsonconfig.JsonConfig):
+	""" Timelapse configuration """
+	def __init__(self):
+		""" Constructor """
+		tools.jsonconfig.JsonConfig.__init__(self)
+		self.activated  = False
+		self.period     = 60         # Period in seconds between two images
+		self.start_time = 0          # Start of recording in seconds from midnight
+		self.end_time   = 86399      # End of recording in seconds from midnight
+		self.max_days   = 30         # Number of days kept (0 = no limit)
+
+	def is_scheduled(self, current_date=None):
+		""" Indicates if the images must be recorded at this time, the recording can cross midnight """
+		hour, minute, second = tools.date.local_time(current_date)[3:6]
+		current_time = hour * 3600 + minute * 60 + second
+		if self.start_time <= self.end_time:
+			return self.start_time <= current_time <= self.end_time
+		return current_time >= self.start_time or current_time <= self.end_time
+
+class TimelapseDay:
+	""" Container of the images of one day with its index """
+	header_size = struct.calcsize(FRAME_HEADER)
+	record_size = struct.calcsize(INDEX_RECORD)
+	def __init__(self, root, day):
+		""" Constructor, day : YYYY-MM-DD """
+		self.directory  = root + "/" + TIMELAPSE_DIRECTORY
+		self.day        = tools.strings.tostrings(day)
+		self.filename   = self.directory + "/" + self.day + TIMELAPSE_EXTENSION
+		self.index      = self.directory + "/" + self.day + TIMELAPSE_INDEX
+		self.offsets    = array.array("I")
+		self.timestamps = array.array("I")
+		self.end        = 0
+		self.file       = None
+
+	@staticmethod
+	def read_header(file, offset, size):
+		""" Read the header of image at the offset, return its timestamp and its length, or None if it is not valid """
+		if offset + TimelapseDay.header_size <= size:
+			file.seek(offset)
+			magic, timestamp, length = struct.unpack(FRAME_HEADER, file.read(TimelapseDay.header_size))
+			if magic == TIMELAPSE_MAGIC and offset + TimelapseDay.header_size + length <= size:
+				return timestamp, length
+		return None
+
+	def load_index(self, file, size):
+		""" Read the index file, return the offset of the end of the last image indexed, or 0 if the index is not usable """
+		result = 0
+		try:
+			if tools.filesystem.exists(self.index):
+				with open(self.index, "rb") as index:
+					data = index.read()
+				# A record partially written makes the index not usable
+				if len(data) % TimelapseDay.record_size != 0:
+					tools.logger.syslog("Timelapse index %s corrupted"%self.index)
+				else:
+					for position in range(0, len(data), TimelapseDay.record_size):
+						offset, timestamp = struct.unpack_from(INDEX_RECORD, data, position)
+						self.offsets.append(offset)
+						self.timestamps.append(timestamp)
+				if len(self.offsets) > 0:
+					# Only the last image is checked, the previous ones are before it in the container
+					header = TimelapseDay.read_header(file, self.offsets[-1], size)
+					if header is not None and header[0] == self.timestamps[-1]:
+						result = self.offsets[-1] + TimelapseDay.header_size + header[1]
+					else:
+						tools.logger.syslog("Timelapse index %s corrupted"%self.index)
+						self.offsets    = array.array("I")
+						self.timestamps = array.array("I")
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot read timelapse index %s"%self.index)
+			self.offsets    = array.array("I")
+			self.timestamps = array.array("I")
+		return result
+
+	def write_index(self, first, mode="ab"):
+		""" Write the records of index from the first image """
+		try:
+			with open(self.index, mode) as index:
+				for i in range(first, len(self.offsets)):
+					index.write(struct.pack(INDEX_RECORD, self.offsets[i], self.timestamps[i]))
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot write timelapse index %s"%self.index)
+
+	def load(self):
+		""" Read the index, then the headers of the images not indexed, an image partially written is ignored """
+		try:
+			if tools.filesystem.exists(self.filename):
+				with open(self.filename, "rb") as file:
+					file.seek(0, 2)
+					size = file.tell()
+					offset = self.load_index(file, size)
+					indexed = len(self.offsets)
+					while True:
+						header = TimelapseDay.read_header(file, offset, size)
+						if header is None:
+							break
+						self.offsets.append(offset)
+						self.timestamps.append(header[0])
+						offset += TimelapseDay.header_size + header[1]
+					self.end = offset
+					if offset < size:
+						tools.logger.syslog("Timelapse %s truncated"%self.filename)
+				# Add the images not indexed, or rebuild the index if it was not usable
+				if indexed < len(self.offsets):
+					self.write_index(indexed, "ab" if indexed > 0 else "wb")
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot read timelapse %s"%self.filename)
+		return self
+
+	def append(self, timestamp, image):
+		""" Append the image at the end of container, return True if success """
+		result = False
+		try:
+			if self.file is None:
+				if tools.filesystem.exists(self.filename):
+					self.file = open(self.filename, "r+b")
+				else:
+					self.file = tools.sdcard.SdCard.create_file(self.directory, self.day + TIMELAPSE_EXTENSION, "wb")
+			if self.file is not None:
+				# The end of an image partially written is overwritten
+				self.file.seek(self.end)
+				self.file.write(struct.pack(FRAME_HEADER, TIMELAPSE_MAGIC, timestamp, len(image)))
+				self.file.write(image)
+				self.file.flush()
+				self.offsets.append(self.end)
+				self.timestamps.append(timestamp)
+				self.end += TimelapseDay.header_size + len(image)
+				self.write_index(len(self.offsets) - 1)
+				result = True
+		except Exception as err:
+			tools.logger.syslog(err, "Cannot add image in timelapse %s"%self.filename)
+			self.close()
+		return result
+
+	def close(self):
+		""" Close the container """
+		if self.file is not None:
+			try:
+				self.file.close()
+			except Exception as err:
+				tools.logger.syslog(err)
+			self.file = None
+
+	def get_count(self):
+		""" Return the number of images """
+		return len(self.offsets)
+
+	def get_image(self, index):
+		""" Return the offset and the size of the jpeg image in the container """
+		offset = self.offsets[index]
+		if index + 1 < len(self.offsets):
+			end = self.offsets[index + 1]
+		else:
+			end = self.end
+		return offset + TimelapseDay.header_size, end - offset - TimelapseDay.header_size
+
+	def get_timestamps(self):
+		""" Return the list of timestamps of images """
+		return list(self.timestamps)
+
+class TimelapseAvi:
+	""" Avi file (mjpeg) of the images of one day, built on the fly from the container """
+	def __init__(self, day, fps=AVI_FPS):
+		""" Constructor """
+		self.day    = day
+		self.fps    = fps
+		# The images appended during the sending are ignored
+		self.count  = day.get_count()
+		self.movi   = 4
+		self.largest= 0
+		for index in range(self.count):
+			size = day.get_image(index)[1]
+			self.movi += 8 + size + (size & 1)
+			self.largest = max(self.largest, size)
+
+	def get_size(self):
+		""" Return the size of avi file """
+		return 12 + 200 + 8 + self.movi + 8 + 16*self.count
+
+	@staticmethod
+	def get_dimensions(file, offset, size):
+		""" Return the width and height read in the start of frame segment of jpeg image """
+		file.seek(offset)
+		data = file.read(min(size, 2048))
+		position = 2
+		while position + 9 <= len(data):
+			if data[position] != 0xFF:
+				break
+			marker = data[position + 1]
+			if marker in (0xC0, 0xC1, 0xC2):
+				height, width = struct.unpack(">HH", data[position + 5:position + 9])
+				return width, height
+			position += 2 + struct.unpack(">H", data[position + 2:position + 4])[0]
+		return 0, 0
+
+	def get_header(self, width, height):
+		""" Return the riff header, the stream header and the beginning of movie list """
+		period = 1000000//self.fps
+		return struct.pack("<4sI4s", b"RIFF", self.get_size() - 8, b"AVI ") + \
+			struct.pack("<4sI4s", b"LIST", 192, b"hdrl") + \
+			struct.pack("<4sI14I", b"avih", 56, period, self.largest * self.fps, 0, 0x10, self.count, 0, 1, self.largest, width, height, 0, 0, 0, 0) + \
+			struct.pack("<4sI4s", b"LIST", 116, b"strl") + \
+			struct.pack("<4sI4s4sIHHIIIIIIIIhhhh", b"strh", 56, b"vids", b"MJPG", 0, 0, 0, 0, 1, self.fps, 0, self.count, self.largest, 0xFFFFFFFF, 0, 0, 0, width, height) + \
+			struct.pack("<4sIIiiHH4sIiiII", b"strf", 40, 40, width, height, 1, 24, b"MJPG", width*height*3, 0, 0, 0, 0) + \
+			struct.pack("<4sI4s", b"LIST", self.movi, b"movi")
+
+	async def write(self, streamio):
+		""" Write the avi file in the stream """
+		result = 0
+		with open(self.day.filename, "rb") as file:
+			width, height = 0, 0
+			if self.count > 0:
+				width, height = TimelapseAvi.get_dimensions(file, *self.day.get_image(0))
+			result += await streamio.write(self.get_header(width, height))
+
+			buffer = bytearray(AVI_STEP)
+			for index in range(self.count):
+				offset, size = self.day.get_image(index)
+				result += await streamio.write(struct.pack("<4sI", b"00dc", size))
+				file.seek(offset)
+				while size > 0:
+					length = file.readinto(buffer if size >= AVI_STEP else memoryview(buffer)[:size])
+					if length <= 0:
+						break
+					result += await streamio.write(memoryview(buffer)[:length])
+					size -= length
+				if self.day.get_image(index)[1] & 1:
+					result += await streamio.write(b"\0")
+
+		# Index of images, the offsets are relative to the movie list
+		result += await streamio.write(struct.pack("<4sI", b"idx1", 16*self.count))
+		records = bytearray(16*AVI_INDEX_STEP)
+		position = 4
+		for first in range(0, self.count, AVI_INDEX_STEP):
+			last = min(self.count, first + AVI_INDEX_STEP)
+			for index in range(first, last):
+				size = self.day.get_image(index)[1]
+				struct.pack_into("<4sIII", records, (index - first)*16, b"00dc", 0x10, position, size)
+				position += 8 + size + (size & 1)
+			result += await streamio.write(memoryview(records)[:(last - first)*16])
+		return result
+
+class Timelapse:
+	""" Timelapse recorder task """
+	config = [None]
+	day    = [None]
+	last   = [0]
+	cleaned= [None]
+
+	@staticmethod
+	def get_config():
+		""" Reload configuration if it changed """
+		if Timelapse.config[0] is None:
+			Timelapse.config[0] = TimelapseConfig()
+			if Timelapse.config[0].load() is False:
+				Timelapse.config[0].save()
+		else:
+			Timelapse.config[0].refresh()
+		return Timelapse.config[0]
+
+	@staticmethod
+	def get_root():
+		""" Get the root path of sdcard and mount it """
+		if tools.sdcard.SdCard.mount():
+			return tools.sdcard.SdCard.get_mountpoint()
+		return None
+
+	@staticmethod
+	def get_day(day):
+		""" Get the container of day with its index, None if no sdcard """
+		day = tools.strings.tostrings(day)
+		current = Timelapse.day[0]
+		if current is not None and current.day == day:
+			return current
+		root = Timelapse.get_root()
+		if root:
+			return TimelapseDay(root, day).load()
+		return None
+
+	@staticmethod
+	def get_days():
+		""" Return the list of days recorded, the most recent first """
+		result = []
+		root = Timelapse.get_root()
+		if root:
+			try:
+				for name in uos.listdir(root + "/" + TIMELAPSE_DIRECTORY):
+					if name.endswith(TIMELAPSE_EXTENSION):
+						result.append(name[:-len(TIMELAPSE_EXTENSION)])
+			except OSError:
+				pass
+		result.sort(reverse=True)
+		return result
+
+	@staticmethod
+	def add(timestamp, image):
+		""" Append the image in the container of its day """
+		day = tools.strings.tostrings(tools.date.date_to_html(timestamp))
+		if Timelapse.day[0] is None or Timelapse.day[0].day != day:
+			Timelapse.close()
+			root = Timelapse.get_root()
+			if root is None:
+				return False
+			Timelapse.day[0] = TimelapseDay(root, day).load()
+		if tools.sdcard.SdCard.is_not_enough_space(low=True):
+			return False
+		return Timelapse.day[0].append(timestamp, image)
+
+	@staticmethod
+	def close():
+		""" Close the container of current day """
+		if Timelapse.day[0] is not None:
+			Timelapse.day[0].close()
+			Timelapse.day[0] = None
+
+	@staticmethod
+	async def capture():
+		""" Take a recent image from the frame broker, return the image and its timestamp, or None if the camera is not available """
+		try:
+			image, _, timestamp = await video.framebroker.FrameBroker.get_recent(MAX_AGE//2)
+			age = video.framebroker.FrameBroker.get_age()
+			if image is not None and age is not None and 0 <= age <= MAX_AGE:
+				return image, timestamp
+		except Exception as err:
+			tools.logger.syslog(err)
+		return None
+
+	@staticmethod
+	def remove_older(config, now):
+		""" Remove the days older than the days kept """
+		day = tools.date.date_to_html(now)
+		if config.max_days > 0 and Timelapse.cleaned[0] != day:
+			Timelapse.cleaned[0] = day
+			oldest = tools.strings.tostrings(tools.date.date_to_html(now - config.max_days*86400))
+			root = Timelapse.get_root()
+			for name in Timelapse.get_days() if root else []:
+				if name < oldest:
+					tools.logger.syslog("Remove timelapse %s"%name)
+					tools.filesystem.remove(root + "/" + TIMELAPSE_DIRECTORY + "/" + name + TIMELAPSE_EXTENSION)
+					if tools.filesystem.exists(root + "/" + TIMELAPSE_DIRECTORY + "/" + name + TIMELAPSE_INDEX):
+						tools.filesystem.remove(root + "/" + TIMELAPSE_DIRECTORY + "/" + name + TIMELAPSE_INDEX)
+
+	@staticmethod
+	async def task():
+		""" Internal periodic task """
+		await tools.tasking.Tasks.wait_resume(duration=1000, name="timelapse")
+		config = Timelapse.get_config()
+		now = int(time.time())
+		if config.activated:
+			period = max(MIN_PERIOD, config.period)
+			# The images are aligned on the period
+			if now // period != Timelapse.last[0] // period and config.is_scheduled(now):
+				Timelapse.last[0] = now
+				captured = await Timelapse.capture()
+				if captured is not None:
+					Timelapse.add(captured[1], captured[0])
+				Timelapse.remove_older(config, now)
+		else:
+			Timelapse.close()
+		return True
+
+	@staticmethod
+	def start():
+		""" Start timelapse task """
+		tools.tasking.Tasks.create_monitor(Timelapse.task)
@@ -32,6 +32,10 @@ class CameraConfig(tools.jsonconfig.JsonConfig):
 		self.hmirror    = False
 		self.vflip      = False
 		self.flash_level = 0
+		# Bandwidth of streaming in kilobytes per second (0 = fixed quality)
+		self.bandwidth  = 0
+		# Maximal age in milliseconds of the snapshot image reused
+		self.snapshot_age = 1000
 
 class Reservation:
 	""" Manage the camera reservation """
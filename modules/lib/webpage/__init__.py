@@ -28,3 +28,4 @@ if tools.info.iscamera():
 	import webpage.camerapage
 	import webpage.historicpage
 	import webpage.motionpage
+	import webpage.timelapsepage
@@ -6,10 +6,13 @@ from htmltemplate          import *
 import webpage.mainpage
 import webpage.streamingpage
 import video.video
+import video.framebroker
+import video.quality
 import tools.lang
 import tools.info
 import tools.tasking
 import tools.features
+import tools.date
 
 @server.httpserver.HttpServer.add_route(b'/camera', menu=tools.lang.menu_camera, item=tools.lang.item_camera, available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.camera)
 async def camera_page(request, response, args):
@@ -32,6 +35,8 @@ async def camera_page(request, response, args):
 			webpage.streamingpage.Streaming.get_html(request),
 			ComboCmd(framesizes, text=tools.lang.resolution,  path=b"camera/configure", name=b"framesize"),
 			SliderCmd(           text=tools.lang.quality   ,  path=b"camera/configure", name=b"quality",    min=b"10", max=b"63",  step=b"1", value=b"%d"%config.quality),
+			SliderCmd(           text=tools.lang.streaming_bandwidth, path=b"camera/configure", name=b"bandwidth", min=b"0", max=b"1024", step=b"16", value=b"%d"%config.bandwidth),
+			SliderCmd(           text=tools.lang.snapshot_age, path=b"camera/configure", name=b"snapshot_age", min=b"0", max=b"10000", step=b"100", value=b"%d"%config.snapshot_age),
 			#SliderCmd(           text=tools.lang.brightness,  path=b"camera/configure", name=b"brightness", min=b"-2", max=b"2" ,  step=b"1", value=b"%d"%config.brightness),
 			#SliderCmd(           text=tools.lang.contrast  ,  path=b"camera/configure", name=b"contrast"  , min=b"-2", max=b"2" ,  step=b"1", value=b"%d"%config.contrast),
 			#SliderCmd(           text=tools.lang.saturation,  path=b"camera/configure", name=b"saturation", min=b"-2", max=b"2" ,  step=b"1", value=b"%d"%config.saturation),
@@ -85,6 +90,30 @@ async def camera_configure(request, response, args):
 	webpage.streamingpage.Streaming.activity()
 	await response.send_ok()
 
+@server.httpserver.HttpServer.add_route(b'/camera/snapshot.jpg', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.camera)
+async def camera_snapshot(request, response, args):
+	""" Send the last image captured if it is recent enough, otherwise a new image.
+	An image not modified since the previous request is not sent again """
+	try:
+		config = video.video.Camera.get_config()
+		quality = video.quality.Quality.get("snapshot", config.quality)
+		quality.configure(best=config.quality, worst=config.quality)
+		image, sequence, timestamp = await video.framebroker.FrameBroker.get_recent(config.snapshot_age, quality)
+		if image is None:
+			await response.send_error(status=b"503")
+		else:
+			etag = b'"%x-%x"'%(timestamp, sequence)
+			last_modified = tools.date.date_to_http(timestamp)
+			age = video.framebroker.FrameBroker.get_age() or 0
+			headers = {b"ETag":etag, b"Last-Modified":last_modified, b"Cache-Control":b"max-age=%d"%(max(0, config.snapshot_age - age)//1000)}
+			if_none_match = request.get_header(b"If-None-Match")
+			if if_none_match == etag or (if_none_match is None and request.get_header(b"If-Modified-Since") == last_modified):
+				await response.send(status=b"304", headers=headers)
+			else:
+				await response.send_buffer(b"snapshot.jpg", image, mime_type=b"image/jpeg", headers=headers)
+	except Exception as err:
+		await response.send_not_found(err)
+
 @server.httpserver.HttpServer.add_route(b'/camera/onoff', menu=tools.lang.menu_camera, item=tools.lang.item_onoff, available=tools.info.iscamera() and tools.features.features.camera)
 async def camera_on_off(request, response, args):
 	""" Camera command page """
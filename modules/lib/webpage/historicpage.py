@@ -12,6 +12,8 @@ import tools.lang
 import tools.info
 import tools.strings
 import tools.tasking
+import tools.filesystem
+import tools.date
 
 def get_days_pagination(last_days, request):
 	""" Get the pagination html part of days """
@@ -78,10 +80,19 @@ async def historic(request, response, args):
 			pagination_begin,
 			Tag(b"""
 
+			<div class="row pb-2">
+				<div class="col-lg-4">
+					<canvas id="heatmap" class="w-100"></canvas>
+					<button type="button" class="btn btn-outline-primary btn-sm" onclick="load_heatmap(1)">%s</button>
+					<button type="button" class="btn btn-outline-primary btn-sm" onclick="load_heatmap(7)">%s</button>
+				</div>
+			</div>
+
 			<div class="modal" id="zoom_window">
 				<div class="modal-dialog modal-fullscreen">
 					<div class="modal-content">
 						<div class="modal-header">
+							<a id="zoom_clip" class="btn btn-outline-primary btn-sm" href="#">%s</a>
 							<button type="button" class="btn-close" data-bs-dismiss="modal"></button>
 						</div>
 						<div class="modal-body" >
@@ -101,6 +112,9 @@ async def historic(request, response, args):
 			var last_id = 0;
 			var historic_request = new XMLHttpRequest();
 			var image_request    = new XMLHttpRequest();
+			var heatmap_request  = new XMLHttpRequest();
+			var heatmap          = null;
+			var heatmap_image    = null;
 
 			const MOTION_FILENAME =0;
 			const MOTION_WIDTH    =1;
@@ -112,7 +126,7 @@ async def historic(request, response, args):
 			function load_historic()
 			{
 				historic_request.onreadystatechange = historic_loaded;
-				historic_request.open("GET","historic/historic.json",true);
+				historic_request.open("GET","historic/historic.json?day=" + current_day.replaceAll("/","-"),true);
 				historic_request.send();
 			}
 
@@ -135,7 +149,7 @@ async def historic(request, response, args):
 				{
 					var motion = historic[last_id];
 					image_request.onreadystatechange = image_loaded;
-					image_request.open("GET","/historic/images/" + motion[MOTION_FILENAME],true);
+					image_request.open("GET","/historic/images/" + motion[MOTION_FILENAME] + "?thumb=1",true);
 					image_request.send();
 				}
 			}
@@ -222,6 +236,7 @@ async def historic(request, response, args):
 										view.width     = motion[MOTION_WIDTH ] * get_quality();
 										view.height    = motion[MOTION_HEIGHT] * get_quality();
 										destCtx.drawImage(canvas, 0, 0);
+										load_zoom(canvas.id);
 									};
 
 							var image = new Image();
@@ -233,6 +248,10 @@ async def historic(request, response, args):
 						if (last_id == 0)
 						{
 							document.getElementById('motions').replaceChildren(div);
+
+							// The heatmap is drawn over the last image of day
+							heatmap_image = image;
+							load_heatmap(1);
 						}
 						else
 						{
@@ -280,13 +299,36 @@ async def historic(request, response, args):
 				}
 			}
 
-			function show_motion(id, image)
+			// The gallery shows the thumbnails, the zoom loads the full image
+			function load_zoom(id)
+			{
+				var zoom_request = new XMLHttpRequest();
+				zoom_request.onreadystatechange = function()
+				{
+					if (zoom_request.readyState === XMLHttpRequest.DONE && zoom_request.status === 200)
+					{
+						var image = new Image();
+							image.src    = 'data:image/jpeg;base64,' + zoom_request.response;
+							image.onload = function(){show_motion(id, image, document.getElementById('zoom_image'));};
+					}
+				};
+				zoom_request.open("GET","/historic/images/" + historic[id][MOTION_FILENAME],true);
+				zoom_request.send();
+
+				// The clip containing the image, not found if the image was saved as a jpeg file
+				document.getElementById('zoom_clip').href = "/historic/clip/" + historic[id][MOTION_FILENAME];
+			}
+
+			function show_motion(id, image, canvas)
 			{
 				var x;
 				var y;
 
 				var motion = historic[id];
-				var canvas = document.getElementById(id);
+				if (canvas === undefined)
+				{
+					canvas = document.getElementById(id);
+				}
 				var ctx = canvas.getContext('2d');
 
 				var squarex = motion[MOTION_SQUAREX] * get_quality();
@@ -294,7 +336,8 @@ async def historic(request, response, args):
 				var maxx = (motion[MOTION_WIDTH] /squarex) * get_quality();
 				var maxy = (motion[MOTION_HEIGHT]/squarey) * get_quality();
 
-				ctx.drawImage(image, 0, 0, motion[MOTION_WIDTH ]  , motion[MOTION_HEIGHT], 0, 0, motion[MOTION_WIDTH ] * get_quality(), motion[MOTION_HEIGHT] * get_quality());
+				// The thumbnail can be smaller than the image
+				ctx.drawImage(image, 0, 0, motion[MOTION_WIDTH ] * get_quality(), motion[MOTION_HEIGHT] * get_quality());
 
 				ctx.strokeStyle = "red";
 				ctx.lineWidth =  1 * get_quality();
@@ -349,6 +392,61 @@ async def historic(request, response, args):
 				ctx.fillText(get_name(motion[MOTION_FILENAME]),  3, (motion[MOTION_HEIGHT] * get_quality() - 5*get_quality() ));
 			}
 
+			function load_heatmap(days)
+			{
+				heatmap_request.onreadystatechange = heatmap_loaded;
+				heatmap_request.open("GET","historic/heatmap.json?day=" + current_day.replaceAll("/","-") + "&days=" + days,true);
+				heatmap_request.send();
+			}
+
+			function heatmap_loaded()
+			{
+				if (heatmap_request.readyState === XMLHttpRequest.DONE)
+				{
+					if (heatmap_request.status === 200)
+					{
+						heatmap = JSON.parse(heatmap_request.responseText);
+						show_heatmap();
+					}
+				}
+			}
+
+			// Draw the number of detections of each square, the most red squares are the most frequently changed
+			function show_heatmap()
+			{
+				var x;
+				var y;
+				var canvas = document.getElementById("heatmap");
+				var ctx = canvas.getContext('2d');
+
+				canvas.width  = heatmap.width  * heatmap.squarex;
+				canvas.height = heatmap.height * heatmap.squarey;
+				ctx.fillStyle = "black";
+				ctx.fillRect(0, 0, canvas.width, canvas.height);
+				if (heatmap_image != null)
+				{
+					ctx.drawImage(heatmap_image, 0, 0, canvas.width, canvas.height);
+				}
+
+				for (y = 0; y < heatmap.height; y ++)
+				{
+					for (x = 0; x < heatmap.width; x ++)
+					{
+						var count = heatmap.cells[y*heatmap.width + x];
+						if (count > 0)
+						{
+							ctx.fillStyle = "rgba(255,0,0," + (0.1 + (0.7*count)/heatmap.max) + ")";
+							ctx.fillRect(x*heatmap.squarex, y*heatmap.squarey, heatmap.squarex, heatmap.squarey);
+						}
+					}
+				}
+
+				var font_size = 30;
+				ctx.font = font_size + "px monospace";
+				ctx.fillStyle = 'rgba(255,255,255,0.7)';
+				ctx.fillText(heatmap.day + " (" + heatmap.days + ") " + heatmap.count + " / " + heatmap.max, 3, canvas.height - 5);
+			}
+
 			// Convert the filename into text displayed
 			function get_name(filename)
 			{
@@ -380,7 +478,7 @@ async def historic(request, response, args):
 			}
 			</script>
 			<div id="motions" class="row"></div>
-			"""%(current_day)),
+			"""%(tools.lang.heatmap_day, tools.lang.heatmap_week, tools.lang.download_clip, current_day)),
 			Br(),
 			pagination_end
 		]
@@ -391,22 +489,120 @@ async def historic(request, response, args):
 
 @server.httpserver.HttpServer.add_route(b'/historic/historic.json', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
 async def historic_json(request, response, args):
-	""" Send historic json file """
+	""" Send historic json file.
+	Optional parameters : since=<timestamp>, day=<YYYY-MM-DD>, limit=<count>.
+	The entity tag changes each time the historic is modified, then an unchanged historic is not sent again """
+	tools.tasking.Tasks.slow_down()
+	try:
+		etag = motion.historic.Historic.get_etag()
+		headers = {b"ETag":etag, b"Cache-Control":b"no-cache"}
+		if request.get_header(b"If-None-Match") == etag:
+			await response.send(status=b"304", headers=headers)
+		else:
+			since = request.params.get(b"since", None)
+			limit = request.params.get(b"limit", None)
+			await motion.historic.Historic.send_items(response,
+				since   = int(since) if since else None,
+				day     = request.params.get(b"day", None),
+				limit   = int(limit) if limit else None,
+				headers = headers)
+	except Exception as err:
+		await response.send_not_found(err)
+
+def get_int(request, name):
+	""" Get the integer parameter of request, None if not set """
+	value = request.params.get(name, None)
+	if value:
+		return int(value)
+	return None
+
+@server.httpserver.HttpServer.add_route(b'/historic/query.json', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
+async def historic_query(request, response, args):
+	""" Search the motion detections in the day indexes, from the most recent to the older.
+	Optional parameters : start=<timestamp>, end=<timestamp>, min_diffs=<count>, zone=<hexadecimal words separated by commas>,
+	zone_min=<count>, motion_id=<identifier>, before=<cursor of next page>, limit=<count>.
+	Send {"items":[[filename, width, height, diffs, squarex, squarey, timestamp, motion_id, count],...], "next":<cursor>, "scanned":<count>} """
+	import motion.historicquery
+	tools.tasking.Tasks.slow_down()
+	try:
+		query = motion.historicquery.HistoricQuery(
+			start     = get_int(request, b"start"),
+			end       = get_int(request, b"end"),
+			min_diffs = get_int(request, b"min_diffs") or 0,
+			zone      = motion.historicquery.HistoricQuery.parse_zone(request.params.get(b"zone", None)),
+			zone_min  = get_int(request, b"zone_min") or 1,
+			motion_id = get_int(request, b"motion_id"),
+			before    = request.params.get(b"before", None),
+			limit     = get_int(request, b"limit"))
+		await response.send_json(await motion.historic.Historic.query(query), depth=2, headers={b"Cache-Control":b"no-cache"})
+	except Exception as err:
+		await response.send_not_found(err)
+
+async def send_heatmap(request, response, binary):
+	""" Send the heatmap of motion detections, the number of images where each square changed.
+	Parameters : day=<YYYY-MM-DD> (last day), days=<count> (1 by default, 7 for the rolling week) """
+	tools.tasking.Tasks.slow_down()
+	try:
+		days = int(request.params.get(b"days", 1))
+		heatmap = await motion.historic.Historic.get_heatmap(request.params.get(b"day", tools.date.date_to_bytes()[:10]), days)
+		if binary:
+			await response.send_buffer(b"heatmap.bin", heatmap.to_bytes(), mime_type=b"application/octet-stream", headers={b"Cache-Control":b"no-cache"})
+		else:
+			await response.send_json(heatmap.to_dict(days), headers={b"Cache-Control":b"no-cache"})
+	except Exception as err:
+		await response.send_not_found(err)
+
+@server.httpserver.HttpServer.add_route(b'/historic/heatmap.json', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
+async def historic_heatmap_json(request, response, args):
+	""" Send the heatmap as json : {"day","days","width","height","squarex","squarey","count","max","cells"} """
+	await send_heatmap(request, response, False)
+
+@server.httpserver.HttpServer.add_route(b'/historic/heatmap.bin', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
+async def historic_heatmap_bin(request, response, args):
+	""" Send the heatmap as binary : header <4sHHHHHI (magic, version, squares width, squares height, square x, square y, images count)
+	followed by the 32 bits counters of squares """
+	await send_heatmap(request, response, True)
+
+@server.httpserver.HttpServer.add_route(b'/historic/events.json', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
+async def historic_events(request, response, args):
+	""" Send the motion events of day : [motion_id, start, end, images, peak, best image timestamp, best image index].
+	Parameter : day=<YYYY-MM-DD> """
 	tools.tasking.Tasks.slow_down()
 	try:
-		await response.send_buffer(b"historic.json", await motion.historic.Historic.get_json())
+		events = await motion.historic.Historic.get_events(request.params.get(b"day", tools.date.date_to_bytes()[:10]))
+		await response.send_json(events, headers={b"Cache-Control":b"no-cache"})
 	except Exception as err:
 		await response.send_not_found(err)
 
+async def send_image(response, filename, base64, thumb=False):
+	""" Send the jpeg file of the historic image, or its part in the clip of the motion event.
+	If thumb is True, the thumbnail is sent if existing """
+	clip = None
+	existing = tools.filesystem.exists(filename)
+	if existing is False:
+		clip = await motion.historic.Historic.get_clip(filename)
+	thumbnail = None
+	if thumb:
+		thumbnail = motion.historic.Historic.get_thumbnail(filename, clip)
+	if thumbnail is not None:
+		await response.send_file(thumbnail, mime_type=b"image/jpeg", base64=base64, headers={b"Cache-Control":b"max-age=86400"})
+	elif existing:
+		await response.send_file(filename, base64=base64)
+	elif clip is not None:
+		clip_filename, offset, size = clip
+		await response.send_file(clip_filename, mime_type=b"image/jpeg", base64=base64, offset=offset, size=size)
+	else:
+		await response.send_not_found()
+
 @server.httpserver.HttpServer.add_route(b'/historic/images/.*', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
 async def historic_image(request, response, args):
-	""" Send historic image """
+	""" Send historic image, with the parameter thumb=1 the thumbnail is sent if existing """
 	tools.tasking.Tasks.slow_down()
 	reserved = await video.video.Camera.reserve(motion.historic.Historic, timeout=5, suspension=10)
 	try:
 		if reserved:
 			await motion.historic.Historic.acquire()
-			await response.send_file(tools.strings.tostrings(request.path[len("/historic/images/"):]), base64=True)
+			await send_image(response, tools.strings.tostrings(request.path[len("/historic/images/"):]), base64=True, thumb=request.params.get(b"thumb", b"0") == b"1")
 		else:
 			await response.send_not_found()
 	finally:
@@ -422,7 +618,27 @@ async def download_image(request, response, args):
 	try:
 		if reserved:
 			await motion.historic.Historic.acquire()
-			await response.send_file(tools.strings.tostrings(request.path[len("/historic/download/"):]), base64=False)
+			await send_image(response, tools.strings.tostrings(request.path[len("/historic/download/"):]), base64=False)
+		else:
+			await response.send_not_found()
+	finally:
+		if reserved:
+			await motion.historic.Historic.release()
+			await video.video.Camera.unreserve(motion.historic.Historic)
+
+@server.httpserver.HttpServer.add_route(b'/historic/clip/.*', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
+async def download_clip(request, response, args):
+	""" Download the clip containing the historic image """
+	tools.tasking.Tasks.slow_down()
+	reserved = await video.video.Camera.reserve(motion.historic.Historic, timeout=5, suspension=10)
+	try:
+		if reserved:
+			await motion.historic.Historic.acquire()
+			clip = await motion.historic.Historic.get_clip(tools.strings.tostrings(request.path[len("/historic/clip/"):]))
+			if clip is not None:
+				await response.send_file(clip[0], base64=False)
+			else:
+				await response.send_not_found()
 		else:
 			await response.send_not_found()
 	finally:
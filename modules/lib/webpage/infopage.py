@@ -9,12 +9,13 @@ import tools.info
 import tools.lang
 import tools.builddate
 import tools.date
+import tools.features
+import tools.timing
 
 @server.httpserver.HttpServer.add_route(b'/', menu=tools.lang.menu_system, item=tools.lang.item_information)
 async def index(request, response, args):
 	""" Function define the web page to display all informations of the board """
-	page = webpage.mainpage.main_frame(request, response, args, tools.lang.device_informations,
-		Form([
+	informations = [
 			Edit(text=tools.lang.date,             value=tools.date.date_to_bytes(),                disabled=True),
 			Edit(text=tools.lang.build_date,       value=tools.builddate.date,                      disabled=True),
 			Edit(text=tools.lang.uptime,           value=tools.info.uptime(tools.lang.days),        disabled=True),
@@ -22,5 +23,15 @@ async def index(request, response, args):
 			Edit(text=tools.lang.memory_label,     value=tools.info.meminfo(),                      disabled=True),
 			Edit(text=tools.lang.flash_label,      value=tools.info.flashinfo(),                    disabled=True),
 			Edit(text=tools.lang.signal_strength,  value=wifi.station.Station.get_signal_strength_bytes(), disabled=True),
-		]))
+		]
+	if tools.info.iscamera() and tools.features.features.motion:
+		import motion.historicwriter
+		import motion.motionscheduler
+		informations.append(Edit(text=tools.lang.sd_writer_label, value=motion.historicwriter.HistoricWriter.get_statistics(), disabled=True))
+		informations.append(Edit(text=tools.lang.motion_polling_label, value=motion.motionscheduler.MotionScheduler.get_statistics(), disabled=True))
+		informations.append(Edit(text=tools.lang.motion_timing_label,  value=tools.timing.Timing.get_statistics(), disabled=True))
+	if tools.info.iscamera() and tools.features.features.camera:
+		import webpage.streamingpage
+		informations.append(Edit(text=tools.lang.streaming_viewers_label, value=webpage.streamingpage.Broadcaster.get_statistics(), disabled=True))
+	page = webpage.mainpage.main_frame(request, response, args, tools.lang.device_informations, Form(informations))
 	await response.send_page(page)
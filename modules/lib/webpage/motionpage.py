@@ -7,6 +7,7 @@ import webpage.mainpage
 import webpage.streamingpage
 import video.video
 import motion.motioncore
+import motion.motionscheduler
 import tools.lang
 import tools.info
 import tools.features
@@ -188,6 +189,14 @@ async def motion_page(request, response, args):
 			Switch(text=tools.lang.suspends_motion_detection,                name=b"suspend_on_presence",     checked=config.suspend_on_presence, disabled=disabled),
 			Switch(text=tools.lang.permanent_detection,                      name=b"permanent_detection",     checked=config.permanent_detection, disabled=disabled),
 			Switch(text=tools.lang.turn_on_flash,                            name=b"light_compensation",      checked=config.light_compensation,  disabled=disabled),
+			Switch(text=tools.lang.motion_clip_mode,                         name=b"clip_mode",               checked=config.clip_mode,           disabled=disabled),
+			Slider(text=tools.lang.pre_roll_images,             name=b"pre_roll_images",      min=b"0",  max=b"10", step=b"1",  value=b"%d"%config.pre_roll_images,      disabled=disabled),
+			Slider(text=tools.lang.post_roll_duration,          name=b"post_roll_duration",   min=b"0",  max=b"30", step=b"1",  value=b"%d"%config.post_roll_duration,   disabled=disabled),
+			Slider(text=tools.lang.motion_polling_min,          name=b"polling_min",          min=b"1",  max=b"200", step=b"1",   value=b"%d"%config.polling_min,   disabled=disabled),
+			Slider(text=tools.lang.motion_polling_max,          name=b"polling_max",          min=b"10", max=b"2000", step=b"10", value=b"%d"%config.polling_max,   disabled=disabled),
+			Slider(text=tools.lang.motion_cpu_budget,           name=b"cpu_budget",           min=b"5",  max=b"100", step=b"5",   value=b"%d"%config.cpu_budget,    disabled=disabled),
+			Slider(text=tools.lang.history_max_size,            name=b"history_max_size",     min=b"0",  max=b"32000", step=b"100", value=b"%d"%config.history_max_size, disabled=disabled),
+			Slider(text=tools.lang.history_max_days,            name=b"history_max_days",     min=b"0",  max=b"365", step=b"1",   value=b"%d"%config.history_max_days, disabled=disabled),
 			submit
 		]))
 	await response.send_page(page)
@@ -210,3 +219,8 @@ async def motion_on_off(request, response, args):
 			Submit(text=tools.lang.motion_off if config.activated else tools.lang.motion_on,  name=b"action", value=b"off" if config.activated else b"on" )
 		]))
 	await response.send_page(page)
+
+@server.httpserver.HttpServer.add_route(b'/motion/scheduler.json', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.motion)
+async def motion_scheduler(request, response, args):
+	""" Send the interval between captures chosen by the motion scheduler and its inputs """
+	await response.send_json(motion.motionscheduler.MotionScheduler.get_telemetry(), headers={b"Cache-Control":b"no-cache"})
@@ -1,20 +1,47 @@
 # Distributed under Pycameresp License
 # Copyright (c) 2023 Remi BERTHOLET
-""" Function define the web page to see the camera streaming """
+""" Function define the web page to see the camera streaming.
+The images are captured once by the broadcaster, or taken from the motion detection, and sent to all viewers connected,
+each viewer has its own small queue, the oldest image is dropped when a viewer is too slow,
+so a slow viewer never slows down the others.
+Each viewer can limit its stream with the parameters of url : fps=images per second, maxkbps=kilobytes per second,
+quality=jpeg quality. The images are paced with a token bucket, and no image is captured for a viewer still sending the previous one.
+The quality requested by the viewers only applies to the images captured by the streaming, the best quality requested is used,
+and the images of motion detection are never degraded by a viewer. """
+import time
 import uasyncio
 import server.httpserver
 import server.httprequest
 from htmltemplate       import *
 import video.video
+import video.quality
+import video.framebroker
 import tools.logger
+import tools.strings
 import tools.tasking
 import tools.info
 import tools.watchdog
 import tools.features
 
+# Images per second expected, used to convert the bandwidth of streaming into a size budget per image
+STREAM_FPS = 10
+# Maximal number of images waiting to be sent to a viewer
+QUEUE_SIZE = 2
+# Maximal number of viewers, each viewer keeps images in memory
+MAX_VIEWERS = 4
+# Period in seconds of computation of the images per second of viewers
+FPS_PERIOD = 5
+# Maximal duration in milliseconds of bytes that a viewer can send in burst when its bandwidth is limited
+BURST_DURATION = 500
+# Maximal duration in milliseconds of waiting before checking again the viewers
+MAX_WAIT = 100
+# Parameters of url accepted to limit the stream of a viewer, with their range of values
+VIEWER_PARAMETERS = ((b"fps", 0, 30), (b"maxkbps", 0, 10240), (b"quality", 10, 63))
+
 class Streaming:
 	""" Management class of video streaming of the camera via an html page """
 	streaming_id = [0]
+	stopped_id = [0]
 	inactivity = [None]
 	config = [None]
 	durty = [False]
@@ -40,11 +67,46 @@ class Streaming:
 		""" Reset the configuration changed flag """
 		Streaming.durty[0] = False
 
+	@staticmethod
+	def configure(camera=True, requested=None):
+		""" Apply the configuration on the quality of streaming, and on the camera if it is not shared with the motion detection.
+		The quality requested by the viewers replaces the quality configured (None = quality configured) """
+		config = Streaming.get_config()
+		if config is None:
+			config = video.video.Camera.get_config()
+		if camera:
+			video.video.Camera.configure(config)
+		video.quality.Quality.invalidate()
+		best = config.quality if requested is None else requested
+		quality = video.quality.Quality.get("stream", best)
+		if config.bandwidth > 0:
+			# The quality configured is the best allowed, it is degraded when the images exceed the bandwidth
+			quality.configure(rate_budget=config.bandwidth*1024, fps=STREAM_FPS, best=best)
+		else:
+			quality.configure(best=best, worst=best)
+		Streaming.reset_durty()
+		return quality
+
+	@staticmethod
+	def get_parameters(params):
+		""" Return the parameters of viewer found in the url (fps, maxkbps, quality), the values are bounded """
+		result = {}
+		for name, minimum, maximum in VIEWER_PARAMETERS:
+			try:
+				result[name] = min(maximum, max(minimum, int(params[name])))
+			except:
+				pass
+		return result
+
 	@staticmethod
 	def get_html(request):
 		""" Return streaming html part with javascript code """
 		Streaming.activity()
 		Streaming.streaming_id[0] += id(request)
+		# The limits of viewer given to the page are forwarded to the stream
+		parameters = b""
+		for name, value in Streaming.get_parameters(request.params).items():
+			parameters += b"&%s=%d"%(name, value)
 		return Tag(b"""
 		<div style="position: relative;">
 			<img id="video-stream" src="" width="100%%"/>
@@ -52,8 +114,8 @@ class Streaming:
 		</div>	
 		<script>
 			var streamUrl = document.location.protocol + "//" + document.location.hostname + ':%d';
-			document.getElementById('video-stream').src = `${streamUrl}/camera/start?streaming_id=%d`;
-		</script>"""%(request.port+1,Streaming.streaming_id[0]))
+			document.getElementById('video-stream').src = `${streamUrl}/camera/start?streaming_id=%d%s`;
+		</script>"""%(request.port+1,Streaming.streaming_id[0], parameters))
 
 	@staticmethod
 	def activity():
@@ -70,8 +132,336 @@ class Streaming:
 
 	@staticmethod
 	def stop():
-		""" Stop streaming """
+		""" Stop all streaming opened """
 		Streaming.streaming_id[0] += 1
+		Streaming.stopped_id[0] = Streaming.streaming_id[0]
+
+	@staticmethod
+	def is_stopped(streaming_id):
+		""" Indicates if the streaming was stopped """
+		return streaming_id <= Streaming.stopped_id[0]
+
+class FrameWriter:
+	""" Writer of the images of MJPEG stream (multipart with chunked transfer encoding).
+	The header of image is formatted once, then the lengths are patched in place with fixed width,
+	and the header and the image are written with a single drain """
+	def __init__(self, streamio, identifier):
+		""" Constructor """
+		self.streamio  = streamio
+		self.separator = b"\r\n%x\r\n\r\n--%s\r\n\r\n"%(len(identifier) + 6, identifier)
+		self.header    = bytearray(self.separator + b"36\r\nContent-Type: image/jpeg\r\nContent-Length: %8d\r\n\r\n\r\n%08x\r\n"%(0, 0))
+		# Position of the content length and of the size of chunk of image
+		self.length_position = len(self.header) - 24
+		self.chunk_position  = len(self.header) - 10
+		view = memoryview(self.header)
+		# The first image is not preceded by the separator
+		self.first_header = view[len(self.separator):]
+		self.next_header  = view
+		self.frames       = 0
+		self.bytes        = 0
+		self.period_start = time.time()
+		self.period_frames= 0
+		self.period_bytes = 0
+		self.fps          = 0
+		self.rate         = 0
+
+	@staticmethod
+	def patch(buffer, position, value, base, padding):
+		""" Write the value right aligned in the 8 characters at the position """
+		for i in range(position + 7, position - 1, -1):
+			if value > 0 or i == position + 7:
+				buffer[i] = 0x30 + value % base if value % base < 10 else 0x57 + value % base
+				value //= base
+			else:
+				buffer[i] = padding
+
+	def write(self, image):
+		""" Write the image, return the awaitable of the writing (no intermediate coroutine) """
+		length = len(image)
+		FrameWriter.patch(self.header, self.length_position, length, 10, 0x20)
+		FrameWriter.patch(self.header, self.chunk_position,  length, 16, 0x30)
+		header = self.first_header if self.frames == 0 else self.next_header
+		self.frames += 1
+		self.bytes  += len(header) + length
+		return self.streamio.write_pair(header, image)
+
+	async def close(self):
+		""" Write the end of the last image """
+		if self.frames > 0:
+			await self.streamio.write(self.separator)
+
+	def get_statistics(self):
+		""" Return the images per second in tenths and the bytes per second, computed on the last period """
+		now = time.time()
+		if now - self.period_start >= FPS_PERIOD:
+			self.fps  = ((self.frames - self.period_frames) * 10) // (now - self.period_start)
+			self.rate = (self.bytes - self.period_bytes) // (now - self.period_start)
+			self.period_frames = self.frames
+			self.period_bytes  = self.bytes
+			self.period_start  = now
+		return self.fps, self.rate
+
+class Pacer:
+	""" Token bucket limiting the images per second and the bytes per second of a viewer (0 = no limit).
+	The tokens are counted in thousandths to stay in integers """
+	def __init__(self, fps=0, maxkbps=0):
+		""" Constructor """
+		self.fps          = fps
+		self.rate         = maxkbps * 1024
+		self.frame_tokens = 1000
+		self.byte_tokens  = 0
+		self.last         = tools.strings.ticks()
+
+	def refill(self):
+		""" Add the tokens earned since the last refill """
+		now = tools.strings.ticks()
+		elapsed = now - self.last
+		self.last = now
+		if elapsed > 0:
+			self.frame_tokens = min(1000, self.frame_tokens + elapsed * self.fps)
+			self.byte_tokens  = min(self.rate * BURST_DURATION, self.byte_tokens + elapsed * self.rate)
+
+	def get_delay(self):
+		""" Return the milliseconds to wait before the next image can be sent, 0 if it can be sent now """
+		self.refill()
+		delay = 0
+		if self.fps > 0 and self.frame_tokens < 1000:
+			delay = (1000 - self.frame_tokens + self.fps - 1) // self.fps
+		if self.rate > 0 and self.byte_tokens < 0:
+			# The size of the next image is unknown, the bucket can be in debt of the last image
+			delay = max(delay, (self.rate - 1 - self.byte_tokens) // self.rate)
+		return delay
+
+	def consume(self, size):
+		""" Remove the tokens of the image sent """
+		if self.fps > 0:
+			self.frame_tokens -= 1000
+		if self.rate > 0:
+			self.byte_tokens -= size * 1000
+
+class Viewer:
+	""" Connection of a viewer of streaming, with the queue of images to send """
+	def __init__(self, streamio, identifier, streaming_id, fps=0, maxkbps=0, quality=None):
+		""" Constructor """
+		self.writer       = FrameWriter(streamio, identifier)
+		self.pacer        = Pacer(fps, maxkbps)
+		self.streaming_id = streaming_id
+		self.queue        = []
+		self.event        = uasyncio.Event()
+		self.closed       = False
+		self.sending      = False
+		self.dropped      = 0
+		self.skipped      = 0
+		self.quality      = quality
+
+	def is_waiting(self):
+		""" Indicates if the viewer waits an image : nothing in the queue, the previous image sent and the pace respected """
+		return self.get_delay() == 0
+
+	def get_delay(self):
+		""" Return the milliseconds before the viewer can accept an image, None if it is still sending """
+		if self.closed or self.sending or len(self.queue) > 0:
+			return None
+		return self.pacer.get_delay()
+
+	def push(self, image):
+		""" Add the image to send, the image is skipped if it exceeds the pace of viewer,
+		the oldest image waiting is dropped if the viewer is too slow """
+		if self.pacer.get_delay() > 0:
+			self.skipped += 1
+			return
+		if len(self.queue) >= QUEUE_SIZE:
+			self.queue.pop(0)
+			self.dropped += 1
+		self.queue.append(image)
+		self.pacer.consume(len(image))
+		self.event.set()
+
+	def close(self):
+		""" Stop the sending of images """
+		self.closed = True
+		self.event.set()
+
+	def get_statistics(self):
+		""" Return the statistics of viewer, the rates achieved and the rates requested """
+		fps, rate = self.writer.get_statistics()
+		result = b"%d.%d fps"%(fps//10, fps%10)
+		if self.pacer.fps > 0:
+			result += b"/%d"%self.pacer.fps
+		result += b" %d KB/s"%(rate//1024)
+		if self.pacer.rate > 0:
+			result += b"/%d"%(self.pacer.rate//1024)
+		if self.quality is not None:
+			result += b" quality %d"%self.quality
+		return result + b" %d dropped %d skipped"%(self.dropped, self.skipped)
+
+	async def run(self):
+		""" Send the images of queue until the streaming is stopped or the connection closed """
+		try:
+			while self.closed is False and Streaming.is_stopped(self.streaming_id) is False:
+				if len(self.queue) == 0:
+					try:
+						# Wait image
+						await uasyncio.wait_for(self.event.wait(), 1)
+					except:
+						pass
+					self.event.clear()
+				if len(self.queue) > 0:
+					self.sending = True
+					await self.writer.write(self.queue.pop(0))
+					self.sending = False
+					Broadcaster.wake_up()
+			await self.writer.close()
+		except Exception:
+			# Connection closed by the viewer
+			pass
+		self.close()
+
+class Broadcaster:
+	""" Capture the images once and send them to all viewers of streaming """
+	viewers  = []
+	running  = [False]
+	captured = [0]
+	event    = [None]
+
+	@staticmethod
+	def subscribe(viewer):
+		""" Add the viewer, the capture starts with the first viewer """
+		if len(Broadcaster.viewers) >= MAX_VIEWERS:
+			return False
+		Broadcaster.viewers.append(viewer)
+		if Broadcaster.running[0] is False:
+			Broadcaster.running[0] = True
+			tools.tasking.Tasks.create_task(Broadcaster.task())
+		return True
+
+	@staticmethod
+	def unsubscribe(viewer):
+		""" Remove the viewer, the capture stops with the last viewer """
+		if viewer in Broadcaster.viewers:
+			Broadcaster.viewers.remove(viewer)
+
+	@staticmethod
+	def get_event():
+		""" Get the event set when a viewer has sent its image """
+		if Broadcaster.event[0] is None:
+			Broadcaster.event[0] = uasyncio.Event()
+		return Broadcaster.event[0]
+
+	@staticmethod
+	def wake_up():
+		""" A viewer can accept a new image """
+		Broadcaster.get_event().set()
+
+	@staticmethod
+	def is_waited():
+		""" Indicates if at least one viewer waits an image """
+		for viewer in Broadcaster.viewers:
+			if viewer.is_waiting():
+				return True
+		return False
+
+	@staticmethod
+	def get_quality():
+		""" Return the best quality requested by the viewers, None if a viewer wants the quality configured """
+		result = None
+		for viewer in Broadcaster.viewers:
+			if viewer.quality is None:
+				return None
+			if result is None or viewer.quality < result:
+				result = viewer.quality
+		return result
+
+	@staticmethod
+	async def wait_viewers():
+		""" Wait until a viewer has sent its image or until the pace of a viewer allows a new image """
+		delay = MAX_WAIT
+		for viewer in Broadcaster.viewers:
+			viewer_delay = viewer.get_delay()
+			if viewer_delay is not None and viewer_delay < delay:
+				delay = viewer_delay
+		event = Broadcaster.get_event()
+		event.clear()
+		try:
+			await uasyncio.wait_for(event.wait(), max(1, delay)/1000)
+		except:
+			pass
+
+	@staticmethod
+	async def task():
+		""" Send the images to the viewers while they are connected.
+		The images of the motion detection are reused, the camera is captured only when the motion detection is stopped """
+		broker = video.framebroker.FrameBroker
+		broker.subscribe()
+		sequence = broker.sequence[0]
+		shared = None
+		quality = None
+		requested = None
+		try:
+			while len(Broadcaster.viewers) > 0:
+				image = None
+				if broker.is_motion_capturing():
+					# The camera is configured by the motion detection
+					if shared is not True or Streaming.is_durty():
+						# The images of motion detection are not in the budget of streaming, its quality is ignored
+						quality = Streaming.configure(False)
+						quality.release()
+						shared = True
+					image, last = await broker.wait(sequence)
+					if last == sequence:
+						image = None
+					sequence = last
+				elif Broadcaster.is_waited() is False:
+					await Broadcaster.wait_viewers()
+				# The camera is reserved without suspension of motion detection, during the configuration and the capture
+				elif await video.video.Camera.reserve(Broadcaster):
+					try:
+						# The quality requested by the viewers only applies to the images captured by the streaming
+						if shared is not False or Streaming.is_durty():
+							video.video.Camera.open()
+							requested = Broadcaster.get_quality()
+							quality = Streaming.configure(True, requested)
+							shared = False
+						elif requested != Broadcaster.get_quality():
+							requested = Broadcaster.get_quality()
+							quality = Streaming.configure(False, requested)
+
+						# Capture only when a viewer has sent its previous image and its pace allows a new one
+						video.quality.Quality.apply(quality)
+						image = broker.capture()
+						sequence = broker.sequence[0]
+						if image is not None:
+							quality.update(len(image))
+					finally:
+						await video.video.Camera.unreserve(Broadcaster)
+					await uasyncio.sleep_ms(0 if image is not None else 10)
+				else:
+					# The camera is used by the motion detection or by the timelapse
+					await uasyncio.sleep_ms(MAX_WAIT)
+
+				if image is not None:
+					Broadcaster.captured[0] += 1
+					for viewer in Broadcaster.viewers:
+						viewer.push(image)
+					image = None
+		except Exception as err:
+			tools.logger.syslog(err)
+		finally:
+			Broadcaster.running[0] = False
+			broker.unsubscribe()
+			if quality is not None:
+				quality.release()
+			for viewer in Broadcaster.viewers:
+				viewer.close()
+			Broadcaster.viewers.clear()
+
+	@staticmethod
+	def get_statistics():
+		""" Return the statistics of viewers """
+		result = b"%d viewers, %d captured"%(len(Broadcaster.viewers), Broadcaster.captured[0])
+		for viewer in Broadcaster.viewers:
+			result += b", " + viewer.get_statistics()
+		return result
 
 @server.httpserver.HttpServer.add_route(b'/camera/start', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.camera)
 async def camera_start_streaming(request, response, args):
@@ -80,14 +470,13 @@ async def camera_start_streaming(request, response, args):
 	if request.name != "HttpStreaming":
 		return
 
+	writer = None
+	viewer = None
 	try:
-		writer = None
-		currentstreaming_id = int(request.params[b"streaming_id"])
-		reserved = await video.video.Camera.reserve(request, timeout=5, suspension=10)
-		if reserved:
-			failed = False
-			video.video.Camera.open()
-
+		streaming_id = int(request.params[b"streaming_id"])
+		parameters = Streaming.get_parameters(request.params)
+		viewer = Viewer(response.streamio, response.identifier, streaming_id, parameters.get(b"fps", 0), parameters.get(b"maxkbps", 0), parameters.get(b"quality", None))
+		if Broadcaster.subscribe(viewer):
 			response.set_status(b"200")
 			response.set_header(b"Content-Type"               ,b"multipart/x-mixed-replace")
 			response.set_header(b"Transfer-Encoding"          ,b"chunked")
@@ -95,49 +484,15 @@ async def camera_start_streaming(request, response, args):
 
 			await response.serialize(response.streamio)
 			writer = response.streamio
-			identifier = b"\r\n%x\r\n\r\n--%s\r\n\r\n"%(len(response.identifier) + 6, response.identifier)
-			frame = b'%s36\r\nContent-Type: image/jpeg\r\nContent-Length: %8d\r\n\r\n\r\n%x\r\n'
-
-			if tools.filesystem.ismicropython():
-				micropython = True
-			else:
-				micropython = False
-
-			if Streaming.is_durty():
-				video.video.Camera.configure(Streaming.get_config())
-				Streaming.reset_durty()
-
-			image = video.video.Camera.capture()
-			length = len(image)
-			try:
-				await writer.write(frame%(b"", length, length))
-				await writer.write(image)
-			except Exception as err:
-				failed = True
-				currentstreaming_id = 0
-
-			while currentstreaming_id == Streaming.get_streaming_id():
-				if Streaming.is_durty():
-					video.video.Camera.configure(Streaming.get_config())
-					Streaming.reset_durty()
-				image = video.video.Camera.capture()
-				length = len(image)
-				try:
-					await writer.write(frame%(identifier, length, length))
-					await writer.write(image)
-				except Exception as err:
-					failed = True
-					break
-				if micropython is False:
-					await uasyncio.sleep(0.1)
-			if failed is False:
-				await writer.write(identifier)
+			await viewer.run()
 		else:
-			pass
+			viewer.close()
+			viewer = None
+			await response.send_error(status=b"503")
 	except Exception as err:
 		tools.logger.syslog(err)
 	finally:
-		if reserved:
-			await video.video.Camera.unreserve(request)
+		if viewer:
+			Broadcaster.unsubscribe(viewer)
 		if writer:
 			await writer.close()
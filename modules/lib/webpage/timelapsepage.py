@@ -0,0 +1,80 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+""" Function define the web page to configure the timelapse and to download the images recorded """
+import re
+import server.httpserver
+from htmltemplate          import *
+import webpage.mainpage
+import video.video
+import video.timelapse
+import tools.lang
+import tools.info
+import tools.features
+import tools.tasking
+import tools.strings
+import tools.date
+
+class ContentAvi:
+	""" Avi file of one day of timelapse """
+	def __init__(self, avi):
+		""" Constructor """
+		self.avi = avi
+
+	async def serialize(self, streamio):
+		""" Serialize the avi file, its size is known before sending """
+		result = await streamio.write(b'Content-Type: video/x-msvideo\r\nContent-Length: %d\r\nContent-Disposition: attachment; filename="%s.avi"\r\n\r\n'%(self.avi.get_size(), tools.strings.tobytes(self.avi.day.day)))
+		result += await self.avi.write(streamio)
+		return result
+
+@server.httpserver.HttpServer.add_route(b'/timelapse', menu=tools.lang.menu_camera, item=tools.lang.item_timelapse, available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.timelapse)
+async def timelapse_page(request, response, args):
+	""" Timelapse configuration page, with the list of days recorded """
+	config = video.timelapse.TimelapseConfig()
+	disabled, action, submit = webpage.mainpage.manage_default_button(request, config)
+
+	days = []
+	for day in video.timelapse.Timelapse.get_days():
+		days.append(Link(text=tools.strings.tobytes(day), href=b"timelapse/%s.avi"%tools.strings.tobytes(day)))
+		days.append(Br())
+
+	page = webpage.mainpage.main_frame(request, response, args, tools.lang.timelapse,
+		Form([
+			Switch(text=tools.lang.activated,          name=b"activated",  checked=config.activated, disabled=disabled),
+			Edit  (text=tools.lang.timelapse_period,   name=b"period",     pattern=b"[0-9]*[0-9]", placeholder=b"%d"%video.timelapse.MIN_PERIOD, value=b"%d"%config.period, disabled=disabled),
+			Edit  (text=tools.lang.timelapse_start,    name=b"start_time", type=b"time", value=tools.date.time_to_html(config.start_time), disabled=disabled),
+			Edit  (text=tools.lang.timelapse_end,      name=b"end_time",   type=b"time", value=tools.date.time_to_html(config.end_time),   disabled=disabled),
+			Edit  (text=tools.lang.timelapse_max_days, name=b"max_days",   pattern=b"[0-9]*[0-9]", value=b"%d"%config.max_days, disabled=disabled),
+			submit,
+			Br(),
+			Label (text=tools.lang.timelapse_days),
+			Br()
+		] + days))
+	await response.send_page(page)
+
+@server.httpserver.HttpServer.add_route(b'/timelapse/.*', available=tools.info.iscamera() and video.video.Camera.is_activated() and tools.features.features.timelapse)
+async def timelapse_download(request, response, args):
+	""" Download the timelapse of a day : YYYY-MM-DD.avi (parameter fps=images per second),
+	YYYY-MM-DD.json (timestamps of images) or YYYY-MM-DD/<index>.jpg (one image) """
+	tools.tasking.Tasks.slow_down()
+	try:
+		path = tools.strings.tostrings(request.path[len("/timelapse/"):])
+		day = None
+		if re.match("^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]", path):
+			day = video.timelapse.Timelapse.get_day(path[:10])
+		if day is None or day.get_count() == 0:
+			await response.send_not_found()
+		elif path[10:] == ".avi":
+			try:
+				fps = min(30, max(1, int(request.params.get(b"fps", b"%d"%video.timelapse.AVI_FPS))))
+			except:
+				fps = video.timelapse.AVI_FPS
+			await response.send(content=ContentAvi(video.timelapse.TimelapseAvi(day, fps)))
+		elif path[10:] == ".json":
+			await response.send_json(day.get_timestamps(), headers={b"Cache-Control":b"no-cache"})
+		elif path[10:11] == "/" and path[-4:] == ".jpg" and 0 <= int(path[11:-4]) < day.get_count():
+			offset, size = day.get_image(int(path[11:-4]))
+			await response.send_file(day.filename, mime_type=b"image/jpeg", offset=offset, size=size, headers={b"Cache-Control":b"max-age=86400"})
+		else:
+			await response.send_not_found()
+	except Exception as err:
+		await response.send_not_found(err)
@@ -32,5 +32,6 @@ pycameresp.start(\
 	presence    = True, # Home occupant presence detection task
 	camera      = True, # Camera configuration
 	motion      = True, # Motion detection task
+	#timelapse   = True, # Timelapse recorder task
 	# debug=True, dump=True
 	)
@@ -61,6 +61,7 @@ def start(**kwargs):
 		- presence     : activate presence detection of occupant in the house
 		- motion       : activate motion detection
 		- camera       : activate the camera
+		- timelapse    : activate the timelapse recorder
 		- plugin       : activate autostart of plugin
 		- shell        : activate shell
 		- webhook      : activate webhook notification
@@ -157,6 +158,11 @@ def start(**kwargs):
 				import motion.motion
 				motion.motion.Motion.start(pin_wake_up=pin_wake_up)
 
+			# If timelapse recorder activated
+			if features.timelapse:
+				import video.timelapse
+				video.timelapse.Timelapse.start()
+
 			# If http server started
 			if features.http:
 				import server.httpserver
@@ -1,8 +1,10 @@
 # Distributed under Pycameresp License
 # Copyright (c) 2023 Remi BERTHOLET
 """ Simulation ESP32CAM camera class, used on desktop to debug with vscode """
+import motionengine
 _current = 0
 _opened = False
+_footage = []
 _pixformat     = 0
 _aec_value     = 0
 _framesize     = 0
@@ -87,7 +89,9 @@ def capture():
 	global _opened
 	global _current
 	if _opened:
-		if _current == 0:
+		if len(_footage) > 0:
+			data = _footage.pop()
+		elif _current == 0:
 			data = open("Test2.jpg","rb").read()
 			_current = 1
 		else:
@@ -96,6 +100,11 @@ def capture():
 		return data
 	return None
 
+def play(images):
+	""" Replay the list of recorded jpeg images instead of Test1.jpg and Test2.jpg, used by the motion benchmarks """
+	global _footage
+	_footage = list(reversed(images))
+
 def configure(**kwargs):
 	""" Configure the structure for camera initialization.
 		- pin_pwdn           : GPIO pin for camera power down line
@@ -125,26 +134,40 @@ def configure(**kwargs):
 	"""
 
 class Motion:
-	""" Class motion detection returned by the detect function """
+	""" Class motion detection returned by the detect function.
+	If numpy and pillow are installed, the jpeg is really compared with the firmware algorithm, otherwise fixed results are returned """
 	size_base = [10*1024]
 	size_direction = [1]
 	def __init__(self, motion_):
 		""" Constructor of motion """
-		self.size = self.size_base[0]
-		if self.size_direction[0] == 1:
-			self.size_base[0] += 1024
-			if self.size_base[0] > 66*1024:
-				self.size_direction[0] = 0
+		self.image  = b""
+		self.frames = None
+		self.diffs  = []
+		if motionengine.available and motion_:
+			self.image  = bytes(motion_)
+			self.frames = motionengine.Frames.load([self.image])
+			self.size   = len(self.image)
 		else:
-			self.size_base[0] -= 1024
-			if self.size_base[0] < 10*1024:
-				self.size_direction[0] = 1
+			self.size = self.size_base[0]
+			if self.size_direction[0] == 1:
+				self.size_base[0] += 1024
+				if self.size_base[0] > 66*1024:
+					self.size_direction[0] = 0
+			else:
+				self.size_base[0] -= 1024
+				if self.size_base[0] < 10*1024:
+					self.size_direction[0] = 1
 
 	def deinit (self):
 		""" Deinit motion """
 
 	def compare(self, other):
 		""" Compare two motion detection """
+		if self.frames is not None and other.frames is not None:
+			result = motionengine.compare_frames(self.frames, other.frames)
+			words = result["diff"]["diffs"]
+			self.diffs = [(words[i//32] >> (31 - i%32)) & 1 for i in range(result["diff"]["max"])]
+			return result
 		return {
 			'feature': {'light': 37, 'saturation': 13},
 			'path': '2021-04-25 11-37-00',
@@ -158,10 +181,12 @@ class Motion:
 
 	def configure(self, config):
 		""" Configure motion detection """
+		if motionengine.available:
+			motionengine.Configuration.configure(config)
 
 	def get_image(self):
 		""" Get the image from motion """
-		return b""
+		return self.image
 
 	def get_size(self):
 		""" Get the size of image """
@@ -169,23 +194,37 @@ class Motion:
 
 	def get_light(self):
 		""" Get light level """
+		if self.frames is not None:
+			return int(self.frames.lights[0].mean())
 		return 128
 
 	def extract(self):
 		""" Extract the motion informations """
+		if self.frames is not None:
+			return [self.image, self.frames.lights[0].tolist(), self.diffs, self.frames.histos[0].tolist()]
 		return []
 
 	def get_max_light(self):
 		""" Get maximal light detected """
+		if self.frames is not None:
+			return int(self.frames.lights[0].max())
 		return 256
 
 	def get_min_light(self):
 		""" Get minimal light detected """
+		if self.frames is not None:
+			return int(self.frames.lights[0].min())
 		return 0
 
 def motion():
 	""" Get motion detection """
-	return Motion(None)
+	image = None
+	if motionengine.available:
+		try:
+			image = capture()
+		except OSError:
+			image = None
+	return Motion(image)
 
 def pixformat(val=None):
 	""" Set or get pixformat """
@@ -0,0 +1,207 @@
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+""" Vectorised motion comparison engine used by the camera simulation on desktop.
+It reproduces the integer computations of the firmware motion detection (modcamera.c) :
+the jpeg is decoded at 1/8 scale, the light of pixels is averaged in each square of detection,
+the histograms of lights are compared and each square is compared with the error lines configured.
+The computations are vectorised over the squares and over batches of images, it requires numpy and pillow,
+without them the camera simulation returns fixed results. """
+import io
+try:
+	import numpy
+	from PIL import Image
+	available = True
+except ImportError:
+	available = False
+
+MAX_HISTO = 16
+MAX_LINES = 4
+
+def c_div(a, b):
+	""" Integer division truncated toward zero like in C """
+	result = abs(a) // abs(b)
+	if (a < 0) != (b < 0):
+		result = -result
+	return result
+
+class Lines:
+	""" Line portions with fixed point slopes, identical to the firmware Lines_configure and Lines_getY """
+	def __init__(self, points):
+		""" Constructor with the list of 4 points [[x,y],...] """
+		if len(points) != MAX_LINES:
+			raise TypeError("Motions bad configure size for points")
+		self.x = [int(point[0]) for point in points]
+		self.y = [int(point[1]) for point in points]
+		self.a = [0]*MAX_LINES
+		self.b = [0]*MAX_LINES
+		for i in range(1, MAX_LINES):
+			if self.x[i] == self.x[i-1]:
+				raise ValueError("Motions bad configure points")
+			self.a[i] = c_div((self.y[i] - self.y[i-1]) << 8, self.x[i] - self.x[i-1])
+			self.b[i] = self.y[i] - ((self.a[i] * self.x[i]) >> 8)
+
+	def get_y(self, x):
+		""" Get the y values of the numpy array of x, 0 if x is outside the lines """
+		x = numpy.asarray(x, dtype=numpy.int64)
+		y = numpy.zeros_like(x)
+		found = numpy.zeros(x.shape, dtype=bool)
+		for i in range(1, MAX_LINES):
+			selected = (x >= self.x[i-1]) & (x < self.x[i]) & ~found
+			y[selected] = ((self.a[i] * x[selected]) >> 8) + self.b[i]
+			found |= selected
+		return y
+
+class Configuration:
+	""" Motion detection configuration, shared by all motions like in firmware """
+	mask         = [b""]
+	error_lights = [None]
+	error_histos = [None]
+
+	@staticmethod
+	def configure(config):
+		""" Configure the motion detection with the dictionnary {"mask":b"", "errorLights":[[x,y],...], "errorHistos":[[x,y],...]} """
+		mask = config.get("mask", b"")
+		if isinstance(mask, str):
+			mask = mask.encode("latin-1")
+		Configuration.mask[0]         = bytes(mask)
+		Configuration.error_lights[0] = Lines(config["errorLights"])
+		Configuration.error_histos[0] = Lines(config["errorHistos"])
+
+	@staticmethod
+	def get():
+		""" Return the mask, error lights and error histos, with the default configuration of motion detection if not configured """
+		if Configuration.error_lights[0] is None:
+			Configuration.configure({"mask":b"", "errorLights":[[0,10],[30,10],[128,19],[256,19]], "errorHistos":[[0,0],[32,32],[128,128],[256,256]]})
+		return Configuration.mask[0], Configuration.error_lights[0], Configuration.error_histos[0]
+
+	@staticmethod
+	def get_mask(diff_max):
+		""" Return the numpy array of squares ignored, or None if the mask not applies to this geometry """
+		mask = Configuration.get()[0]
+		if len(mask) == diff_max:
+			return numpy.frombuffer(mask, dtype=numpy.uint8) == ord("/")
+		return None
+
+def decode(jpeg):
+	""" Decode the jpeg at 1/8 scale like the firmware, return the numpy array of rgb pixels (height, width, 3) """
+	image = Image.open(io.BytesIO(jpeg))
+	width, height = image.size[0]//8, image.size[1]//8
+	# The draft mode uses the DCT scaling of jpeg decoder, as the firmware does
+	image.draft("RGB", (width, height))
+	image = image.convert("RGB")
+	if image.size != (width, height):
+		image = image.resize((width, height), Image.BOX)
+	return numpy.asarray(image, dtype=numpy.int32)
+
+def get_square(size):
+	""" Return the size of detection square for the dimension of image scaled """
+	if (size//8) % 8 == 0:
+		return 8
+	return 5
+
+class Frames:
+	""" Lights of squares and histograms of a batch of images having the same geometry """
+	def __init__(self, pixels):
+		""" Constructor with the numpy array of rgb pixels (height, width, 3) or a batch of them (images, height, width, 3) """
+		pixels = numpy.asarray(pixels, dtype=numpy.int32)
+		if pixels.ndim == 3:
+			pixels = pixels[numpy.newaxis]
+		count, height, width = pixels.shape[:3]
+		self.width    = width
+		self.height   = height
+		self.square_x = get_square(width)
+		self.square_y = get_square(height)
+		self.diff_width  = width  // self.square_x
+		self.diff_height = height // self.square_y
+		self.diff_max    = self.diff_width * self.diff_height
+		square = self.square_x * self.square_y
+
+		# Light of each pixel
+		lights = (pixels.max(axis=3) + pixels.min(axis=3)) >> 1
+
+		# Histogram of lights of each image, computed with a single bincount on the whole batch
+		bins = (lights // MAX_HISTO).reshape(count, -1) + (numpy.arange(count) * MAX_HISTO)[:, numpy.newaxis]
+		self.histos = numpy.bincount(bins.ravel(), minlength=count*MAX_HISTO).reshape(count, MAX_HISTO) // square
+
+		# Mean light of each square
+		lights = lights[:, :self.diff_height*self.square_y, :self.diff_width*self.square_x]
+		lights = lights.reshape(count, self.diff_height, self.square_y, self.diff_width, self.square_x).sum(axis=(2,4))
+		self.lights = lights.reshape(count, self.diff_max) // square
+
+	@staticmethod
+	def load(jpegs):
+		""" Decode the list of jpeg images and return the frames """
+		return Frames(numpy.stack([decode(jpeg) for jpeg in jpegs]))
+
+	def __len__(self):
+		""" Number of images """
+		return len(self.lights)
+
+	def get_geometry(self):
+		""" Return the geometry of images before the 1/8 scale """
+		return {"width":self.width*8, "height":self.height*8}
+
+def compare(current_lights, current_histos, previous_lights, previous_histos, diff_max):
+	""" Compare the batches of squares lights and histograms, each current image is compared with the previous image at the same position.
+	Return the numpy arrays of differences count, squares detected, histogram differences and error histograms """
+	_, error_lights, error_histos = Configuration.get()
+	current_lights  = numpy.asarray(current_lights,  dtype=numpy.int64)
+	previous_lights = numpy.asarray(previous_lights, dtype=numpy.int64)
+
+	# Differences of histograms
+	diff = numpy.abs(numpy.asarray(current_histos, dtype=numpy.int64) - numpy.asarray(previous_histos, dtype=numpy.int64)).sum(axis=-1)
+	diff_histos = numpy.where(diff > diff_max, 0, 256 - ((diff << 8) // diff_max))
+	err_histos  = error_histos.get_y(diff_histos)
+
+	# Differences of squares
+	err_lights = error_lights.get_y(numpy.maximum(current_lights, previous_lights))
+	detected = ((numpy.abs(current_lights - previous_lights) * err_histos[..., numpy.newaxis]) >> 8) > err_lights
+
+	mask = Configuration.get_mask(diff_max)
+	if mask is not None:
+		detected &= ~mask
+	return detected.sum(axis=-1), detected, diff_histos, err_histos
+
+def pack_diffs(detected):
+	""" Pack the squares detected into the list of 32 bits words, the first square in the most significant bit """
+	detected = numpy.asarray(detected, dtype=numpy.uint64)
+	words = len(detected)//32 + 1
+	bits = numpy.zeros(words*32, dtype=numpy.uint64)
+	bits[:len(detected)] = detected
+	weights = numpy.left_shift(numpy.uint64(1), numpy.arange(31, -1, -1, dtype=numpy.uint64))
+	return [int(word) for word in (bits.reshape(words, 32) * weights).sum(axis=1)]
+
+def compare_frames(current, previous, current_index=0, previous_index=0):
+	""" Compare two images of frames and return the result with the same structure as the firmware """
+	if (current.width, current.height) != (previous.width, previous.height):
+		raise ValueError("Motions have not the same geometry")
+	count, detected, diff_histos, err_histos = compare(
+		current.lights[current_index],  current.histos[current_index],
+		previous.lights[previous_index], previous.histos[previous_index], current.diff_max)
+	return {
+		"diff":{
+			"count"    : int(count),
+			"max"      : current.diff_max,
+			"squarex"  : current.square_x*8,
+			"squarey"  : current.square_y*8,
+			"width"    : current.diff_width,
+			"height"   : current.diff_height,
+			"diffhisto": int(diff_histos),
+			"errhisto" : int(err_histos),
+			"diffs"    : pack_diffs(detected)
+		},
+		"geometry":current.get_geometry()
+	}
+
+def compare_sequence(frames, background=None):
+	""" Compare each image of frames with the previous one (or with the background image if given) in a single vectorised pass.
+	Return the numpy arrays of differences count, squares detected, histogram differences and error histograms.
+	The first image is compared with itself when no background is given """
+	if background is None:
+		previous_lights = numpy.concatenate((frames.lights[:1], frames.lights[:-1]))
+		previous_histos = numpy.concatenate((frames.histos[:1], frames.histos[:-1]))
+	else:
+		previous_lights = background.lights[:1]
+		previous_histos = background.histos[:1]
+	return compare(frames.lights, frames.histos, previous_lights, previous_histos, frames.diff_max)
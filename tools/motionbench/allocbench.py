@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Benchmark of the python allocations done by the motion detection for each image, without motion (steady state).
+The simulated camera returns fixed results, so the allocations measured are those of the motion detection itself :
+the number of ImageMotion objects created, the python memory allocated temporarily during the image (peak)
+and the memory kept after the image. """
+import sys
+import os
+import os.path
+import tempfile
+import argparse
+import asyncio
+import tracemalloc
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import camera
+import motionengine
+import video.video
+import motion.motioncore
+
+created = [0]
+
+def count_creation(function):
+	""" Count the ImageMotion objects created """
+	def __init__(self, *args, **kwargs):
+		""" Constructor counted """
+		created[0] += 1
+		function(self, *args, **kwargs)
+	return __init__
+
+async def replay(frames, warmup, config):
+	""" Capture and detect the frames, return the lists of peak and kept memory of each frame measured """
+	peaks = []
+	kept  = []
+	core = motion.motioncore.MotionCore(config)
+	for frame in range(warmup + frames):
+		if frame == warmup:
+			created[0] = 0
+		before = tracemalloc.get_traced_memory()[0]
+		tracemalloc.reset_peak()
+		detection = await core.capture()
+		core.detect(False)
+		if detection is not None:
+			core.deinit_image(detection[1])
+		current, peak = tracemalloc.get_traced_memory()
+		if frame >= warmup:
+			peaks.append(peak - before)
+			kept.append(current - before)
+	core.cleanup()
+	return peaks, kept
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="Motion detection allocations benchmark")
+	parser.add_argument("-n", "--frames", type=int, default=500, help="Number of images measured")
+	parser.add_argument("-w", "--warmup", type=int, default=50,  help="Number of images before the measure")
+	args = parser.parse_args()
+
+	# The fixed results of camera simulation
+	motionengine.available = False
+	motion.motioncore.ImageMotion.__init__ = count_creation(motion.motioncore.ImageMotion.__init__)
+	config = motion.motioncore.MotionConfig()
+	config.activated = True
+
+	with tempfile.TemporaryDirectory() as directory:
+		current = os.getcwd()
+		os.chdir(directory)
+		camera.init()
+		video.video.Camera.opened = True
+		try:
+			tracemalloc.start()
+			peaks, kept = asyncio.run(replay(args.frames, args.warmup, config))
+			tracemalloc.stop()
+		finally:
+			camera.deinit()
+			video.video.Camera.opened = False
+			os.chdir(current)
+
+	print("Images measured            : %d"%args.frames)
+	print("ImageMotion created per image: %.2f"%(created[0]/args.frames))
+	print("Temporary memory per image : %.0f bytes (max %d)"%(sum(peaks)/len(peaks), max(peaks)))
+	print("Memory kept per image      : %.1f bytes"%(sum(kept)/len(kept)))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Benchmark of the images saved per second during a motion burst.
+It compares the legacy jpeg and json files per image with the clip container of motion event,
+and checks that the images of clip removed from the memory are still found with the day index. """
+import sys
+import os
+import os.path
+import time
+import tempfile
+import argparse
+import asyncio
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import motion.historic
+
+def get_motion_info(motion_id):
+	""" Get motion informations as produced by the motion detection """
+	return {"geometry":{"width":800,"height":600},"diff":{"diffs":[0x0F0F0F0F]*15,"squarex":40,"squarey":40},"motion_id":motion_id}
+
+async def burst(images, size, events, clip):
+	""" Save a burst of images spread over events, return the number of files created """
+	image = b"\xFF\xD8" + b"\x55"*(size-4) + b"\xFF\xD9"
+	start = time.mktime((2023, 1, 1, 12, 0, 0, 0, 0, 0))
+	for i in range(images):
+		year, month, day, hour, minute, second = time.localtime(start + i)[:6]
+		path = "%04d/%02d/%02d/%02dh%02d"%(year, month, day, hour, (minute//5)*5)
+		name = "%04d-%02d-%02d_%02d-%02d-%02d Id=%d D=%d"%(year, month, day, hour, minute, second, i, 10)
+		await motion.historic.Historic.add_motion(path, name, image, get_motion_info(1 + (i * events) // images), clip)
+	motion.historic.Historic.close_clip(True)
+
+def measure(images, size, events, clip):
+	""" Measure the images per second of burst """
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		os.mkdir("sd")
+		motion.historic.Historic.store.clear()
+		begin = time.perf_counter()
+		asyncio.run(burst(images, size, events, clip))
+		duration = time.perf_counter() - begin
+		files = sum(len(filenames) for _, _, filenames in os.walk("sd"))
+	return images / duration if duration > 0 else 0, files
+
+async def evicted_clips(images, size, events):
+	""" Save a burst in clips, remove all detections from the memory, return the number of images found in their clip """
+	await burst(images, size, events, True)
+	store = motion.historic.Historic.store
+	names = [item[0] for item in store.select()]
+	store.remove_older(store.count())
+	found = 0
+	for name in names:
+		clip = await motion.historic.Historic.get_clip(name)
+		if clip is not None and os.path.getsize(clip[0]) >= clip[1] + clip[2] and clip[2] == size:
+			found += 1
+	return found
+
+def check_evicted(images, size, events):
+	""" Check that the images of clip evicted from the memory are found """
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		os.mkdir("sd")
+		motion.historic.Historic.store.clear()
+		return asyncio.run(evicted_clips(images, size, events))
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="Motion burst saving benchmark")
+	parser.add_argument("-n", "--images", type=int, default=500,   help="Number of images in the burst")
+	parser.add_argument("-s", "--size",   type=int, default=30000, help="Size of jpeg images")
+	parser.add_argument("-e", "--events", type=int, default=10,    help="Number of motion events in the burst")
+	args = parser.parse_args()
+
+	legacy, legacy_files = measure(args.images, args.size, args.events, False)
+	clip,   clip_files   = measure(args.images, args.size, args.events, True)
+	print("Jpeg and json per image : %8.1f images/s  %5d files"%(legacy, legacy_files))
+	print("Clip per motion event   : %8.1f images/s  %5d files (x%.1f faster)"%(clip, clip_files, clip/legacy if legacy > 0 else 0))
+	found = check_evicted(min(args.images, 100), args.size, args.events)
+	print("Images of clip evicted  : %d/%d found with the day index"%(found, min(args.images, 100)))
+	if found != min(args.images, 100):
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
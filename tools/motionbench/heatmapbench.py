@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Benchmark of the heatmap of the rolling week.
+It compares the sum of the daily heatmaps read at each request with the running sum of the week,
+and checks that both give the same counters every day, also when the geometry of detection changes. """
+import sys
+import os
+import os.path
+import time
+import random
+import tempfile
+import argparse
+import asyncio
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import motion.motionheatmap
+
+def create_day(root, day, images, squarex):
+	""" Create the heatmap file of the day with random differences """
+	os.makedirs(root + "/" + day, exist_ok=True)
+	heatmap = motion.motionheatmap.MotionHeatmap(day)
+	for _ in range(images):
+		heatmap.add(800, 600, squarex, squarex, [random.getrandbits(32) for _ in range(15)])
+	heatmap.save(root)
+	return heatmap
+
+async def compare(root, days, images, changed):
+	""" Move day after day, return the number of days different, the files loaded and the durations of both methods """
+	loads = [0]
+	load = motion.motionheatmap.MotionHeatmap.load
+	def counted(root, day):
+		""" Count the heatmap files loaded """
+		loads[0] += 1
+		return load(root, day)
+	motion.motionheatmap.MotionHeatmap.load = counted
+
+	first = time.mktime((2023, 1, 1, 12, 0, 0, 0, 0, 0))
+	names = [time.strftime("%Y/%m/%d", time.localtime(first + i*86400)) for i in range(days)]
+	week = motion.motionheatmap.RollingHeatmap()
+	different = 0
+	legacy_loads = rolling_loads = 0
+	legacy_duration = rolling_duration = 0
+	current = None
+	for i, day in enumerate(names):
+		ended = current
+		# The geometry of detection is changed during one day
+		current = create_day(root, day, images, 20 if i == changed else 40)
+
+		loads[0] = 0
+		begin = time.perf_counter()
+		legacy = await motion.motionheatmap.MotionHeatmap.accumulate(root, day, week.days, current)
+		legacy_duration += time.perf_counter() - begin
+		legacy_loads += loads[0]
+
+		loads[0] = 0
+		begin = time.perf_counter()
+		if ended is not None:
+			await week.next_day(root, ended, day)
+		rolling = await week.get(root, current)
+		rolling_duration += time.perf_counter() - begin
+		rolling_loads += loads[0]
+
+		if legacy.to_dict() != rolling.to_dict():
+			different += 1
+	motion.motionheatmap.MotionHeatmap.load = load
+	return different, legacy_loads, rolling_loads, legacy_duration, rolling_duration
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="Rolling week heatmap benchmark")
+	parser.add_argument("-d", "--days",   type=int, default=60,  help="Number of days")
+	parser.add_argument("-i", "--images", type=int, default=200, help="Number of images per day")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		different, legacy_loads, rolling_loads, legacy, rolling = asyncio.run(compare(directory, args.days, args.images, args.days//2))
+	print("Sum of daily heatmaps : %8.3f s  %5d files read"%(legacy, legacy_loads))
+	print("Running week sum      : %8.3f s  %5d files read (x%.1f faster)"%(rolling, rolling_loads, legacy/rolling if rolling > 0 else 0))
+	print("Days different        : %d/%d"%(different, args.days))
+	if different != 0:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Benchmark of the motion historic cold start on a synthetic sd card.
+It compares the legacy parsing of each json file with the per day binary index, both load all detections of the card,
+and the peak memory used to send historic.json with the list of items or with the items serialized one by one. """
+import sys
+import os
+import os.path
+import time
+import json
+import tempfile
+import argparse
+import asyncio
+import tracemalloc
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import motion.historic
+import motion.motionindex
+import server.jsonstream
+
+def create_card(root, detections, per_day):
+	""" Create a synthetic sd card with detections spread over days """
+	start = time.mktime((2023, 1, 1, 0, 0, 0, 0, 0, 0))
+	step  = 86400 // per_day
+	for i in range(detections):
+		current = start + (i // per_day) * 86400 + (i % per_day) * step
+		year, month, day, hour, minute, second = time.localtime(current)[:6]
+		path = "%04d/%02d/%02d/%02dh%02d"%(year, month, day, hour, (minute//5)*5)
+		name = "%04d-%02d-%02d_%02d-%02d-%02d Id=%d D=%d"%(year, month, day, hour, minute, second, i, 10 + i%50)
+		os.makedirs(root + "/" + path, exist_ok=True)
+		item = [root + "/" + path + "/" + name + ".jpg", 800, 600, [i & 0xFFFFFFFF]*10, 40, 40]
+		with open(root + "/" + path + "/" + name + ".json", "w") as file:
+			file.write(json.dumps(item, separators=(',', ':')))
+		with open(root + "/" + path + "/" + name + ".jpg", "wb") as file:
+			file.write(b"\xFF\xD8\xFF\xD9")
+
+legacy_historic = []
+
+async def legacy_start():
+	""" Historic startup as done before the index : parse each json file """
+	motions, _ = await motion.historic.Historic.scan_directories(motion.historic.MAX_DAYS_DISPLAYED, False)
+	legacy_historic.clear()
+	for filename in motions:
+		with open(filename, "rb") as file:
+			item = json.load(file)
+		if os.path.exists(item[0]):
+			item.append(motion.motionindex.MotionIndex.get_timestamp(item[0]))
+			legacy_historic.append(item)
+	return legacy_historic
+
+async def index_start():
+	""" Historic startup with the index """
+	motion.historic.Historic.first_extract[0] = False
+	await motion.historic.Historic.extract()
+	return list(motion.historic.Historic.store.select())
+
+def measure(coroutine):
+	""" Measure the duration of coroutine, return the duration and the historic sorted """
+	begin = time.perf_counter()
+	items = asyncio.run(coroutine)
+	duration = time.perf_counter() - begin
+	return duration, sorted(items)
+
+class NullStream:
+	""" Stream which counts the bytes written """
+	async def write(self, data):
+		""" Write data """
+		return len(data)
+
+async def send_json(items):
+	""" Serialize the items like the response of historic.json """
+	writer = server.jsonstream.JsonWriter(NullStream())
+	await writer.write(items)
+	return await writer.close()
+
+async def send_list():
+	""" Send historic.json with the list of all items built before """
+	return await send_json(list(motion.historic.Historic.store.select()))
+
+async def send_generator():
+	""" Send historic.json with the items read by pages, as the web page does """
+	return await send_json(motion.historic.HistoricItems())
+
+def measure_memory(coroutine):
+	""" Measure the peak memory allocated by the coroutine, return the peak and the length sent """
+	tracemalloc.start()
+	length = asyncio.run(coroutine)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return peak, length
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="Motion historic cold start benchmark")
+	parser.add_argument("-n", "--detections", type=int, default=10000, help="Number of detections on the synthetic card")
+	parser.add_argument("-d", "--per_day",    type=int, default=400,   help="Number of detections per day")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		root = motion.historic.Historic.get_root()
+		print("Create synthetic card with %d detections"%args.detections)
+		create_card(root, args.detections, args.per_day)
+
+		# The limits of historic are raised, both startups load the same detections
+		motion.historic.MAX_MOTIONS        = args.detections
+		motion.historic.MAX_MOTIONS_LARGE  = args.detections
+		motion.historic.MAX_DAYS_DISPLAYED = (args.detections + args.per_day - 1) // args.per_day
+
+		# Avoid the display of each day scanned
+		stdout = sys.stdout
+		sys.stdout = open(os.devnull, "w")
+		try:
+			legacy,  legacy_items  = measure(legacy_start())
+			rebuild, rebuild_items = measure(index_start())
+			warm,    warm_items    = measure(index_start())
+		finally:
+			sys.stdout.close()
+			sys.stdout = stdout
+		per_item = lambda duration, items: duration * 1000000 / len(items) if len(items) > 0 else 0
+		print("Legacy json parsing           : %8.3f s  %5d items %8.1f us/item"%(legacy,  len(legacy_items),  per_item(legacy,  legacy_items)))
+		print("Index creation (first start)  : %8.3f s  %5d items %8.1f us/item"%(rebuild, len(rebuild_items), per_item(rebuild, rebuild_items)))
+		print("Index reading (next starts)   : %8.3f s  %5d items %8.1f us/item (x%.1f faster)"%(warm, len(warm_items), per_item(warm, warm_items),
+			per_item(legacy, legacy_items)/per_item(warm, warm_items) if per_item(warm, warm_items) > 0 else 0))
+		common = len(set(str(item) for item in legacy_items) & set(str(item) for item in warm_items))
+		print("Items identical with legacy   : %d"%common)
+
+		list_peak,      list_length      = measure_memory(send_list())
+		generator_peak, generator_length = measure_memory(send_generator())
+		print("Historic json with list       : %8.1f KB peak %8d bytes"%(list_peak/1024, list_length))
+		print("Historic json by pages        : %8.1f KB peak %8d bytes"%(generator_peak/1024, generator_length))
+
+if __name__ == "__main__":
+	main()
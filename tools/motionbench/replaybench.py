@@ -0,0 +1,308 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Replay of recorded images through the motion detection, to measure its accuracy and its throughput.
+The images of a directory (jpeg files sorted by name) or of a clip (.mjpg) are given to the simulated camera,
+then captured and compared by the real motion detection (MotionCore.capture and MotionCore.detect).
+The images detected are compared with a ground truth json file : {"unit":"frame" or "time", "motions":[[start,end],...]}
+where each motion is an inclusive range of image indexes or of timestamps.
+Without images, a synthetic sequence with moving objects and isolated glitches is generated (requires pillow).
+The results can be saved as baseline, and compared with the baseline at next run to detect regressions. """
+import sys
+import os
+import os.path
+import re
+import io
+import json
+import time
+import struct
+import random
+import tempfile
+import argparse
+import asyncio
+import tracemalloc
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import camera
+import motionengine
+import video.video
+import motion.motioncore
+import motion.motionindex
+import motion.motionclip
+import motion.historicwriter
+
+ACCURACY_METRICS = ["precision", "recall"]
+
+def load_directory(directory):
+	""" Load the jpeg images of directory sorted by name, return the list of [timestamp, jpeg] """
+	result = []
+	for index, name in enumerate(sorted(name for name in os.listdir(directory) if name.lower().endswith(".jpg"))):
+		filename = directory + "/" + name
+		if re.match(r"\d\d\d\d-\d\d-\d\d_\d\d-\d\d-\d\d", name):
+			timestamp = motion.motionindex.MotionIndex.get_timestamp(name)
+		else:
+			timestamp = int(os.path.getmtime(filename))
+		with open(filename, "rb") as file:
+			result.append([timestamp, file.read()])
+	return result
+
+def load_clip(filename):
+	""" Load the images of clip, return the list of [timestamp, jpeg] """
+	result = []
+	records = []
+	motion.motionclip.MotionClip.read_index(filename, lambda buffer: records.append(bytes(buffer)))
+	with open(filename, "rb") as file:
+		for record in records:
+			timestamp = struct.unpack_from("<I", record, 0)[0]
+			_, offset, size = struct.unpack_from("<III", record, motion.motionindex.INDEX_CLIP)
+			file.seek(offset)
+			result.append([timestamp, file.read(size)])
+	return result
+
+def create_synthetic(frames, seed):
+	""" Generate a sequence with a static noisy scene, moving objects and single image glitches.
+	Return the list of [timestamp, jpeg] and the ground truth """
+	from PIL import Image, ImageDraw
+	generator = random.Random(seed)
+	background = Image.effect_noise((800, 600), 12).convert("RGB")
+	start = int(time.mktime((2023, 1, 1, 12, 0, 0, 0, 0, 0)))
+	motions = []
+	glitches = set()
+	position = 30
+	while position < frames - 20:
+		length = generator.randint(8, 25)
+		motions.append([position, min(position + length, frames - 1)])
+		position += length + generator.randint(20, 60)
+		glitch = position - generator.randint(5, 15)
+		if glitch > motions[-1][1] + 3:
+			glitches.add(glitch)
+	footage = []
+	for index in range(frames):
+		# Sensor noise, the histograms of two real images are never identical
+		image = Image.blend(background, Image.effect_noise((800, 600), 40).convert("RGB"), 0.1)
+		draw = ImageDraw.Draw(image)
+		for first, last in motions:
+			if first <= index <= last:
+				x = 50 + (index - first) * 25
+				draw.rectangle([x, 250, x + 120, 450], fill=(30, 30, 40))
+		if index in glitches:
+			draw.rectangle([0, 0, 800, 600], fill=(255, 255, 255))
+		output = io.BytesIO()
+		image.save(output, "JPEG", quality=80)
+		footage.append([start + index, output.getvalue()])
+	return footage, {"unit":"frame", "motions":motions}
+
+def get_truth(footage, truth):
+	""" Return the list of booleans indicating the images with motion """
+	result = [False]*len(footage)
+	for first, last in truth.get("motions", []):
+		for index in range(len(footage)):
+			if truth.get("unit", "frame") == "time":
+				value = footage[index][0]
+			else:
+				value = index
+			if first <= value <= last:
+				result[index] = True
+	return result
+
+def get_events(flags):
+	""" Return the list of ranges of consecutive images flagged """
+	result = []
+	for index, flag in enumerate(flags):
+		if flag:
+			if len(result) > 0 and result[-1][1] == index - 1:
+				result[-1][1] = index
+			else:
+				result.append([index, index])
+	return result
+
+def get_latency(durations):
+	""" Return the mean, 95 percentile and maximal durations in milliseconds """
+	if len(durations) == 0:
+		return [0., 0., 0.]
+	durations = sorted(durations)
+	return [1000*sum(durations)/len(durations), 1000*durations[min(len(durations)-1, (len(durations)*95)//100)], 1000*durations[-1]]
+
+async def replay(footage, config, save):
+	""" Replay the images through the motion detection, return the list of images detected and the durations of each stage """
+	stages = {"decode":[], "capture":[], "detect":[], "total":[]}
+	camera_motion = camera.motion
+	def timed_motion():
+		""" Camera motion with the duration of jpeg decoding and squares computing """
+		begin = time.perf_counter()
+		result = camera_motion()
+		stages["decode"].append(time.perf_counter() - begin)
+		return result
+	camera.motion = timed_motion
+	camera.play([jpeg for _, jpeg in footage])
+	camera.init()
+	video.video.Camera.opened = True
+	writer = motion.historicwriter.HistoricWriter
+	indexes  = []
+	detected_indexes = set()
+	try:
+		core = motion.motioncore.MotionCore(config)
+		for _ in range(len(footage)):
+			begin = time.perf_counter()
+			detection = await core.capture()
+			captured = time.perf_counter()
+			core.detect(False)
+			detected = time.perf_counter()
+			# The image slots are reused, the motion flags are read while the images are still captured
+			indexes.append(core.images[0].index)
+			for image in core.images:
+				if image.get_motion_detected():
+					detected_indexes.add(image.index)
+
+			stages["capture"].append(captured - begin - stages["decode"][-1])
+			stages["detect"] .append(detected - captured)
+			stages["total"]  .append(detected - begin)
+
+			# Release the image notified as the detection does
+			if detection is not None:
+				core.deinit_image(detection[1])
+
+			if save:
+				while len(writer.pending) > 0:
+					await writer.task()
+			else:
+				writer.pending.clear()
+		core.cleanup()
+	finally:
+		camera.motion = camera_motion
+		camera.deinit()
+		video.video.Camera.opened = False
+	return [index in detected_indexes for index in indexes], stages
+
+def measure(footage, truth, config, save):
+	""" Replay the images and compute the accuracy and throughput results """
+	with tempfile.TemporaryDirectory() as directory:
+		current = os.getcwd()
+		os.chdir(directory)
+		os.mkdir("sd")
+		try:
+			tracemalloc.start()
+			begin = time.perf_counter()
+			detected, stages = asyncio.run(replay(footage, config, save))
+			duration = time.perf_counter() - begin
+			_, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+		finally:
+			os.chdir(current)
+
+	expected = get_truth(footage, truth)
+	true_positive  = sum(1 for i in range(len(detected)) if detected[i] and expected[i])
+	false_positive = sum(1 for i in range(len(detected)) if detected[i] and not expected[i])
+	false_negative = sum(1 for i in range(len(detected)) if not detected[i] and expected[i])
+	true_negative  = len(detected) - true_positive - false_positive - false_negative
+
+	# Events detected without any real motion (glitches not filtered)
+	false_glitches = 0
+	for first, last in get_events(detected):
+		if not any(expected[first:last+1]):
+			false_glitches += 1
+	motions = get_events(expected)
+	found = sum(1 for first, last in motions if any(detected[first:last+1]))
+
+	return {
+		"frames"          : len(footage),
+		"precision"       : true_positive / (true_positive + false_positive) if true_positive + false_positive > 0 else 1.,
+		"recall"          : true_positive / (true_positive + false_negative) if true_positive + false_negative > 0 else 1.,
+		"false_rate"      : false_positive / (false_positive + true_negative) if false_positive + true_negative > 0 else 0.,
+		"false_glitches"  : false_glitches,
+		"glitch_rate"     : 1000 * false_glitches / len(footage) if len(footage) > 0 else 0.,
+		"motions"         : len(motions),
+		"motions_found"   : found,
+		"fps"             : len(footage) / duration if duration > 0 else 0.,
+		"peak_memory"     : peak,
+		"latency"         : {stage : get_latency(durations) for stage, durations in stages.items()}
+	}
+
+def display(results):
+	""" Display the results """
+	print("Frames               : %d"%results["frames"])
+	print("Precision            : %.3f"%results["precision"])
+	print("Recall               : %.3f"%results["recall"])
+	print("False detection rate : %.3f"%results["false_rate"])
+	print("False glitches       : %d (%.2f per 1000 frames)"%(results["false_glitches"], results["glitch_rate"]))
+	print("Motions found        : %d/%d"%(results["motions_found"], results["motions"]))
+	print("Throughput           : %.1f frames/s"%results["fps"])
+	print("Peak memory          : %.1f KB"%(results["peak_memory"]/1024))
+	print("Latency ms             mean      p95      max")
+	for stage, (mean, p95, maximum) in results["latency"].items():
+		print("  %-18s %8.2f %8.2f %8.2f"%(stage, mean, p95, maximum))
+
+def compare_baseline(results, baseline, tolerance):
+	""" Compare the results with the baseline, return False if the accuracy regresses """
+	result = True
+	print("Comparison with baseline")
+	for metric in ACCURACY_METRICS + ["false_rate", "glitch_rate", "fps", "peak_memory"]:
+		print("  %-12s %12.3f -> %12.3f"%(metric, baseline.get(metric, 0), results[metric]))
+	for metric in ACCURACY_METRICS:
+		if results[metric] < baseline.get(metric, 0) - tolerance:
+			print("Regression of %s"%metric)
+			result = False
+	if results["false_rate"] > baseline.get("false_rate", 0) + tolerance:
+		print("Regression of false_rate")
+		result = False
+	return result
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="Motion detection replay benchmark")
+	parser.add_argument("footage", nargs="?", default=None, help="Directory of jpeg images or clip file (synthetic sequence if not set)")
+	parser.add_argument("-t", "--truth",       default=None,               help="Ground truth json file (groundtruth.json of directory by default)")
+	parser.add_argument("-n", "--frames",      type=int, default=300,      help="Number of images of synthetic sequence")
+	parser.add_argument("-r", "--seed",        type=int, default=1,        help="Random seed of synthetic sequence")
+	parser.add_argument("-s", "--sensitivity", type=int, default=None,     help="Motion sensitivity in percent")
+	parser.add_argument("-d", "--differences", type=int, default=None,     help="Minimum differences to detect a motion")
+	parser.add_argument("-w", "--save",        action="store_true",        help="Save the images detected on a temporary sd card")
+	parser.add_argument("-b", "--baseline",    default=None,               help="Compare with the baseline json file, exit with error if accuracy regresses")
+	parser.add_argument("-o", "--output",      default=None,               help="Save the results as json file (new baseline)")
+	parser.add_argument("--tolerance",         type=float, default=0.02,  help="Accuracy tolerance for the comparison with baseline")
+	args = parser.parse_args()
+
+	if motionengine.available is False:
+		print("The replay requires numpy and pillow")
+		sys.exit(2)
+
+	if args.footage is None:
+		footage, truth = create_synthetic(args.frames, args.seed)
+	else:
+		if os.path.isdir(args.footage):
+			footage = load_directory(args.footage)
+			truth_filename = args.footage + "/groundtruth.json"
+		else:
+			footage = load_clip(args.footage)
+			truth_filename = os.path.splitext(args.footage)[0] + ".json"
+		if args.truth is not None:
+			truth_filename = args.truth
+		truth = {"motions":[]}
+		if os.path.exists(truth_filename):
+			with open(truth_filename) as file:
+				truth = json.load(file)
+
+	config = motion.motioncore.MotionConfig()
+	config.activated = True
+	if args.sensitivity is not None:
+		config.sensitivity = args.sensitivity
+	if args.differences is not None:
+		config.differences_detection = args.differences
+
+	results = measure(footage, truth, config, args.save)
+	display(results)
+
+	if args.output:
+		with open(args.output, "w") as file:
+			json.dump(results, file, indent=1)
+
+	if args.baseline:
+		with open(args.baseline) as file:
+			if compare_baseline(results, json.load(file), args.tolerance) is False:
+				sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Benchmark of the writing of MJPEG stream on a local tcp connection.
+It compares the loop used before the frame writer (header formatted at each image, then two writes)
+with the frame writer (header patched in place, single drain).
+On the device each write of the legacy loop is drained (awrite), the desktop stream does not drain the writes,
+the legacy loop is measured in both ways : without drain, the data accumulates in the transport without limit.
+The viewer reads the stream as fast as possible, the fps and bytes per second are measured at the viewer side.
+At the server side are measured the python memory allocated for each image, on the tcp connection
+and on a stream which discards the data, and the maximal data waiting in the tcp transport.
+It checks also that the quality of motion detection is not changed by a viewer of the images of motion detection. """
+import sys
+import os
+import os.path
+import time
+import argparse
+import asyncio
+import tracemalloc
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import server.stream
+import tools.tasking
+import video.video
+import video.quality
+import video.framebroker
+import webpage.streamingpage
+
+IDENTIFIER = b"4f3a9b2c1d"
+
+class Measure:
+	""" Measure of the memory at the server side """
+	def __init__(self, streamio):
+		""" Constructor """
+		self.streamio = streamio
+		self.peaks    = []
+		self.buffered = 0
+		self.before   = 0
+
+	def start(self):
+		""" Start of image """
+		tracemalloc.reset_peak()
+		self.before = tracemalloc.get_traced_memory()[0]
+
+	def stop(self):
+		""" End of image """
+		self.peaks.append(tracemalloc.get_traced_memory()[1] - self.before)
+		transport = getattr(self.streamio.writer, "transport", None)
+		if transport is not None:
+			self.buffered = max(self.buffered, transport.get_write_buffer_size())
+
+async def legacy_writer(streamio, images, count, drain=False):
+	""" Write the images as the streaming did before the frame writer, drain indicates if each write is drained as on the device """
+	measure = Measure(streamio)
+	identifier = b"\r\n%x\r\n\r\n--%s\r\n\r\n"%(len(IDENTIFIER) + 6, IDENTIFIER)
+	frame = b'%s36\r\nContent-Type: image/jpeg\r\nContent-Length: %8d\r\n\r\n\r\n%x\r\n'
+	for i in range(count):
+		image = images[i % len(images)]
+		length = len(image)
+		measure.start()
+		await streamio.write(frame%(identifier if i > 0 else b"", length, length))
+		if drain:
+			await streamio.writer.drain()
+		await streamio.write(image)
+		if drain:
+			await streamio.writer.drain()
+		measure.stop()
+	await streamio.write(identifier)
+	return measure
+
+async def legacy_drained_writer(streamio, images, count):
+	""" Write the images as the streaming did before the frame writer on the device """
+	return await legacy_writer(streamio, images, count, True)
+
+async def frame_writer(streamio, images, count):
+	""" Write the images with the frame writer """
+	measure = Measure(streamio)
+	writer = webpage.streamingpage.FrameWriter(streamio, IDENTIFIER)
+	for i in range(count):
+		image = images[i % len(images)]
+		measure.start()
+		await writer.write(image)
+		measure.stop()
+	await writer.close()
+	return measure
+
+class NullWriter:
+	""" Writer which discards the data """
+	def write(self, data):
+		""" Discard data """
+
+	async def drain(self):
+		""" Nothing to drain """
+
+	def is_closing(self):
+		""" Never closed """
+		return False
+
+async def run_null(writer_function, images, count):
+	""" Write the images on a stream which discards the data """
+	return await writer_function(server.stream.Stream(None, NullWriter()), images, count)
+
+async def run(writer_function, images, count):
+	""" Stream the images on a local connection, return the duration at viewer side, the bytes received and the measure at server side """
+	results = {}
+	done = asyncio.Event()
+
+	async def on_connection(reader, writer):
+		""" Server side """
+		results["measure"] = await writer_function(server.stream.Stream(reader, writer), images, count)
+		await writer.drain()
+		writer.close()
+		done.set()
+
+	listener = await asyncio.start_server(on_connection, "127.0.0.1", 0)
+	port = listener.sockets[0].getsockname()[1]
+	reader, writer = await asyncio.open_connection("127.0.0.1", port)
+	received = 0
+	start = time.perf_counter()
+	while True:
+		data = await reader.read(65536)
+		if not data:
+			break
+		received += len(data)
+	duration = time.perf_counter() - start
+	await done.wait()
+	writer.close()
+	listener.close()
+	await listener.wait_closed()
+	return duration, received, results["measure"]
+
+async def shared_quality(count):
+	""" Stream the images of the motion detection to a viewer,
+	return the quality of motion detection alone, the qualities during the streaming and the images sent """
+	tools.tasking.Tasks.loop = asyncio.get_running_loop()
+	streaming = webpage.streamingpage
+	broker = video.framebroker.FrameBroker
+	motion_quality = video.quality.Quality.get("motion", 15)
+	motion_quality.configure(best=15, worst=15)
+	video.video.Camera.open()
+
+	def capture():
+		""" Capture of the motion detection """
+		video.quality.Quality.apply(motion_quality)
+		motion_ = broker.motion()
+		motion_quality.update(len(motion_.get_image()))
+
+	capture()
+	alone = video.quality.Quality.get_quality()
+	streaming.Streaming.streaming_id[0] = streaming.Streaming.get_streaming_id() + 1
+	viewer = streaming.Viewer(server.stream.Stream(None, NullWriter()), IDENTIFIER, streaming.Streaming.get_streaming_id())
+	streaming.Broadcaster.subscribe(viewer)
+	sender = asyncio.create_task(viewer.run())
+	qualities = set()
+	for _ in range(count):
+		capture()
+		qualities.add(video.quality.Quality.get_quality())
+		await asyncio.sleep(0.002)
+	viewer.close()
+	await sender
+	streaming.Broadcaster.unsubscribe(viewer)
+	return alone, qualities, viewer.writer.frames
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="MJPEG stream writer benchmark")
+	parser.add_argument("-n", "--frames", type=int, default=2000, help="Number of images sent")
+	parser.add_argument("-r", "--repeat", type=int, default=5,    help="Number of runs, the best is kept")
+	args = parser.parse_args()
+
+	directory = os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules")
+	images = [open(directory + "/" + name, "rb").read() for name in ("Test1.jpg", "Test2.jpg")]
+
+	tracemalloc.start()
+	print("Images sent : %d of %d bytes average"%(args.frames, sum(len(image) for image in images)//len(images)))
+	print("%-22s %8s %8s %16s %16s %14s"%("Writer", "fps", "MB/s", "alloc/image tcp", "alloc/image null", "max buffered"))
+	for name, function in (("legacy without drain", legacy_writer), ("legacy drained", legacy_drained_writer), ("frame writer", frame_writer)):
+		best = None
+		for _ in range(args.repeat):
+			result = asyncio.run(run(function, images, args.frames))
+			if best is None or result[0] < best[0]:
+				best = result
+		duration, received, measure = best
+		null = asyncio.run(run_null(function, images, args.frames))
+		print("%-22s %8.0f %8.1f %10.0f bytes %10.0f bytes %8d KB"%(name, args.frames/duration, received/duration/1048576,
+			sum(measure.peaks)/len(measure.peaks), sum(null.peaks)/len(null.peaks), measure.buffered//1024))
+	tracemalloc.stop()
+
+	alone, qualities, sent = asyncio.run(shared_quality(200))
+	print("Quality of motion detection alone %d, with a viewer %s (%d images sent)"%(alone, sorted(qualities), sent))
+	if qualities != {alone}:
+		print("The viewer changes the quality of motion detection")
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Benchmark of the historic directories scan on a synthetic sd card.
+It compares the listing of each directory with regex matching and sorting, as done before the cache,
+with the cached directory tree, at first scan (cold) and at next scans (warm). """
+import sys
+import os
+import os.path
+import re
+import time
+import tempfile
+import argparse
+import asyncio
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+import tools.filesystem
+import motion.historic
+import motion.historictree
+
+listings = [0]
+
+def count_listing(function):
+	""" Count the calls of directory listing """
+	def list_directory(path):
+		""" Directory listing counted """
+		listings[0] += 1
+		return function(path)
+	return list_directory
+
+def create_card(root, days, hours, per_hour):
+	""" Create a synthetic sd card with hour directories spread over days """
+	start = time.mktime((2023, 1, 1, 0, 0, 0, 0, 0, 0))
+	for day in range(days):
+		for hour in range(hours):
+			for minute in range(per_hour):
+				year, month, day_, hour_, minute_ = time.localtime(start + day*86400 + hour*3600 + minute*600)[:5]
+				os.makedirs(root + "/%04d/%02d/%02d/%02dh%02d"%(year, month, day_, hour_, minute_), exist_ok=True)
+
+def legacy_scan(root, older):
+	""" Scan of hour directories as done before the cache """
+	def scan_dir(path, pattern):
+		""" List, match and sort the sub directories """
+		result = []
+		for fileinfo in tools.filesystem.list_directory(path):
+			if fileinfo[1] & 0xF000 == 0x4000 and re.match(pattern, fileinfo[0]):
+				result.append(fileinfo[0])
+		result.sort()
+		if older is False:
+			result.reverse()
+		return result
+	result = []
+	for year in scan_dir(root, r"\d\d\d\d"):
+		for month in scan_dir(root + "/" + year, r"\d\d"):
+			for day in scan_dir(root + "/" + year + "/" + month, r"\d\d"):
+				for hour in scan_dir(root + "/" + year + "/" + month + "/" + day, r"\d\dh\d\d"):
+					result.append(year + "/" + month + "/" + day + "/" + hour)
+	return result
+
+def tree_scan(root, older):
+	""" Scan of hour directories with the cache """
+	return list(motion.historictree.HistoricTree.walk(root, 4, older is False))
+
+def measure(function, *args):
+	""" Measure the duration and the number of listings of function """
+	listings[0] = 0
+	begin = time.perf_counter()
+	result = function(*args)
+	return time.perf_counter() - begin, listings[0], result
+
+def main():
+	""" Main benchmark """
+	parser = argparse.ArgumentParser(description="Motion historic directories scan benchmark")
+	parser.add_argument("-d", "--days",     type=int, default=30, help="Number of days on the synthetic card")
+	parser.add_argument("-u", "--hours",    type=int, default=24, help="Number of hours per day")
+	parser.add_argument("-m", "--per_hour", type=int, default=1,  help="Number of directories per hour (1 to 6)")
+	parser.add_argument("-r", "--repeat",   type=int, default=20, help="Number of scans measured")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		os.chdir(directory)
+		root = motion.historic.Historic.get_root()
+		create_card(root, args.days, args.hours, args.per_hour)
+		tools.filesystem.list_directory = count_listing(tools.filesystem.list_directory)
+
+		legacy, legacy_listings, legacy_result = measure(lambda: [legacy_scan(root, False) for _ in range(args.repeat)][-1])
+		motion.historictree.HistoricTree.clear()
+		cold, cold_listings, cold_result = measure(tree_scan, root, False)
+		warm, warm_listings, warm_result = measure(lambda: [tree_scan(root, False) for _ in range(args.repeat)][-1])
+
+		# Incremental update : a new directory is created and the oldest day is removed
+		os.makedirs(root + "/2030/01/01/00h00")
+		motion.historictree.HistoricTree.add(root, "2030/01/01/00h00")
+		oldest = cold_result[-1][:10]
+		motion.historictree.HistoricTree.remove(root, oldest)
+		updated, updated_listings, updated_result = measure(tree_scan, root, False)
+
+		print("Directories                   : %d"%len(legacy_result))
+		print("Legacy scan                   : %8.3f ms %6d listings per scan"%(1000*legacy/args.repeat, legacy_listings//args.repeat))
+		print("Cached scan (cold)            : %8.3f ms %6d listings"%(1000*cold, cold_listings))
+		print("Cached scan (warm)            : %8.3f ms %6d listings per scan (x%.0f faster)"%(1000*warm/args.repeat, warm_listings//args.repeat,
+			legacy/warm if warm > 0 else 0))
+		print("Cached scan after add/remove  : %8.3f ms %6d listings"%(1000*updated, updated_listings))
+		print("Results identical             : %s"%(legacy_result == cold_result == warm_result))
+		print("Incremental update consistent : %s"%(updated_result[0] == "2030/01/01/00h00" and oldest not in [path[:10] for path in updated_result]))
+
+if __name__ == "__main__":
+	main()
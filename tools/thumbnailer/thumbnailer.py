@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+# Distributed under Pycameresp License
+# Copyright (c) 2023 Remi BERTHOLET
+# pylint:disable=consider-using-f-string
+# pylint:disable=wrong-import-position
+# pylint:disable=import-error
+""" Creates the thumbnails of the motion images of an existing sd card, for the historic gallery.
+The sd card is mounted on the computer, each jpeg file and each image of the clips without thumbnail gets a small jpeg
+with the extension .thm next to it, the thumbnails of the images of a clip are in the directory of the clip. The camera cannot decode and reduce its jpeg images, it does not create thumbnails,
+the historic gallery loads the full image when the thumbnail is missing. Requires pillow. """
+import sys
+import os
+import os.path
+import io
+import re
+import struct
+import argparse
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/lib"))
+sys.path.append(os.path.abspath(os.path.dirname(os.path.realpath(__file__)) + "/../../modules/simul"))
+from PIL import Image
+import motion.historic
+import motion.motionindex
+import motion.motionclip
+
+def create_thumbnail(jpeg, filename, scale, quality):
+	""" Create the thumbnail file of the jpeg image """
+	image = Image.open(io.BytesIO(jpeg))
+	width, height = image.size
+	# The draft mode decodes the jpeg directly at reduced scale, it is much faster
+	image.draft("RGB", (width//scale, height//scale))
+	image = image.convert("RGB")
+	if image.size != (width//scale, height//scale):
+		image = image.resize((width//scale, height//scale), Image.BILINEAR)
+	image.save(filename, "JPEG", quality=quality)
+
+def get_clip_images(filename):
+	""" Return the list of [name, offset, size] of images in the clip """
+	result = []
+	def add(buffer):
+		""" Add the image of motion index record """
+		_, year, month, day, hour, minute, second, _, _, index, _, count = struct.unpack_from(motion.motionindex.INDEX_FIELDS, buffer, 0)[:12]
+		_, offset, size = struct.unpack_from("<III", buffer, motion.motionindex.INDEX_CLIP)
+		name = "%04d-%02d-%02d_%02d-%02d-%02d Id=%d D=%d"%(year + 2000, month, day, hour, minute, second, index, count)
+		result.append([name, offset, size])
+	motion.motionclip.MotionClip.read_index(filename, add)
+	return result
+
+def thumbnail_card(root, scale, quality, force, printer=print):
+	""" Create the missing thumbnails of the sd card, return the number of thumbnails created """
+	created = 0
+	for directory, _, filenames in os.walk(root):
+		if not re.search(r"\d\d\d\d/\d\d/\d\d/\d\dh\d\d$", directory.replace("\\", "/")):
+			continue
+		for filename in sorted(filenames):
+			path = os.path.join(directory, filename)
+			try:
+				if re.match(r"\d\d.*\.jpg$", filename):
+					thumbnail = os.path.splitext(path)[0] + motion.historic.THUMBNAIL_EXTENSION
+					if force or not os.path.exists(thumbnail):
+						with open(path, "rb") as file:
+							create_thumbnail(file.read(), thumbnail, scale, quality)
+						created += 1
+				elif re.match(r"\d\d.*\.mjpg$", filename):
+					with open(path, "rb") as file:
+						for name, offset, size in get_clip_images(path):
+							thumbnail = os.path.join(directory, name + motion.historic.THUMBNAIL_EXTENSION)
+							if force or not os.path.exists(thumbnail):
+								file.seek(offset)
+								create_thumbnail(file.read(size), thumbnail, scale, quality)
+								created += 1
+			except Exception as err:
+				printer("Cannot create thumbnail of %s : %s"%(path, str(err)))
+		printer("%s : %d thumbnails"%(directory, created))
+	return created
+
+def main():
+	""" Main thumbnailer """
+	parser = argparse.ArgumentParser(description="Creates the thumbnails of the motion images of a sd card")
+	parser.add_argument("root", help="Root directory of the sd card")
+	parser.add_argument("-s", "--scale",   type=int, default=4,  help="Reduction of the image size (1, 2, 4 or 8)")
+	parser.add_argument("-q", "--quality", type=int, default=60, help="Jpeg quality of thumbnails")
+	parser.add_argument("-f", "--force",   action="store_true",  help="Replace the existing thumbnails")
+	args = parser.parse_args()
+	print("%d thumbnails created"%thumbnail_card(args.root, args.scale, args.quality, args.force))
+
+if __name__ == "__main__":
+	main()